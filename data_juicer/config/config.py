@@ -190,6 +190,24 @@ def init_configs(args: Optional[List[str]] = None, which_entry: object = None, l
                 "When this happens, False is a better choice, although it takes "
                 "more time.",
             )
+            parser.add_argument(
+                "--export_compression",
+                type=Optional[str],
+                default=None,
+                help="Compression codec of the exported dataset files, one of "  # noqa: E251
+                "[gzip, zstd]. For jsonl and json files, the extension of the "
+                "codec is appended to the file names. In default, it's None, "
+                "which means no compression for jsonl and json files and snappy "
+                "for parquet files.",
+            )
+            parser.add_argument(
+                "--export_row_group_size",
+                type=Optional[PositiveInt],
+                default=None,
+                help="The number of rows in each row group of exported parquet "  # noqa: E251
+                "files. In default, it's determined by the features of the "
+                "dataset.",
+            )
             parser.add_argument(
                 "--keep_stats_in_res_ds",
                 type=bool,
@@ -288,6 +306,68 @@ def init_configs(args: Optional[List[str]] = None, which_entry: object = None, l
                 default=True,
                 help="Skip errors in OPs caused by unexpected invalid samples.",  # noqa: E251
             )
+            parser.add_argument(
+                "--op_result_cache_dir",
+                type=Optional[str],
+                default=None,
+                help="Directory of the persistent cache of per-sample results of "  # noqa: E251
+                "model-based OPs, e.g. stats of model-based Filters and outputs "
+                "of model-based Mappers. Results are keyed by the OP name, OP "
+                "arguments and the input fields of samples, so they are reused "
+                "across runs for unchanged samples. In default, it's None, which "
+                "means no cache.",
+            )
+            parser.add_argument(
+                "--op_result_cache_size",
+                type=str,
+                default="10GB",
+                help="The max size of the persistent OP result cache. The least "  # noqa: E251
+                "recently used results are evicted beyond it.",
+            )
+            parser.add_argument(
+                "--api_response_cache_dir",
+                type=Optional[str],
+                default=None,
+                help="Directory of the persistent cache of responses of API "  # noqa: E251
+                "models and vLLM chats used by LLM-based OPs. Responses are "
+                "keyed by the model, endpoint, sampling params and rendered "
+                "messages, so identical requests are not sent again across "
+                "runs. In default, it's None, which means no cache.",
+            )
+            parser.add_argument(
+                "--api_response_cache_size",
+                type=str,
+                default="10GB",
+                help="The max size of the persistent API response cache. The "  # noqa: E251
+                "least recently used responses are evicted beyond it.",
+            )
+            parser.add_argument(
+                "--model_residency",
+                type=bool,
+                default=False,
+                help="Whether to keep loaded models resident across OPs that "  # noqa: E251
+                "share them, instead of freeing all models after each OP. Models "
+                "are freed once no upcoming OPs use them, and the models of the "
+                "next OP are preloaded while an OP runs in the main process.",
+            )
+            parser.add_argument(
+                "--model_mem_budget",
+                type=Optional[str],
+                default=None,
+                help="The memory budget of resident models, e.g. '16GB'. The "  # noqa: E251
+                "least recently used models are evicted beyond it. In default, "
+                "it's None, which means no limit. Only available when "
+                "model_residency is True.",
+            )
+            parser.add_argument(
+                "--share_models",
+                type=bool,
+                default=False,
+                help="Whether to load the cpu models of OPs running in forked "  # noqa: E251
+                "workers in the main process in advance, so the workers share "
+                "the read-only weights copy-on-write instead of loading their "
+                "own copies. Only available when model_residency is True.",
+            )
             parser.add_argument(
                 "--use_cache",
                 type=bool,
@@ -322,6 +402,52 @@ def init_configs(args: Optional[List[str]] = None, which_entry: object = None, l
                 help="Whether to open the monitor to trace resource utilization for "  # noqa: E251
                 "each OP during data processing. It's True in default.",
             )
+            parser.add_argument(
+                "--open_profiler",
+                type=bool,
+                default=False,
+                help="Whether to open the profiler to record the time of each OP "  # noqa: E251
+                "and worker split into the phases of loading batches, the OP "
+                "function, writing results, computing the filter indices and "
+                "loading models, together with the rows/s and bytes/s of each "
+                "OP. The results are exported to `profile.json` and a Chrome "
+                "trace `trace.json` in the `profile` directory of work dir. "
+                "It's False in default.",
+            )
+            parser.add_argument(
+                "--metrics_port",
+                type=Optional[PositiveInt],
+                default=None,
+                help="The local port to serve the live metrics of the job, e.g. "  # noqa: E251
+                "the current OP, samples in/out and throughput of each OP, cache "
+                "sizes, model loads and error logs, in the Prometheus text format "
+                "on `/metrics`. It's None in default, which means not served.",
+            )
+            parser.add_argument(
+                "--metrics_host",
+                type=str,
+                default="127.0.0.1",
+                help="The host to serve the live metrics on. It's the loopback "  # noqa: E251
+                "address 127.0.0.1 in default, so the metrics are only served "
+                "to the local machine. Set it to 0.0.0.0 to serve them on all "
+                "interfaces.",
+            )
+            parser.add_argument(
+                "--metrics_path",
+                type=Optional[str],
+                default=None,
+                help="The file to rewrite the live metrics of the job to "  # noqa: E251
+                "periodically in the Prometheus text format, e.g. for the "
+                "textfile collector of node exporter. It's None in default, "
+                "which means not written.",
+            )
+            parser.add_argument(
+                "--metrics_interval",
+                type=PositiveInt,
+                default=15,
+                help="The interval in seconds to rewrite the metrics file and "  # noqa: E251
+                "measure the sizes of cache directories. It's 15 in default.",
+            )
             parser.add_argument(
                 "--use_checkpoint",
                 type=bool,
@@ -333,6 +459,18 @@ def init_configs(args: Optional[List[str]] = None, which_entry: object = None, l
                 "checkpoint are changed, all ops will be rerun from the "
                 "beginning.",
             )
+            parser.add_argument(
+                "--ckpt_shard_size",
+                type=NonNegativeInt,
+                default=0,
+                help="Number of input samples of each committed shard inside an "  # noqa: E251
+                "OP when using checkpoint. The output of each OP is written as "
+                "shard files in the checkpoint dir with a manifest of the input "
+                "ranges that are done, so a rerun resumes an interrupted OP from "
+                "its last committed shard, and the checkpoint only references "
+                "the shard files instead of copying the dataset. It's 0 in "
+                "default, which means the dataset is only saved after OPs.",
+            )
             parser.add_argument(
                 "--temp_dir",
                 type=str,
@@ -403,6 +541,17 @@ def init_configs(args: Optional[List[str]] = None, which_entry: object = None, l
                 "OPs and fused OPs according to their probed speed (fast to "
                 'slow). It\'s "probe" in default.',
             )
+            parser.add_argument(
+                "--stage_fusion",
+                type=bool,
+                default=False,
+                help="Whether to fuse each run of consecutive row-local Mappers and "  # noqa: E251
+                "Filters into one stage automatically. The OPs in a stage are "
+                "applied batch by batch in the same worker and the rejected "
+                "samples are dropped right away, so each stage reads and writes "
+                "the dataset only once. It's disabled when tracer or insight "
+                "mining is open. It's False in default.",
+            )
             parser.add_argument(
                 "--adaptive_batch_size",
                 type=bool,
@@ -410,6 +559,36 @@ def init_configs(args: Optional[List[str]] = None, which_entry: object = None, l
                 help="Whether to use adaptive batch sizes for each OP according to "  # noqa: E251
                 "the probed results. It's False in default.",
             )
+            parser.add_argument(
+                "--auto_tune",
+                type=bool,
+                default=False,
+                help="Whether to tune the number of processes, batch size and "  # noqa: E251
+                "placement (CPU or GPU) of each OP from its measured per-sample "
+                "CPU time, peak memory and GPU memory on a small batch, and keep "
+                "adjusting them according to the resource utilization while the "
+                "OP runs. It's False in default.",
+            )
+            parser.add_argument(
+                "--streaming",
+                type=bool,
+                default=False,
+                help="Whether to process the dataset in streaming (out-of-core) mode "  # noqa: E251
+                "for the default executor. If it's True, the dataset is read as a "
+                "stream, runs of consecutive Mappers and Filters are fused into a "
+                "single streaming pass, and the results are written to the export "
+                "path directly, so the memory and disk usage are bounded. Global "
+                "OPs such as Deduplicators and Selectors are pipeline barriers that "
+                "materialize the stream before them. Tracer, checkpoint and monitor "
+                "are not supported in this mode. It's False in default.",
+            )
+            parser.add_argument(
+                "--stream_batch_size",
+                type=PositiveInt,
+                default=1000,
+                help="The number of samples in each batch of the stream in streaming "  # noqa: E251
+                "mode. It's 1000 in default.",
+            )
             parser.add_argument(
                 "--process",
                 type=List[Dict],
@@ -667,6 +846,8 @@ def init_setup_from_cfg(cfg: Namespace, load_configs_only=False):
         "turbo": cfg.turbo,
         "skip_op_error": cfg.skip_op_error,
         "work_dir": cfg.work_dir,
+        "op_result_cache_dir": cfg.op_result_cache_dir,
+        "op_result_cache_size": cfg.op_result_cache_size,
     }
     cfg.process = update_op_attr(cfg.process, op_attrs)
 
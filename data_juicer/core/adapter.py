@@ -1,20 +1,78 @@
 import json
 import os
+import threading
+import time
 from copy import deepcopy
 
+import psutil
 from datasets import Dataset, concatenate_datasets
 from datasets.config import DEFAULT_MAX_BATCH_SIZE
+from loguru import logger
 
 from data_juicer.analysis.measure import RelatedTTestMeasure
 from data_juicer.core.monitor import Monitor
 from data_juicer.ops import UNFORKABLE
+from data_juicer.ops.base_op import Filter, Mapper
+from data_juicer.ops.op_fusion import FusedStage
 from data_juicer.utils.cache_utils import dataset_cache_control
 from data_juicer.utils.constant import Fields
+from data_juicer.utils.lazy_loader import LazyLoader
 from data_juicer.utils.process_utils import setup_mp
 
+torch = LazyLoader("torch")
+
+
+class ResourceSampler:
+    """
+    Sample the CPU utilization and the used memory ratio of the machine in a
+    background thread of the current process, which is cheap enough to run
+    along with every OP.
+    """
+
+    def __init__(self, interval=0.2):
+        """
+        Initialization method.
+
+        :param interval: sampling interval in seconds
+        """
+        self.interval = interval
+        self.cpu_utils = []
+        self.mem_utils = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        # the first call of cpu_percent only sets the start point
+        psutil.cpu_percent()
+        while not self._stop.wait(self.interval):
+            self.cpu_utils.append(psutil.cpu_percent() / 100.0)
+            self.mem_utils.append(psutil.virtual_memory().percent / 100.0)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def avg_cpu_util(self):
+        return sum(self.cpu_utils) / len(self.cpu_utils) if self.cpu_utils else None
+
+    @property
+    def max_mem_util(self):
+        return max(self.mem_utils) if self.mem_utils else None
+
 
 class Adapter:
     MAX_BATCH_SIZE = 10000
+    # number of rounds to run an auto-tuned OP in, between which its workloads
+    # are adjusted according to the resource utilization of the last round
+    AUTO_TUNE_ROUNDS = 8
+    # expected processing time of a batch in seconds for auto-tuned OPs
+    TARGET_BATCH_TIME = 2.0
 
     def __init__(self, cfg: dict):
         self.cfg = cfg
@@ -22,6 +80,9 @@ class Adapter:
         # insight mining related
         self.enable_insight_mining = self.cfg.open_insight_mining if hasattr(self.cfg, "open_insight_mining") else False
 
+        # auto-tuning of the workloads of OPs
+        self.auto_tune = self.cfg.auto_tune if hasattr(self.cfg, "auto_tune") else False
+
         # resource probe related
         self.idle_resources = Monitor.monitor_current_resources()
 
@@ -173,6 +234,178 @@ class Adapter:
 
         return batch_size_per_op
 
+    @staticmethod
+    @dataset_cache_control(on=True)
+    def measure_op_cost(op, dataset):
+        """
+        Run an OP on a small batch in the current process and measure its
+        real costs, including the per-sample CPU time and wall time, the peak
+        RSS growth of the process (models and intermediate data) and the peak
+        GPU memory allocated.
+
+        The result caches of the OP are turned off while probing, so the real
+        computation is measured.
+
+        :param op: the OP to measure
+        :param dataset: the small batch to run the OP on
+        :return: a dict of the measured costs
+        """
+        num_proc, batch_size = op.num_proc, op.batch_size
+        # a single process, and a single batch for batched OPs
+        op.num_proc = 1
+        op.batch_size = max(len(dataset), 1)
+        probed_ops = getattr(op, "fused_ops", [op])
+        cache_dirs = [getattr(probed_op, "op_result_cache_dir", None) for probed_op in probed_ops]
+        for probed_op in probed_ops:
+            probed_op.op_result_cache_dir = None
+
+        process = psutil.Process()
+        rss_before = process.memory_info().rss
+        peak_rss = [rss_before]
+        stop = threading.Event()
+
+        def sample_rss():
+            while not stop.wait(0.05):
+                peak_rss[0] = max(peak_rss[0], process.memory_info().rss)
+
+        use_gpu = op.use_cuda() and torch.cuda.is_available()
+        if use_gpu:
+            torch.cuda.reset_peak_memory_stats()
+            gpu_before = torch.cuda.memory_allocated()
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+        cpu_start, wall_start = time.process_time(), time.time()
+        try:
+            op.run(dataset)
+        finally:
+            cpu_time, wall_time = time.process_time() - cpu_start, time.time() - wall_start
+            stop.set()
+            sampler.join()
+            op.num_proc, op.batch_size = num_proc, batch_size
+            for probed_op, cache_dir in zip(probed_ops, cache_dirs):
+                probed_op.op_result_cache_dir = cache_dir
+        peak_rss[0] = max(peak_rss[0], process.memory_info().rss)
+
+        num_samples = max(len(dataset), 1)
+        return {
+            "cpu_time_per_sample": cpu_time / num_samples,
+            "wall_time_per_sample": wall_time / num_samples,
+            # number of CPU cores kept busy by one process
+            "cpu_util": cpu_time / wall_time if wall_time > 0 else 1.0,
+            "mem": peak_rss[0] - rss_before,
+            "gpu_mem": torch.cuda.max_memory_allocated() - gpu_before if use_gpu else 0,
+        }
+
+    def tune_op(self, op, cost):
+        """
+        Set the workloads of an OP according to its measured costs. The
+        measured memory and CPU cores of a process are set as the
+        `mem_required` and `cpu_required` of the OP, from which its number of
+        processes is calculated at runtime with the available resources. The
+        batch size of batched OPs is set so a batch takes about
+        `TARGET_BATCH_TIME`. OPs that can run on GPUs are placed on CPUs if
+        their models don't fit in the free GPU memory. If no memory growth is
+        measured, e.g. the models are loaded before probing, the configured
+        `mem_required` is kept.
+
+        :param op: the OP to tune
+        :param cost: the costs measured by `measure_op_cost`
+        """
+        if op.use_cuda():
+            free_gpu_mem = min(torch.cuda.mem_get_info(i)[0] for i in range(torch.cuda.device_count()))
+            if cost["gpu_mem"] > free_gpu_mem:
+                logger.warning(
+                    f"OP [{op._name}] requires {cost['gpu_mem'] / 1024**3:.2f}GB GPU memory, which is more than "
+                    f"the free GPU memory. Place it on CPU."
+                )
+                op.accelerator = "cpu"
+            elif cost["gpu_mem"] > 0:
+                op.mem_required = cost["gpu_mem"] / 1024**3
+        if not op.use_cuda():
+            if cost["mem"] > 0:
+                op.mem_required = cost["mem"] / 1024**3
+            op.cpu_required = min(max(cost["cpu_util"], 0.1), psutil.cpu_count())
+        if op.is_batched_op() and cost["wall_time_per_sample"] > 0:
+            op.batch_size = min(max(int(self.TARGET_BATCH_TIME / cost["wall_time_per_sample"]), 1), self.MAX_BATCH_SIZE)
+        op.num_proc = op.runtime_np()
+        logger.info(
+            f"Auto-tuned OP [{op._name}]: num_proc={op.num_proc}, batch_size={op.batch_size}, "
+            f"accelerator={op.accelerator}, measured cost={cost}"
+        )
+
+    def retune_op(self, op, sampler, util_th=0.9):
+        """
+        Adjust the number of processes and batch size of an OP according to
+        the resource utilization while it ran in the last round. They are
+        halved under memory pressure, and the number of processes is
+        increased additively if both CPU and memory are underutilized.
+
+        :param op: the OP to adjust
+        :param sampler: the ResourceSampler of the last round
+        :param util_th: the expected max utilization of resources
+        """
+        cpu_util, mem_util = sampler.avg_cpu_util, sampler.max_mem_util
+        if cpu_util is None or mem_util is None:
+            return
+        if mem_util > util_th:
+            op.num_proc = max(op.num_proc // 2, 1)
+            if op.is_batched_op():
+                op.batch_size = max(op.batch_size // 2, 1)
+        elif cpu_util < util_th * 0.8 and mem_util < util_th * 0.8 and not op.use_cuda():
+            op.num_proc = min(op.num_proc + max(op.num_proc // 4, 1), psutil.cpu_count())
+        else:
+            return
+        logger.info(
+            f"Adjusted OP [{op._name}] to num_proc={op.num_proc}, batch_size={op.batch_size} "
+            f"(CPU util. {cpu_util:.2f}, Mem. util. {mem_util:.2f})"
+        )
+
+    def run_auto_tuned(self, op, dataset, **run_args):
+        """
+        Run an OP with its workloads tuned from real measurements. The costs
+        of the OP are measured on a small batch first to set its number of
+        processes, batch size and placement. Then row-local OPs run on the
+        dataset in `AUTO_TUNE_ROUNDS` contiguous shards, and the workloads
+        are adjusted between the rounds according to the resource
+        utilization, so the OP keeps adapting while it runs. Other OPs, e.g.
+        Deduplicators, may keep states across runs like the persistent dedup
+        index, so they are not probed and run as they are.
+
+        :param op: the OP to run
+        :param dataset: the dataset to process
+        :param run_args: other arguments of the `run` method of the OP
+        :return: the processed dataset
+        """
+        from data_juicer.core.data import NestedDataset
+
+        if not isinstance(op, (Mapper, Filter, FusedStage)):
+            return op.run(dataset, **run_args)
+
+        cost = self.measure_op_cost(op, self.take_batch(dataset, self.cfg))
+        self.tune_op(op, cost)
+
+        exporter, tracer = run_args.get("exporter"), run_args.get("tracer")
+        # the stats export and the tracer need the results of the whole
+        # dataset, and indices are numbered in the whole dataset
+        shardable = (
+            tracer is None
+            and not (exporter and getattr(op, "stats_export_path", None))
+            and op.index_key is None
+        )
+        num_rounds = min(self.AUTO_TUNE_ROUNDS, len(dataset) // max(op.batch_size * op.num_proc, 1))
+        if not shardable or num_rounds < 2:
+            return op.run(dataset, **run_args)
+
+        results = []
+        for i in range(num_rounds):
+            shard = dataset.shard(num_rounds, i, contiguous=True)
+            with ResourceSampler() as sampler:
+                results.append(op.run(shard, **run_args))
+            if i < num_rounds - 1:
+                self.retune_op(op, sampler)
+        return NestedDataset(concatenate_datasets(results))
+
     @dataset_cache_control(on=True)
     def analyze_small_batch(self, dataset, current_state):
         """
@@ -64,6 +64,8 @@ class Analyzer:
             export_ds=self.cfg.export_original_dataset,
             keep_stats_in_res_ds=self.cfg.export_original_dataset,
             export_stats=True,
+            export_compression=self.cfg.export_compression,
+            export_row_group_size=self.cfg.export_row_group_size,
         )
 
         # parsed_res
@@ -4,5 +4,12 @@ from .dj_dataset import (
     add_same_content_to_new_column,
     wrap_func_with_nested_access,
 )
+from .streaming_dataset import StreamingDataset
 
-__all__ = ["DJDataset", "NestedDataset", "wrap_func_with_nested_access", "add_same_content_to_new_column"]
+__all__ = [
+    "DJDataset",
+    "NestedDataset",
+    "StreamingDataset",
+    "wrap_func_with_nested_access",
+    "add_same_content_to_new_column",
+]
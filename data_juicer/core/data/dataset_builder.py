@@ -4,7 +4,7 @@ from argparse import Namespace
 from typing import List, Tuple
 
 import numpy as np
-from datasets import concatenate_datasets
+from datasets import IterableDataset, concatenate_datasets
 from loguru import logger
 
 from data_juicer.core.data import DJDataset, NestedDataset
@@ -144,6 +144,33 @@ class DatasetBuilder(object):
             assert len(_datasets) == 1, "Ray setup only supports one dataset now"
             return _datasets[0]
 
+    def load_iterable_dataset(self, **kwargs) -> IterableDataset:
+        """
+        Load the dataset as a lazily evaluated stream of samples for the
+        streaming mode. Samples are only read from the sources when they are
+        iterated, so nothing is materialized on the disk.
+
+        Data validators are skipped since they need to check the whole
+        dataset, and the mixture sampling is approximated by taking the first
+        samples of each dataset.
+        """
+        if self.require_dataset_arg or self.use_generated_dataset_config:
+            raise ValueError(
+                "Unable to load dataset in streaming mode; should have one of "
+                "dataset_path or dataset in configurations, or pass the "
+                "`dataset` object through `run` method"
+            )
+        if self.validators:
+            logger.warning("Data validators are skipped when loading dataset in streaming mode.")
+
+        _datasets = []
+        for stra, sample_num in zip(self.load_strategies, self.sample_numbers):
+            dataset = stra.load_iterable_data(**kwargs)
+            if sample_num is not None:
+                dataset = dataset.take(sample_num)
+            _datasets.append(dataset)
+        return concatenate_datasets(_datasets)
+
     @classmethod
     def load_dataset_by_generated_config(cls, generated_dataset_config):
         """
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
 import copy
+import gc
 import inspect
 import json
 import os
 import traceback
 from abc import ABC, abstractmethod
-from functools import wraps
+from functools import partial, wraps
 from time import time
 from typing import Any, Dict, List, Optional, Union
 
@@ -17,6 +18,7 @@ from loguru import logger
 from data_juicer.core.data.schema import Schema
 from data_juicer.core.monitor import Monitor
 from data_juicer.ops import UNFORKABLE
+from data_juicer.ops.op_fusion import FusedStage
 from data_juicer.utils import cache_utils
 from data_juicer.utils.compress import (
     CompressionOff,
@@ -26,7 +28,23 @@ from data_juicer.utils.compress import (
 )
 from data_juicer.utils.fingerprint_utils import generate_fingerprint
 from data_juicer.utils.logger_utils import make_log_summarization
+from data_juicer.utils.metrics import (
+    clear_metric,
+    count_samples,
+    is_metrics_enabled,
+    set_metric,
+)
+from data_juicer.utils.op_result_cache import get_api_response_cache
 from data_juicer.utils.process_utils import setup_mp
+from data_juicer.utils.profiler import (
+    PHASE_FILTER_INDEX,
+    get_filter_index_op,
+    get_op_label,
+    is_profiling,
+    profile_function,
+    record_op,
+    start_op,
+)
 
 
 class DJDataset(ABC):
@@ -284,11 +302,20 @@ class NestedDataset(Dataset, DJDataset):
 
         dataset = self
         op_num = len(operators)
+        set_metric("ops", op_num)
         try:
             for idx, op in enumerate(operators, start=1):
+                clear_metric("current_op")
+                set_metric("current_op", 1, op=op._name, index=idx)
                 mp_context = ["forkserver", "spawn"] if (op.use_cuda() or op._name in unforkable_operators) else None
                 setup_mp(mp_context)
+                frozen = schedule_model_preloading(operators, idx - 1, unforkable_operators)
+
+                api_cache = get_api_response_cache()
+                if api_cache is not None:
+                    api_cache_counters = api_cache.counters()
 
+                op_label = start_op(idx, op._name)
                 start = time()
                 # run single op
                 run_args = {
@@ -296,16 +323,40 @@ class NestedDataset(Dataset, DJDataset):
                     "exporter": exporter,
                     "tracer": tracer,
                 }
+                # tune the workloads of the OP from real measurements
+                run = partial(adapter.run_auto_tuned, op) if adapter and adapter.auto_tune else op.run
+                # commit the output of the OP shard by shard
+                if checkpointer is not None and checkpointer.shard_size > 0:
+                    run = partial(checkpointer.run_op, op, run)
                 if open_monitor:
-                    dataset, resource_util_per_op = Monitor.monitor_func(op.run, args=run_args)
+                    dataset, resource_util_per_op = Monitor.monitor_func(run, args=run_args)
                 else:
-                    dataset = op.run(**run_args)
+                    dataset = run(**run_args)
+                if frozen:
+                    gc.unfreeze()
                 # record processed ops
                 if checkpointer is not None:
-                    checkpointer.record(op._op_cfg)
+                    op_cfgs = op._op_cfg[op._name] if isinstance(op, FusedStage) else [op._op_cfg]
+                    for op_cfg in op_cfgs:
+                        checkpointer.record(op_cfg)
+                    # it only references the committed shards of the OP
+                    if checkpointer.shard_size > 0:
+                        checkpointer.save_ckpt(dataset)
+                if api_cache is not None:
+                    counters = {key: value - api_cache_counters[key] for key, value in api_cache.counters().items()}
+                    if any(counters.values()):
+                        logger.info(
+                            f"OP [{op._name}] API response cache: "
+                            f"{counters['hits']} hits, {counters['misses']} misses."
+                        )
+                    if open_monitor:
+                        resource_util_per_op["api_response_cache"] = counters
                 if open_monitor:
                     resource_util_list.append(resource_util_per_op)
                 end = time()
+                record_op(op_label, start, end, run_args["dataset"], dataset)
+                if is_metrics_enabled():
+                    update_op_metrics(op._name, idx, end - start, run_args["dataset"], dataset)
                 logger.info(
                     f"[{idx}/{op_num}] OP [{op._name}] Done in " f"{end - start:.3f}s. Left {len(dataset)} samples."
                 )
@@ -321,6 +372,7 @@ class NestedDataset(Dataset, DJDataset):
             traceback.print_exc()
             exit(1)
         finally:
+            clear_metric("current_op")
             if checkpointer and dataset is not self:
                 logger.info("Writing checkpoint of dataset processed by " "last op...")
                 dataset.cleanup_cache_files()
@@ -390,6 +442,30 @@ class NestedDataset(Dataset, DJDataset):
             new_fingerprint = generate_fingerprint(self, *args, **kargs)
             kargs["new_fingerprint"] = new_fingerprint
 
+        # time the function in workers after the fingerprint is generated, so
+        # profiling doesn't invalidate the caches
+        if is_profiling():
+            if inspect.ismethod(called_func) and hasattr(called_func.__self__, "_name"):
+                args, kargs = self._profile_function(args, kargs, get_op_label(called_func.__self__._name))
+            elif not is_filter and get_filter_index_op(called_func):
+                op_name = get_filter_index_op(called_func)
+                args, kargs = self._profile_function(args, kargs, op_name, PHASE_FILTER_INDEX)
+
+        # count the processed samples in workers for the live metrics
+        if is_metrics_enabled() and inspect.ismethod(called_func) and hasattr(called_func.__self__, "_name"):
+            if args:
+                args[0] = count_samples(args[0], called_func.__self__._name)
+            else:
+                kargs["function"] = count_samples(kargs["function"], called_func.__self__._name)
+
+        return args, kargs
+
+    @staticmethod
+    def _profile_function(args, kargs, op_name, *phase):
+        if args:
+            args[0] = profile_function(args[0], op_name, *phase)
+        else:
+            kargs["function"] = profile_function(kargs["function"], op_name, *phase)
         return args, kargs
 
     def map(self, *args, **kargs):
@@ -530,6 +606,76 @@ def nested_query(root_obj: Union[NestedDatasetDict, NestedDataset, NestedQueryDi
     return None
 
 
+def update_op_metrics(op_name, index, duration, dataset_in, dataset_out):
+    """
+    Update the live metrics after an OP is finished.
+
+    :param op_name: name of the OP
+    :param index: index of the OP, starting from 1
+    :param duration: wall time of the OP
+    :param dataset_in: the input dataset
+    :param dataset_out: the output dataset
+    """
+    set_metric("ops_done", index)
+    set_metric("op_samples_in", len(dataset_in), op=op_name)
+    set_metric("op_samples_out", len(dataset_out), op=op_name)
+    set_metric("op_duration_seconds", duration, op=op_name)
+    if duration > 0:
+        set_metric("op_throughput_samples_per_second", len(dataset_in) / duration, op=op_name)
+    cache_bytes = 0
+    for cache_file in dataset_out.cache_files:
+        try:
+            cache_bytes += os.path.getsize(cache_file["filename"])
+        except OSError:
+            pass
+    set_metric("dataset_cache_bytes", cache_bytes)
+
+
+def schedule_model_preloading(operators, index, unforkable_operators=()):
+    """
+    Preload models around running an OP, when models are planned by
+    `plan_models`. Models are only preloaded on cpu for OPs running in forked
+    workers.
+
+    - If the OP runs in forked workers and models are shared, its models are
+      loaded in the main process before forking, so the workers inherit them
+      copy-on-write instead of loading their own copies.
+    - If the OP runs in the main process, the models of the next OP are
+      loaded in background while it runs.
+
+    :param operators: the list of OPs to run.
+    :param index: the index of the OP to run.
+    :param unforkable_operators: names of OPs that can't run in forked
+        workers.
+    :return: True if gc is frozen for the OP, which should be unfrozen
+        after it's done.
+    """
+    # import the module here to keep it (and the LazyLoaders in it) out of
+    # the globals pickled with the map functions of this module
+    from data_juicer.utils import model_utils
+
+    if model_utils.MODEL_REFS is None:
+        return False
+
+    def preloadable(op):
+        return not op.use_cuda() and op._name not in unforkable_operators
+
+    # background loading must be finished before forking any workers
+    model_utils.wait_preloaded_models()
+    op = operators[index]
+    if op.runtime_np() > 1:
+        if model_utils.SHARE_MODELS and preloadable(op):
+            model_utils.preload_models(op)
+            # keep the loaded objects out of gc to avoid copying their pages
+            gc.freeze()
+            return True
+    elif index + 1 < len(operators):
+        next_op = operators[index + 1]
+        if preloadable(next_op) and (next_op.runtime_np() == 1 or model_utils.SHARE_MODELS):
+            model_utils.preload_models(next_op, background=True)
+    return False
+
+
 def add_same_content_to_new_column(sample, new_column_name, initial_value=None):
     """
     A helper function to speed up add_column function. Apply map on this
@@ -11,7 +11,7 @@ from loguru import logger
 from data_juicer.core.data import DJDataset
 from data_juicer.core.data.config_validator import ConfigValidator
 from data_juicer.download.downloader import validate_snapshot_format
-from data_juicer.format.formatter import unify_format
+from data_juicer.format.formatter import unify_format, unify_iterable_format
 from data_juicer.format.load import load_formatter
 
 # based on executor type and data source type, use different
@@ -61,6 +61,11 @@ class DataLoadStrategy(ABC, ConfigValidator):
     def load_data(self, **kwargs) -> DJDataset:
         pass
 
+    def load_iterable_data(self, **kwargs) -> datasets.IterableDataset:
+        """Load the data as a lazily evaluated stream of samples, which is
+        required by the streaming mode of the executor."""
+        raise NotImplementedError(f"Streaming data load is not supported by {self.__class__.__name__}")
+
 
 class DataLoadStrategyRegistry:
     """
@@ -336,6 +341,16 @@ class DefaultLocalDataLoadStrategy(DefaultDataLoadStrategy):
         # TODO more sophiscated localformatter routing
         return formatter.load_dataset(load_data_np, self.cfg)
 
+    def load_iterable_data(self, **kwargs):
+        text_keys = getattr(self.cfg, "text_keys", ["text"])
+        suffixes = getattr(self.cfg, "suffixes", None)
+        add_suffix = any(list(op.keys())[0] == "suffix_filter" for op in self.cfg.get("process", []))
+        kwargs.pop("num_proc", None)
+        formatter = load_formatter(
+            dataset_path=self.ds_config["path"], text_keys=text_keys, suffixes=suffixes, add_suffix=add_suffix, **kwargs
+        )
+        return formatter.load_iterable_dataset(self.cfg)
+
 
 @DataLoadStrategyRegistry.register("default", "remote", "huggingface")
 class DefaultHuggingfaceDataLoadStrategy(DefaultDataLoadStrategy):
@@ -364,6 +379,21 @@ class DefaultHuggingfaceDataLoadStrategy(DefaultDataLoadStrategy):
         )
         return unify_format(ds, text_keys=self.cfg.text_keys, num_proc=num_proc, global_cfg=self.cfg)
 
+    def load_iterable_data(self, **kwargs):
+        kwargs.pop("num_proc", None)
+        ds = datasets.load_dataset(
+            self.ds_config["path"],
+            split=self.ds_config.get("split", None),
+            data_files=self.ds_config.get("data_files", None),
+            data_dir=self.ds_config.get("data_dir", None),
+            name=self.ds_config.get("name", None),
+            streaming=True,
+            **kwargs,
+        )
+        if self.ds_config.get("limit", None):
+            ds = ds.take(self.ds_config["limit"])
+        return unify_iterable_format(ds, text_keys=self.cfg.text_keys, global_cfg=self.cfg)
+
 
 @DataLoadStrategyRegistry.register("default", "remote", "modelscope")
 class DefaultModelScopeDataLoadStrategy(DefaultDataLoadStrategy):
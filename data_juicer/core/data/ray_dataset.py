@@ -1,18 +1,29 @@
 from __future__ import annotations
 
 import os
+import zlib
 from argparse import Namespace
 from functools import partial
 from typing import Any, Dict, List, Literal, Optional, Union
 
+import numpy as np
 import pyarrow
 from loguru import logger
 
 from data_juicer import cuda_device_count
 from data_juicer.core.data import DJDataset
 from data_juicer.core.data.schema import Schema
-from data_juicer.ops import Deduplicator, Filter, Mapper
-from data_juicer.ops.base_op import TAGGING_OPS
+from data_juicer.ops import (
+    Aggregator,
+    Deduplicator,
+    Filter,
+    Grouper,
+    Mapper,
+    Selector,
+)
+from data_juicer.ops.base_op import TAGGING_OPS, catch_map_arrow_exception
+from data_juicer.ops.deduplicator import RayBasicDeduplicator
+from data_juicer.ops.op_fusion import FusedStage, fuse_stages, is_stage_fusible
 from data_juicer.utils.constant import Fields
 from data_juicer.utils.file_utils import is_remote_path
 from data_juicer.utils.lazy_loader import LazyLoader
@@ -88,10 +99,266 @@ def filter_batch(batch, filter_func):
     return batch.filter(mask)
 
 
+def filter_batch_arrow(batch, filter_func):
+    return batch.filter(filter_func(batch))
+
+
+def append_empty_column(table: pyarrow.Table, name: str) -> pyarrow.Table:
+    """
+    Append a column of empty dicts to a table if it's missing, e.g. the
+    stats or meta column, which is skipped for blocks that already have it.
+
+    :param table: the input table
+    :param name: name of the column to append
+    :return: the table with the column
+    """
+    if name in table.column_names:
+        return table
+    new_column_data = [{} for _ in range(len(table))]
+    return table.append_column(name, [new_column_data])
+
+
+def is_ray_stage_fusible(op) -> bool:
+    """
+    Check whether an OP can be fused into a Ray stage with its neighbours.
+    Besides the conditions of `is_stage_fusible`, only CPU OPs are fused, and
+    the cuda OPs keep their own actor pools. Deduplicators that shuffle the
+    whole dataset are not fused either.
+
+    :param op: the op object to check.
+    :return: True if the op can be fused into a Ray stage.
+    """
+    return is_stage_fusible(op) and not op.use_cuda() and not getattr(op, "use_shuffle", False)
+
+
+def is_stateful_op(op) -> bool:
+    """
+    Check whether an OP gives different results if it's executed again. The
+    dataset-level OPs depend on the whole dataset, and the Ray dedup filters
+    keep the seen hashes in their dedup sets or shuffle the rows
+    nondeterministically, so all samples are dropped or reordered in another
+    run.
+
+    :param op: the op object to check.
+    :return: True if the op is stateful.
+    """
+    if isinstance(op, FusedStage):
+        return any(is_stateful_op(fused_op) for fused_op in op.fused_ops)
+    return not isinstance(op, (Mapper, Filter)) or isinstance(op, RayBasicDeduplicator)
+
+
+def plan_ray_stages(operators: list) -> list:
+    """
+    Plan the Ray operators to run a list of OPs. Each run of consecutive CPU
+    Mappers and Filters is fused into one stage, which is applied by a single
+    `map_batches` call, so it doesn't cost several Ray operators and object
+    store hand-offs for each OP.
+
+    :param operators: list of op objects to run
+    :return: list of op objects with fused stages
+    """
+    return fuse_stages(operators, fusible=is_ray_stage_fusible)
+
+
+def run_stage_batch(table: pyarrow.Table, stage: FusedStage) -> pyarrow.Table:
+    """
+    Apply all OPs of a fused stage on a batch of a Ray dataset. The batch is
+    converted to python dicts only once for the whole stage.
+
+    :param table: the input batch
+    :param stage: the fused stage to apply
+    :return: the output batch
+    """
+    samples = stage.process_batched(table.to_pydict())
+    return pyarrow.Table.from_pydict(samples)
+
+
+def get_field_values(table: pyarrow.Table, field_key: str) -> list:
+    """
+    Get the values of a field in a table, where the keys of a nested field
+    are separated by '.'.
+
+    :param table: the input table
+    :param field_key: the key of the field
+    :return: list of values
+    """
+    field_keys = field_key.split(".")
+    assert field_keys[0] in table.column_names, "'{}' not in {}".format(field_keys[0], table.column_names)
+    values = table.column(field_keys[0]).to_pylist()
+    for key in field_keys[1:]:
+        values = [value[key] for value in values]
+    return values
+
+
+def ray_topk(dataset, key_func, k: int, descending: bool = True):
+    """
+    Select the k rows with the largest (or smallest) keys from a Ray
+    dataset. Each block keeps its own top k rows first, so only up to k rows
+    per block are sorted and merged in the end.
+
+    :param dataset: the input Ray dataset
+    :param key_func: function that takes a pyarrow table and returns a
+        numeric key for each row
+    :param k: number of rows to select
+    :param descending: whether to select the rows with the largest keys
+    :return: the selected Ray dataset
+    """
+    topk_key = "__dj__topk_key__"
+
+    def partial_topk(table: pyarrow.Table):
+        keys = np.asarray(key_func(table), dtype=np.float64)
+        if len(keys) > k:
+            index = np.argpartition(-keys if descending else keys, k - 1)[:k]
+            table, keys = table.take(index), keys[index]
+        return table.append_column(topk_key, pyarrow.array(keys))
+
+    if k <= 0:
+        return dataset.limit(0)
+    dataset = dataset.map_batches(partial_topk, batch_format="pyarrow", batch_size=None)
+    return dataset.sort(topk_key, descending=descending).limit(k).drop_columns([topk_key])
+
+
+def ray_group(dataset, key_func=None):
+    """
+    Group the rows of a Ray dataset into batched samples, i.e. one row per
+    group whose fields are the lists of field values of the rows in the
+    group. Rows are grouped by a hash shuffle on their group keys.
+
+    :param dataset: the input Ray dataset
+    :param key_func: function that takes a pyarrow table and returns a
+        hashable group key for each row. All rows are put into one group if
+        it's None.
+    :return: the Ray dataset of batched samples
+    """
+    group_key = "__dj__group_key__"
+
+    def add_group_key(table: pyarrow.Table):
+        return table.append_column(group_key, pyarrow.array(key_func(table), type=pyarrow.string()))
+
+    def to_batched_sample(table: pyarrow.Table):
+        if group_key in table.column_names:
+            table = table.drop_columns([group_key])
+        return pyarrow.Table.from_pylist([table.to_pydict()])
+
+    if key_func is not None:
+        dataset = dataset.map_batches(add_group_key, batch_format="pyarrow")
+        grouped = dataset.groupby(group_key)
+    else:
+        grouped = dataset.groupby(None)
+    return grouped.map_groups(to_batched_sample, batch_format="pyarrow")
+
+
+def add_row_index(dataset, column: str):
+    """
+    Add the global row index of a Ray dataset as a new column. Notice that
+    it's not lazy: the dataset is executed and materialized in the object
+    store by `to_arrow_refs` right away, and the row counts of its blocks are
+    used to get the offset of each block in order.
+
+    :param dataset: the input Ray dataset
+    :param column: name of the index column
+    :return: the Ray dataset with the index column
+    """
+
+    def count_rows(table: pyarrow.Table) -> int:
+        return table.num_rows
+
+    def append_index(table: pyarrow.Table, offset: int) -> pyarrow.Table:
+        index = np.arange(offset, offset + table.num_rows, dtype=np.int64)
+        return table.append_column(column, pyarrow.array(index))
+
+    refs = dataset.to_arrow_refs()
+    num_rows = ray.get([ray.remote(count_rows).remote(ref) for ref in refs])
+    offsets = np.cumsum([0] + num_rows[:-1])
+    refs = [ray.remote(append_index).remote(ref, int(offset)) for ref, offset in zip(refs, offsets)]
+    return ray.data.from_arrow_refs(refs)
+
+
+def ray_dedup(dataset, hash_func, num_partitions: int, preserve_order: bool = False):
+    """
+    Deduplicate the rows of a Ray dataset by exact matching of their hash
+    values without any central state. Rows are shuffled into partitions by
+    their hash values, so all rows with the same hash value are in the same
+    partition, and each partition only keeps the first row of each hash
+    value.
+
+    :param dataset: the input Ray dataset
+    :param hash_func: function that takes a pyarrow table and returns a
+        string hash value for each row
+    :param num_partitions: number of partitions of the shuffle. Each
+        partition is deduplicated in memory by one worker.
+    :param preserve_order: whether to keep the first row of each hash value
+        in the original order and return the rows in the original order,
+        which costs an extra pass to index the rows and a final sort. The
+        input dataset is materialized eagerly to index its rows.
+    :return: the deduplicated Ray dataset
+    """
+    hash_key = "__dj__dedup_hash__"
+    partition_key = "__dj__dedup_partition__"
+    order_key = "__dj__dedup_order__"
+
+    def add_hash(table: pyarrow.Table):
+        hashes = hash_func(table)
+        partitions = [zlib.crc32(value.encode("utf-8")) % num_partitions for value in hashes]
+        table = table.append_column(hash_key, pyarrow.array(hashes, type=pyarrow.string()))
+        return table.append_column(partition_key, pyarrow.array(partitions, type=pyarrow.int64()))
+
+    def dedup_partition(table: pyarrow.Table):
+        sort_keys = [(hash_key, "ascending")]
+        if preserve_order:
+            sort_keys.append((order_key, "ascending"))
+        table = table.sort_by(sort_keys)
+        hashes = table[hash_key].to_numpy(zero_copy_only=False)
+        is_first = np.ones(len(hashes), dtype=np.bool_)
+        is_first[1:] = hashes[1:] != hashes[:-1]
+        return table.filter(is_first).drop_columns([hash_key, partition_key])
+
+    if preserve_order:
+        # the rows are indexed in the original order, which is restored by
+        # the final sort, so the order only needs to be preserved here
+        execution_options = dataset.context.execution_options
+        former_preserve_order = execution_options.preserve_order
+        execution_options.preserve_order = True
+        try:
+            dataset = add_row_index(dataset, order_key)
+        finally:
+            execution_options.preserve_order = former_preserve_order
+    dataset = dataset.map_batches(add_hash, batch_format="pyarrow")
+    dataset = dataset.groupby(partition_key).map_groups(dedup_partition, batch_format="pyarrow")
+    if preserve_order:
+        dataset = dataset.sort(order_key).drop_columns([order_key])
+    return dataset
+
+
+def run_on_driver(dataset, op):
+    """
+    Run a dataset-level OP that has no distributed implementation on the
+    whole Ray dataset, which is collected to the driver.
+
+    :param dataset: the input Ray dataset
+    :param op: the OP whose `process` takes a NestedDataset
+    :return: the output Ray dataset
+    """
+    from datasets import Dataset
+
+    from data_juicer.core.data import NestedDataset
+
+    logger.warning(f"OP [{op._name}] has no distributed implementation. Run it on the driver.")
+    table = pyarrow.concat_tables(ray.get(dataset.to_arrow_refs()))
+    result = op.process(NestedDataset(Dataset(table)))
+    if isinstance(result, list):
+        return ray.data.from_arrow(pyarrow.Table.from_pylist(result))
+    return ray.data.from_arrow(result.with_format("arrow")[:])
+
+
 class RayDataset(DJDataset):
     def __init__(self, dataset: ray.data.Dataset, dataset_path: str = None, cfg: Optional[Namespace] = None) -> None:
         self.data = preprocess_dataset(dataset, dataset_path, cfg)
         self.num_proc = getattr(cfg, "np", getattr(cfg, "num_proc", None)) if cfg else None
+        self._columns = self._get_known_columns()
+        # whether any stateful OP, e.g. a dataset-level OP or a Ray dedup
+        # filter, is in the plan of the dataset
+        self._has_stateful_ops = False
 
     def schema(self) -> Schema:
         """Get dataset schema.
@@ -112,8 +379,8 @@ class RayDataset(DJDataset):
         if k == 0:
             return []
 
-        k = min(k, self.data.count())
-        return list(self.data.limit(k).take())
+        # take at most k rows without counting the whole dataset
+        return self.data.take(k)
 
     def get_column(self, column: str, k: Optional[int] = None) -> List[Any]:
         """Get column values from Ray dataset.
@@ -137,8 +404,7 @@ class RayDataset(DJDataset):
                 raise ValueError(f"k must be non-negative, got {k}")
             if k == 0:
                 return []
-            k = min(k, self.data.count())
-            return [row[column] for row in self.data.limit(k).take()]
+            return [row[column] for row in self.data.take(k)]
 
         return [row[column] for row in self.data.take()]
 
@@ -147,26 +413,47 @@ class RayDataset(DJDataset):
             return self
         if not isinstance(operators, list):
             operators = [operators]
-        for op in operators:
+        # the columns added by the OPs are tracked along the plan, so the
+        # dataset doesn't need to be executed to check its columns
+        self._columns = self._get_known_columns()
+        for op in plan_ray_stages(operators):
             self._run_single_op(op)
         return self
 
+    def _get_known_columns(self) -> set:
+        """Get the columns of the dataset if they are known without
+        executing it, otherwise an empty set."""
+        schema = self.data.schema(fetch_if_missing=False)
+        return set(schema.names) if schema is not None else set()
+
+    def _add_column(self, name: str):
+        """Add a column of empty dicts to the dataset if it's not known to
+        exist yet."""
+        if name in self._columns:
+            return
+        self.data = self.data.map_batches(partial(append_empty_column, name=name), batch_format="pyarrow")
+        self._columns.add(name)
+
     def _run_single_op(self, op):
         op_proc = calculate_np(op._name, op.mem_required, op.cpu_required, self.num_proc, op.use_cuda())
         num_gpus = get_num_gpus(op, op_proc)
 
-        if op._name in TAGGING_OPS.modules and Fields.meta not in self.data.columns():
-
-            def process_batch_arrow(table: pyarrow.Table):
-                new_column_data = [{} for _ in range(len(table))]
-                new_table = table.append_column(Fields.meta, [new_column_data])
-                return new_table
-
-            self.data = self.data.map_batches(process_batch_arrow, batch_format="pyarrow")
+        if op._name in TAGGING_OPS.modules:
+            self._add_column(Fields.meta)
 
         try:
             batch_size = getattr(op, "batch_size", 1) if op.is_batched_op() else 1
-            if isinstance(op, Mapper):
+            if getattr(op, "use_shuffle", False):
+                # exact dedup by a hash-partitioned shuffle of the dataset
+                self.data = op.process_ray(self.data)
+            elif isinstance(op, FusedStage):
+                # the missing stats/meta columns are added batch by batch
+                # inside the stage
+                self.data = self.data.map_batches(
+                    partial(run_stage_batch, stage=op), batch_size=op.batch_size, batch_format="pyarrow"
+                )
+                self._columns.update(op.required_columns())
+            elif isinstance(op, Mapper):
                 if op.use_cuda():
                     op_kwargs = op._op_cfg[op._name]
                     self.data = self.data.map_batches(
@@ -180,20 +467,20 @@ class RayDataset(DJDataset):
                         concurrency=op_proc,
                         batch_format="pyarrow",
                     )
+                elif op.is_arrow_op():
+                    self.data = self.data.map_batches(
+                        catch_map_arrow_exception(op.process_arrow, skip_op_error=op.skip_op_error, op_name=op._name),
+                        batch_size=batch_size,
+                        batch_format="pyarrow",
+                        num_gpus=num_gpus,
+                        zero_copy_batch=True,
+                    )
                 else:
                     self.data = self.data.map_batches(
                         op.process, batch_size=batch_size, batch_format="pyarrow", num_gpus=num_gpus
                     )
             elif isinstance(op, Filter):
-                columns = self.data.columns()
-                if Fields.stats not in columns:
-
-                    def process_batch_arrow(table: pyarrow.Table):
-                        new_column_data = [{} for _ in range(len(table))]
-                        new_talbe = table.append_column(Fields.stats, [new_column_data])
-                        return new_talbe
-
-                    self.data = self.data.map_batches(process_batch_arrow, batch_format="pyarrow")
+                self._add_column(Fields.stats)
                 if op.use_cuda():
                     op_kwargs = op._op_cfg[op._name]
                     self.data = self.data.map_batches(
@@ -207,13 +494,36 @@ class RayDataset(DJDataset):
                         concurrency=op_proc,
                         batch_format="pyarrow",
                     )
+                elif op.is_arrow_op():
+                    self.data = self.data.map_batches(
+                        catch_map_arrow_exception(
+                            op.compute_stats_arrow, skip_op_error=op.skip_op_error, op_name=op._name
+                        ),
+                        batch_size=batch_size,
+                        batch_format="pyarrow",
+                        num_gpus=num_gpus,
+                        zero_copy_batch=True,
+                    )
                 else:
                     self.data = self.data.map_batches(
                         op.compute_stats, batch_size=batch_size, batch_format="pyarrow", num_gpus=num_gpus
                     )
                 if op.stats_export_path is not None:
                     self.data.write_json(op.stats_export_path, force_ascii=False)
-                if op.is_batched_op():
+                if op.is_arrow_op() and not op.use_cuda():
+                    self.data = self.data.map_batches(
+                        partial(
+                            filter_batch_arrow,
+                            filter_func=catch_map_arrow_exception(
+                                op.process_arrow, return_mask=True, skip_op_error=op.skip_op_error, op_name=op._name
+                            ),
+                        ),
+                        batch_format="pyarrow",
+                        batch_size=batch_size,
+                        num_gpus=num_gpus,
+                        zero_copy_batch=True,
+                    )
+                elif op.is_batched_op():
                     self.data = self.data.map_batches(
                         partial(filter_batch, filter_func=op.process),
                         batch_format="pyarrow",
@@ -224,10 +534,31 @@ class RayDataset(DJDataset):
                 else:
                     self.data = self.data.filter(op.process)
             elif isinstance(op, Deduplicator):
+                if getattr(op, "reread_source", False) and self._has_stateful_ops:
+                    # the stateful upstream OPs must not be executed again
+                    # when the source is re-read
+                    logger.warning(
+                        f"OP [{op._name}] re-reads its source, which includes stateful upstream OPs. "
+                        f"Materialize the input first."
+                    )
+                    self.data = self.data.materialize()
+                    self._has_stateful_ops = False
                 self.data = op.run(self.data)
+            elif isinstance(op, Selector):
+                self.data = op.process_ray(self.data)
+            elif isinstance(op, Grouper):
+                self.data = op.process_ray(self.data)
+                # the rows are rebuilt from the groups
+                self._columns = set()
+            elif isinstance(op, Aggregator):
+                self._add_column(Fields.batch_meta)
+                self.data = op.process_ray(self.data)
+                self._columns = set()
             else:
-                logger.error("Ray executor only support Filter and Mapper OPs for now")
+                logger.error(f"Ray executor doesn't support OP [{op._name}] for now")
                 raise NotImplementedError
+            if is_stateful_op(op):
+                self._has_stateful_ops = True
         except:  # noqa: E722
             logger.error(f"An error occurred during Op [{op._name}].")
             import traceback
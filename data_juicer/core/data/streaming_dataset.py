@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+import pyarrow as pa
+from datasets import Features, IterableDataset
+from datasets.arrow_writer import ArrowWriter
+from loguru import logger
+
+from data_juicer.core.data.dj_dataset import DJDataset, NestedDataset, NestedQueryDict
+from data_juicer.core.data.schema import Schema
+from data_juicer.ops import UNFORKABLE
+from data_juicer.ops.op_fusion import is_local_op, run_ops_on_batch
+from data_juicer.utils.process_utils import setup_mp
+
+# the row-local ops and the rank for cuda ops held by each streaming worker
+_WORKER_OPS = None
+_WORKER_RANK = None
+
+
+def _init_stream_worker(ops):
+    global _WORKER_OPS, _WORKER_RANK
+    import multiprocess as mp
+
+    from data_juicer import cuda_device_count
+
+    _WORKER_OPS = ops
+    identity = mp.current_process()._identity
+    num_gpus = cuda_device_count()
+    _WORKER_RANK = (identity[0] - 1) % num_gpus if identity and num_gpus > 0 else None
+
+
+def _run_stream_worker(samples):
+    return run_ops_on_batch(_WORKER_OPS, NestedQueryDict(samples), rank=_WORKER_RANK)
+
+
+def num_rows_of_batch(samples: Dict[str, List]) -> int:
+    return len(next(iter(samples.values()))) if samples else 0
+
+
+class StreamingDataset(DJDataset):
+    """
+    Out-of-core dataset of DJ based on HuggingFace IterableDataset.
+
+    Row-local OPs (Mappers and Filters) are not applied to the whole dataset
+    one by one. Instead, each maximal run of them is fused into one streaming
+    pass that is evaluated lazily batch by batch when the dataset is iterated,
+    e.g. by the exporter, so the memory and disk usage are bounded by the
+    batch size rather than the dataset size. Global OPs (Deduplicators,
+    Selectors, Groupers and Aggregators) are pipeline barriers: the stream
+    before them is materialized into a single Arrow file, on which they run as
+    usual, and the streaming continues from their results.
+    """
+
+    def __init__(
+        self,
+        dataset: IterableDataset,
+        batch_size: int = 1000,
+        num_proc: int = 1,
+        tmp_dir: Optional[str] = None,
+    ):
+        """
+        Initialization method.
+
+        :param dataset: the source iterable dataset.
+        :param batch_size: the number of samples in each streamed batch.
+        :param num_proc: the max number of processes to apply the fused OPs.
+        :param tmp_dir: the directory to store the materialized results of
+            pipeline barriers. In default, a temp directory is created.
+        """
+        self.data = dataset
+        self.batch_size = batch_size
+        self.num_proc = num_proc
+        self.tmp_dir = tmp_dir
+        # the row-local ops to be applied lazily on the current stream
+        self.pending_ops = []
+        # the materialized dataset of the last pipeline barrier, whose cache
+        # files are needed until the stream from it is consumed
+        self.materialized = None
+        self.num_barriers = 0
+
+    def process(self, operators, *, exporter=None, checkpointer=None, tracer=None, **kwargs) -> DJDataset:
+        if operators is None:
+            return self
+        if not isinstance(operators, list):
+            operators = [operators]
+        if checkpointer is not None:
+            logger.warning("Checkpoints are not supported in streaming mode and will be skipped.")
+
+        for op in operators:
+            if is_local_op(op):
+                # fuse it into the current streaming pass
+                self.pending_ops.append(op)
+                continue
+            logger.info(f"OP [{op._name}] is a pipeline barrier. Materializing the stream before it...")
+            dataset = self.materialize()
+            dataset = op.run(dataset, exporter=exporter, tracer=tracer)
+            self._replace_materialized(dataset)
+            logger.info(f"OP [{op._name}] Done. Left {len(dataset)} samples.")
+        if self.pending_ops:
+            logger.info(
+                f"OPs {[op._name for op in self.pending_ops]} are fused into "
+                f"a streaming pass, which will be applied while exporting."
+            )
+        return self
+
+    def iter_batches(self, batch_size: Optional[int] = None) -> Iterator[Dict[str, List]]:
+        """
+        Iterate over the processed batches of samples in "dict of lists"
+        format. The pending OPs are applied to the batches read from the
+        source stream on the fly, and empty batches are skipped.
+
+        :param batch_size: the number of samples in each source batch.
+        :return: an iterator of processed batches.
+        """
+        batch_size = batch_size or self.batch_size
+        source = self.data.iter(batch_size=batch_size)
+        ops = list(self.pending_ops)
+        if not ops:
+            yield from source
+            return
+
+        num_proc = min([self.num_proc] + [op.runtime_np() for op in ops])
+        if num_proc <= 1:
+            _init_stream_worker(ops)
+            results = (_run_stream_worker(samples) for samples in source)
+            for samples in results:
+                if num_rows_of_batch(samples) > 0:
+                    yield samples
+            return
+
+        import multiprocess as mp
+
+        unforkable_operators = set(UNFORKABLE.modules.keys())
+        use_spawn = any(op.use_cuda() or op._name in unforkable_operators for op in ops)
+        setup_mp(["forkserver", "spawn"] if use_spawn else None)
+        # keep a bounded window of batches in flight to bound the memory usage
+        # and yield the results in their original order
+        max_in_flight = 2 * num_proc
+        with mp.Pool(num_proc, initializer=_init_stream_worker, initargs=(ops,)) as pool:
+            in_flight = deque()
+            for samples in source:
+                in_flight.append(pool.apply_async(_run_stream_worker, (samples,)))
+                if len(in_flight) >= max_in_flight:
+                    res = in_flight.popleft().get()
+                    if num_rows_of_batch(res) > 0:
+                        yield res
+            while in_flight:
+                res = in_flight.popleft().get()
+                if num_rows_of_batch(res) > 0:
+                    yield res
+
+    def materialize(self) -> NestedDataset:
+        """
+        Consume the current stream and write the processed samples into a
+        single Arrow file, which is loaded as a NestedDataset. It's used
+        before pipeline barriers.
+
+        :return: the materialized dataset.
+        """
+        if self.tmp_dir is None:
+            self.tmp_dir = tempfile.mkdtemp(prefix="dj_stream_")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        path = os.path.join(self.tmp_dir, f"barrier-{self.num_barriers:05d}.arrow")
+        self.num_barriers += 1
+
+        writer = None
+        for samples in self.iter_batches():
+            if writer is None:
+                writer = ArrowWriter(path=path)
+            writer.write_batch(samples)
+        if writer is None:
+            # nothing left in the stream
+            dataset = NestedDataset.from_list([])
+        else:
+            writer.finalize()
+            writer.close()
+            dataset = NestedDataset(NestedDataset.from_file(path))
+        self._replace_materialized(dataset)
+        return dataset
+
+    def _replace_materialized(self, dataset: NestedDataset):
+        # the stream from the former materialized dataset has been consumed,
+        # so its files are not needed anymore
+        if self.materialized is not None and self.materialized is not dataset:
+            self._remove_tmp_files(self.materialized, keep=dataset)
+        self.materialized = dataset
+        self.data = dataset.to_iterable_dataset()
+        self.pending_ops = []
+
+    def _remove_tmp_files(self, dataset, keep=None):
+        keep_files = {f["filename"] for f in keep.cache_files} if keep is not None else set()
+        for cache_file in dataset.cache_files:
+            filename = cache_file["filename"]
+            if self.tmp_dir and filename.startswith(os.path.abspath(self.tmp_dir)) and filename not in keep_files:
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+    def cleanup_cache_files(self):
+        """Remove the temp files of materialized pipeline barriers."""
+        self.materialized = None
+        if self.tmp_dir and os.path.exists(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+
+    def _first_batch(self, k: int) -> Dict[str, List]:
+        res = {}
+        for samples in self.iter_batches(batch_size=max(min(k, self.batch_size), 1)):
+            for key, values in samples.items():
+                res.setdefault(key, []).extend(values)
+            if num_rows_of_batch(res) >= k:
+                break
+        return {key: values[:k] for key, values in res.items()}
+
+    def schema(self) -> Schema:
+        """Get dataset schema, which is inferred from the first processed
+        sample if the features of the stream are unknown."""
+        if not self.pending_ops and self.data.features is not None:
+            return Schema.from_hf_features(self.data.features)
+        first = self._first_batch(1)
+        if not first:
+            raise ValueError("Dataset is empty or not initialized")
+        features = Features.from_arrow_schema(pa.Table.from_pydict(first).schema)
+        return Schema.from_hf_features(features)
+
+    def get(self, k: int) -> List[Dict[str, Any]]:
+        """Get k rows from the dataset."""
+        if k < 0:
+            raise ValueError(f"k must be non-negative, got {k}")
+        if k == 0:
+            return []
+        first = self._first_batch(k)
+        return [{key: first[key][i] for key in first} for i in range(num_rows_of_batch(first))]
+
+    def get_column(self, column: str, k: Optional[int] = None) -> List[Any]:
+        """Get column values from the streamed dataset.
+
+        Args:
+            column: Name of the column to retrieve
+            k: Optional number of rows to return. If None, returns all rows
+
+        Returns:
+            List of values from the specified column
+
+        Raises:
+            KeyError: If column doesn't exist
+            ValueError: If k is negative
+        """
+        if k is not None:
+            if k < 0:
+                raise ValueError(f"k must be non-negative, got {k}")
+            if k == 0:
+                return []
+            rows = self.get(k)
+        else:
+            rows = self.to_list()
+        if rows and column not in rows[0]:
+            raise KeyError(f"Column '{column}' not found in dataset")
+        return [row[column] for row in rows]
+
+    def to_list(self) -> list:
+        res = []
+        for samples in self.iter_batches():
+            res.extend({key: samples[key][i] for key in samples} for i in range(num_rows_of_batch(samples)))
+        return res
@@ -1,10 +1,12 @@
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
 from typing import Optional
 
 from jsonargparse import Namespace
 from pydantic import PositiveInt
 
 from data_juicer.config import init_configs
+from data_juicer.utils.metrics import MetricsExporter
 
 
 class ExecutorBase(ABC):
@@ -16,3 +18,25 @@ class ExecutorBase(ABC):
     @abstractmethod
     def run(self, load_data_np: Optional[PositiveInt] = None, skip_return=False):
         raise NotImplementedError
+
+    def metrics_exporter(self):
+        """
+        Get the exporter of the live metrics of the job as a context
+        manager, which is a no-op if neither `metrics_port` nor
+        `metrics_path` is set.
+        """
+        port = getattr(self.cfg, "metrics_port", None)
+        path = getattr(self.cfg, "metrics_path", None)
+        if port is None and path is None:
+            return nullcontext()
+        return MetricsExporter(
+            self.cfg.work_dir,
+            host=getattr(self.cfg, "metrics_host", "127.0.0.1"),
+            port=port,
+            path=path,
+            interval=getattr(self.cfg, "metrics_interval", 15),
+            cache_dirs={
+                "op_result": getattr(self.cfg, "op_result_cache_dir", None),
+                "api_response": getattr(self.cfg, "api_response_cache_dir", None),
+            },
+        )
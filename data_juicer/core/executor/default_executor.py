@@ -8,19 +8,28 @@ from loguru import logger
 from pydantic import PositiveInt
 
 from data_juicer.core.adapter import Adapter
-from data_juicer.core.data import NestedDataset
+from data_juicer.core.data import NestedDataset, StreamingDataset
 from data_juicer.core.data.dataset_builder import DatasetBuilder
 from data_juicer.core.executor import ExecutorBase
 from data_juicer.core.exporter import Exporter
 from data_juicer.core.tracer import Tracer
 from data_juicer.ops import OPERATORS, load_ops
-from data_juicer.ops.op_fusion import fuse_operators
+from data_juicer.ops.base_op import Deduplicator
+from data_juicer.ops.op_fusion import fuse_operators, fuse_stages
 from data_juicer.ops.selector import (
     FrequencySpecifiedFieldSelector,
     TopkSpecifiedFieldSelector,
 )
 from data_juicer.utils import cache_utils
 from data_juicer.utils.ckpt_utils import CheckpointManager
+from data_juicer.utils.mm_utils import size_to_bytes
+from data_juicer.utils.model_utils import free_models, plan_models
+from data_juicer.utils.op_result_cache import enable_api_response_cache
+from data_juicer.utils.profiler import (
+    disable_profiling,
+    enable_profiling,
+    export_profile,
+)
 from data_juicer.utils.sample import random_sample
 
 
@@ -52,6 +61,11 @@ class DefaultExecutor(ExecutorBase):
             logger.info(f"Using cache compression method: " f"[{self.cfg.cache_compress}]")
             cache_utils.CACHE_COMPRESS = self.cfg.cache_compress
 
+        # cache the responses of API models and vLLM chats across runs
+        if getattr(self.cfg, "api_response_cache_dir", None):
+            logger.info(f"Using API response cache in [{self.cfg.api_response_cache_dir}]")
+            enable_api_response_cache(self.cfg.api_response_cache_dir, size_to_bytes(self.cfg.api_response_cache_size))
+
         # setup dataset builder
         logger.info("Setting up dataset builder...")
         self.dataset_builder = DatasetBuilder(self.cfg, executor_type=self.executor_type)
@@ -63,7 +77,9 @@ class DefaultExecutor(ExecutorBase):
         if self.cfg.use_checkpoint:
             logger.info("Preparing checkpoint manager...")
             self.ckpt_dir = os.path.join(self.work_dir, "ckpt")
-            self.ckpt_manager = CheckpointManager(self.ckpt_dir, self.cfg.process, self.cfg.np)
+            self.ckpt_manager = CheckpointManager(
+                self.ckpt_dir, self.cfg.process, self.cfg.np, shard_size=getattr(self.cfg, "ckpt_shard_size", 0)
+            )
             if self.ckpt_manager.ckpt_available:
                 logger.info("Found existed dataset checkpoint.")
                 self.cfg.process = self.ckpt_manager.get_left_process_list()
@@ -77,6 +93,8 @@ class DefaultExecutor(ExecutorBase):
             self.cfg.np,
             keep_stats_in_res_ds=self.cfg.keep_stats_in_res_ds,
             keep_hashes_in_res_ds=self.cfg.keep_hashes_in_res_ds,
+            export_compression=self.cfg.export_compression,
+            export_row_group_size=self.cfg.export_row_group_size,
         )
 
         # setup tracer
@@ -103,6 +121,18 @@ class DefaultExecutor(ExecutorBase):
         :param skip_return: skip return for API called.
         :return: processed dataset.
         """
+        with self.metrics_exporter():
+            return self._run(dataset, load_data_np=load_data_np, skip_return=skip_return)
+
+    def _run(
+        self,
+        dataset: Union[Dataset, NestedDataset] = None,
+        load_data_np: Optional[PositiveInt] = None,
+        skip_return=False,
+    ):
+        if getattr(self.cfg, "streaming", False):
+            return self.run_streaming(dataset, skip_return=skip_return)
+
         # 1. format data
         if dataset is not None:
             logger.info(f"Using existing dataset {dataset}")
@@ -140,10 +170,32 @@ class DefaultExecutor(ExecutorBase):
                 if op.is_batched_op():
                     op.batch_size = bs_per_op[i]
 
+        # stage fusion
+        if getattr(self.cfg, "stage_fusion", False):
+            if self.open_tracer or self.adapter.enable_insight_mining:
+                logger.warning(
+                    "Stage fusion is skipped since tracer or insight mining " "needs the results of each single OP."
+                )
+            else:
+                logger.info("Fuse consecutive Mappers and Filters into stages...")
+                ops = fuse_stages(ops)
+
         # 3. data process
         # - If tracer is open, trace each op after it's processed
         # - If checkpoint is open, clean the cache files after each process
         logger.info("Processing data...")
+        model_residency = getattr(self.cfg, "model_residency", False)
+        if model_residency:
+            mem_budget = self.cfg.model_mem_budget
+            plan_models(
+                ops,
+                mem_budget=size_to_bytes(mem_budget) if mem_budget else None,
+                share_models=self.cfg.share_models,
+            )
+        open_profiler = getattr(self.cfg, "open_profiler", False)
+        if open_profiler:
+            profile_dir = os.path.join(self.work_dir, "profile")
+            enable_profiling(profile_dir)
         tstart = time()
         dataset = dataset.process(
             ops,
@@ -154,12 +206,18 @@ class DefaultExecutor(ExecutorBase):
             adapter=self.adapter,
             open_monitor=self.cfg.open_monitor,
         )
+        if model_residency:
+            free_models()
         tend = time()
         logger.info(f"All OPs are done in {tend - tstart:.3f}s.")
+        if open_profiler:
+            export_profile(profile_dir)
+            disable_profiling()
 
         # 4. data export
         logger.info("Exporting dataset to disk...")
         self.exporter.export(dataset)
+        self.commit_dedup_indexes(ops)
         # compress the last dataset after exporting
         if self.cfg.use_cache and self.cfg.cache_compress:
             from data_juicer.utils.compress import compress
@@ -169,6 +227,76 @@ class DefaultExecutor(ExecutorBase):
         if not skip_return:
             return dataset
 
+    def run_streaming(self, dataset: Union[Dataset, NestedDataset] = None, skip_return=False):
+        """
+        Running the dataset process pipeline in streaming (out-of-core) mode.
+        The dataset is read as a stream and each run of consecutive Mappers
+        and Filters is applied batch by batch in one fused pass, while the
+        processed batches are written to the exporter directly.
+
+        :param dataset: a Dataset object to be executed.
+        :param skip_return: skip return for API called.
+        :return: processed streaming dataset. It may read the temp files of
+            materialized pipeline barriers, which are removed by its
+            `cleanup_cache_files` method.
+        """
+        # 1. format data
+        if dataset is not None:
+            logger.info(f"Streaming from existing dataset {dataset}")
+            iterable_dataset = NestedDataset(dataset).to_iterable_dataset()
+        else:
+            logger.info("Loading dataset stream from dataset builder...")
+            iterable_dataset = self.dataset_builder.load_iterable_dataset()
+        if self.open_tracer or self.cfg.use_checkpoint or self.cfg.open_monitor:
+            logger.warning("Tracer, checkpoint and monitor are not supported in streaming mode and will be skipped.")
+
+        # 2. extract processes
+        logger.info("Preparing process operators...")
+        ops = load_ops(self.cfg.process)
+        if self.cfg.op_fusion:
+            # the speed probing needs a materialized dataset, so only the
+            # greedy strategy is available here
+            logger.info("Start OP fusion with strategy [greedy] in streaming mode...")
+            ops = fuse_operators(ops)
+
+        # 3. data process and export
+        logger.info("Processing and exporting data stream...")
+        tstart = time()
+        dataset = StreamingDataset(
+            iterable_dataset,
+            batch_size=self.cfg.stream_batch_size,
+            num_proc=self.cfg.np,
+            tmp_dir=os.path.join(self.work_dir, ".stream_tmp"),
+        )
+        try:
+            dataset = dataset.process(ops, exporter=self.exporter)
+            self.exporter.export_stream(dataset.iter_batches())
+            self.commit_dedup_indexes(ops)
+        except:  # noqa: E722
+            dataset.cleanup_cache_files()
+            raise
+        tend = time()
+        logger.info(f"All OPs are done in {tend - tstart:.3f}s.")
+
+        if skip_return:
+            dataset.cleanup_cache_files()
+        else:
+            # the returned dataset still reads the materialized barriers, so
+            # their temp files are kept until the caller cleans them up
+            return dataset
+
+    @staticmethod
+    def commit_dedup_indexes(ops):
+        """
+        Commit the keys staged in the persistent dedup indexes of
+        Deduplicators after the processed dataset is exported.
+
+        :param ops: the processed OPs.
+        """
+        for op in ops:
+            if isinstance(op, Deduplicator):
+                op.commit_dedup_index()
+
     def sample_data(
         self,
         dataset_to_sample: Dataset = None,
@@ -38,7 +38,8 @@ class RayExecutor(ExecutorBase):
 
     Run Data-Juicer data processing in a distributed cluster.
 
-        1. Support Filter, Mapper and Exact Deduplicator operators for now.
+        1. Support Filter, Mapper, Deduplicator, Selector, Grouper and
+           Aggregator operators for now.
         2. Only support loading `.json` files.
         3. Advanced functions such as checkpoint, tracer are not supported.
 
@@ -98,7 +99,7 @@ class RayExecutor(ExecutorBase):
             logger.info(f"Start OP fusion and reordering with strategy " f"[{self.cfg.fusion_strategy}]...")
             ops = fuse_operators(ops, probe_res)
 
-        with TempDirManager(self.tmp_dir):
+        with TempDirManager(self.tmp_dir), self.metrics_exporter():
             # 3. data process
             logger.info("Processing data...")
             tstart = time.time()
@@ -1,9 +1,170 @@
+import json
 import os
+import time
 from multiprocessing import Pool
 
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datasets import Dataset
 from loguru import logger
 
 from data_juicer.utils.constant import Fields, HashKeys
+from data_juicer.utils.metrics import flush_metrics, inc_metric
+
+# supported compression codecs of exported files, and the extensions
+# appended to jsonl/json file names. Parquet files are compressed internally
+# and keep their names.
+COMPRESSION_EXTENSIONS = {"gzip": "gz", "zstd": "zst"}
+
+# the dataset to export, which is shared by the export workers
+_EXPORT_DATASET = None
+
+
+def _init_export_worker(dataset):
+    global _EXPORT_DATASET
+    _EXPORT_DATASET = dataset
+
+
+def _export_shard_worker(start, end, export_path, suffix, compression=None, row_group_size=None):
+    """
+    Export the rows [start, end) of the shared dataset to a single file. The
+    rows are selected as a contiguous slice of the shared dataset, so they
+    are not copied.
+
+    :return: the writer pid, the number of rows and bytes written, and the
+        time cost in seconds.
+    """
+    begin = time.time()
+    shard = _EXPORT_DATASET.select(range(start, end))
+    export_file(shard, export_path, suffix, compression=compression, row_group_size=row_group_size)
+    inc_metric("exported_samples_total", end - start)
+    flush_metrics()
+    return os.getpid(), end - start, os.path.getsize(export_path), time.time() - begin
+
+
+def export_file(dataset, export_path, suffix, num_proc=1, compression=None, row_group_size=None):
+    """
+    Export a dataset to a single file by the export method of its suffix.
+    Jsonl and json files are compressed as a whole, while parquet files are
+    compressed by pages.
+
+    :param dataset: the dataset to export.
+    :param export_path: the path of the target file.
+    :param suffix: the format of the target file.
+    :param num_proc: the number of processes used to serialize the dataset.
+    :param compression: compression codec of the target file, one of
+        [gzip, zstd].
+    :param row_group_size: the max number of rows in each row group of
+        parquet files.
+    """
+    export_method = Exporter._router()[suffix]
+    if suffix == "parquet":
+        export_method(dataset, export_path, compression=compression, row_group_size=row_group_size)
+    elif compression is not None:
+        with pa.CompressedOutputStream(export_path, compression) as fout:
+            export_method(dataset, fout, num_proc=num_proc)
+    else:
+        export_method(dataset, export_path, num_proc=num_proc)
+
+
+def to_json_lines(table):
+    """Serialize the rows of an Arrow table to json lines in the same way as
+    `Dataset.to_json`, so the streamed files are the same as the exported
+    ones."""
+    if table.num_rows == 0:
+        return []
+    # newlines in the values are escaped, so each line is a row
+    content = table.to_pandas().to_json(orient="records", lines=True, force_ascii=False)
+    return content.rstrip("\n").split("\n")
+
+
+def shard_bounds(num_rows, num_shards):
+    """Split rows into contiguous shards in the same way as
+    `Dataset.shard(contiguous=True)`."""
+    div, mod = divmod(num_rows, num_shards)
+    bounds = []
+    for index in range(num_shards):
+        start = index * div + min(index, mod)
+        bounds.append((start, start + div + (1 if index < mod else 0)))
+    return bounds
+
+
+# open files of the side streams in the current process, keyed by the
+# directory of the side stream and the pid
+_SIDE_STREAM_RUNS = {}
+
+
+class SideStream:
+    """
+    A side stream of samples written along with a dataset map, e.g. the
+    samples with stats written by fused Filters before the rejected ones are
+    dropped, so that they can be exported without keeping all of them in the
+    mapped dataset.
+
+    Each map worker appends the batches of its contiguous run of rows to a
+    jsonl file named by the index of the first row, so the samples can be
+    read back in the original order. Files are flushed after each batch, so
+    they are complete even if the workers exit without closing them.
+    """
+
+    def __init__(self, dirname):
+        """
+        Initialization method.
+
+        :param dirname: the directory to store the side stream files.
+        """
+        self.dirname = dirname
+
+    def write(self, indices, rows):
+        """
+        Append a batch of rows to the side stream.
+
+        :param indices: the indices of the rows in the mapped dataset.
+        :param rows: list of rows in dict.
+        """
+        if len(rows) == 0:
+            return
+        key = (self.dirname, os.getpid())
+        fout, next_index = _SIDE_STREAM_RUNS.get(key, (None, None))
+        if fout is None or indices[0] != next_index:
+            if fout is not None:
+                fout.close()
+            os.makedirs(self.dirname, exist_ok=True)
+            fout = open(os.path.join(self.dirname, f"{indices[0]:012d}.jsonl"), "w", encoding="utf-8")
+        for row in rows:
+            fout.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        fout.flush()
+        _SIDE_STREAM_RUNS[key] = (fout, indices[-1] + 1)
+
+    def close(self):
+        """Close the files of the side stream opened in this process."""
+        fout, _ = _SIDE_STREAM_RUNS.pop((self.dirname, os.getpid()), (None, None))
+        if fout is not None:
+            fout.close()
+
+    def files(self):
+        if not os.path.isdir(self.dirname):
+            return []
+        return [os.path.join(self.dirname, f) for f in sorted(os.listdir(self.dirname)) if f.endswith(".jsonl")]
+
+    def to_dataset(self, features=None):
+        """
+        Read the side stream back as a dataset in the original order of
+        rows, or None if nothing is written.
+
+        :param features: the features of the rows. They should be given so
+            the column types are kept, otherwise they are inferred from the
+            json lines, e.g. empty lists and dicts are read as nulls.
+        :return: the dataset of the side stream.
+        """
+        from data_juicer.core.data import NestedDataset
+
+        files = self.files()
+        if not files:
+            return None
+        return NestedDataset(
+            Dataset.from_json(files, features=features, cache_dir=os.path.join(self.dirname, "cache"))
+        )
 
 
 class Exporter:
@@ -25,6 +186,8 @@ class Exporter:
         keep_stats_in_res_ds=False,
         keep_hashes_in_res_ds=False,
         export_stats=True,
+        export_compression=None,
+        export_row_group_size=None,
     ):
         """
         Initialization method.
@@ -33,13 +196,22 @@ class Exporter:
         :param export_shard_size: the size of each shard of exported
             dataset. In default, it's 0, which means export the dataset
             to a single file.
-        :param num_proc: number of process to export the dataset.
+        :param num_proc: number of process to export the dataset. Shards are
+            written by this number of concurrent writers.
         :param export_ds: whether to export the dataset contents.
         :param keep_stats_in_res_ds: whether to keep stats in the result
             dataset.
         :param keep_hashes_in_res_ds: whether to keep hashes in the result
             dataset.
         :param export_stats: whether to export the stats of dataset.
+        :param export_compression: compression codec of the exported
+            dataset files, one of [gzip, zstd]. For jsonl and json files,
+            the extension of the codec is appended to the file names. In
+            default, it's None, which means no compression for jsonl and json
+            files and snappy for parquet files.
+        :param export_row_group_size: the number of rows in each row group
+            of exported parquet files. In default, it's determined by the
+            features of the dataset.
         """
         self.export_path = export_path
         self.export_shard_size = export_shard_size
@@ -51,6 +223,14 @@ class Exporter:
         self.suffix = self._get_suffix(export_path)
         self.num_proc = num_proc
         self.max_shard_size_str = ""
+        if export_compression is not None and export_compression not in COMPRESSION_EXTENSIONS:
+            raise NotImplementedError(
+                f"Compression [{export_compression}] of exported files is "
+                f"not supported for now. Only support "
+                f"{list(COMPRESSION_EXTENSIONS.keys())}."
+            )
+        self.export_compression = export_compression
+        self.export_row_group_size = export_row_group_size
 
         # get the string format of shard size
         if self.export_shard_size // Exporter.TiB:
@@ -100,6 +280,72 @@ class Exporter:
             )
         return suffix
 
+    def _get_export_file(self, export_path):
+        """Append the extension of the compression codec to the path of
+        jsonl and json files."""
+        if self.export_compression is None or self.suffix == "parquet":
+            return export_path
+        return f"{export_path}.{COMPRESSION_EXTENSIONS[self.export_compression]}"
+
+    def _export_shards(self, dataset, filenames, bounds, suffix):
+        """
+        Export contiguous row ranges of a dataset to files by concurrent
+        writers. The dataset is shared with the writer processes instead of
+        pickling each shard.
+
+        :param dataset: the dataset to export.
+        :param filenames: the target file of each shard.
+        :param bounds: the [start, end) row range of each shard.
+        :param suffix: suffix of export path.
+        """
+        tasks = [
+            (start, end, filename, suffix, self.export_compression, self.export_row_group_size)
+            for filename, (start, end) in zip(filenames, bounds)
+        ]
+        num_proc = min(self.num_proc if self.export_in_parallel else 1, len(tasks))
+        if num_proc <= 1:
+            _init_export_worker(dataset)
+            results = [_export_shard_worker(*task) for task in tasks]
+            _init_export_worker(None)
+        else:
+            with Pool(num_proc, initializer=_init_export_worker, initargs=(dataset,)) as pool:
+                results = pool.starmap(_export_shard_worker, tasks)
+
+        # report the throughput of each writer
+        writer_stats = {}
+        for pid, num_rows, nbytes, cost in results:
+            stats = writer_stats.setdefault(pid, [0, 0, 0.0])
+            stats[0] += num_rows
+            stats[1] += nbytes
+            stats[2] += cost
+        for writer_id, (num_rows, nbytes, cost) in enumerate(writer_stats.values()):
+            logger.info(
+                f"Writer [{writer_id}] exported {num_rows} samples "
+                f"({nbytes / Exporter.MiB:.2f} MiB) in {cost:.2f}s, "
+                f"{nbytes / Exporter.MiB / max(cost, 1e-6):.2f} MiB/s."
+            )
+
+    def _get_removed_fields(self, fields):
+        """
+        Get the intermediate fields that should be removed from the result
+        dataset.
+
+        :param fields: the fields of the dataset.
+        :return: the set of fields to remove.
+        """
+        extra_fields = set()
+        if not self.keep_stats_in_res_ds:
+            extra_fields |= {Fields.stats, Fields.meta}
+        if not self.keep_hashes_in_res_ds:
+            extra_fields |= {
+                HashKeys.hash,
+                HashKeys.minhash,
+                HashKeys.simhash,
+                HashKeys.imagehash,
+                HashKeys.videohash,
+            }
+        return extra_fields.intersection(set(fields))
+
     def _export_impl(self, dataset, export_path, suffix, export_stats=True):
         """
         Export a dataset to specific path.
@@ -125,27 +371,21 @@ class Exporter:
 
         if self.export_ds:
             # fetch the corresponding export method according to the suffix
-            if not self.keep_stats_in_res_ds:
-                extra_fields = {Fields.stats, Fields.meta}
-                feature_fields = set(dataset.features.keys())
-                removed_fields = extra_fields.intersection(feature_fields)
-                dataset = dataset.remove_columns(removed_fields)
-            if not self.keep_hashes_in_res_ds:
-                extra_fields = {
-                    HashKeys.hash,
-                    HashKeys.minhash,
-                    HashKeys.simhash,
-                    HashKeys.imagehash,
-                    HashKeys.videohash,
-                }
-                feature_fields = set(dataset.features.keys())
-                removed_fields = extra_fields.intersection(feature_fields)
+            removed_fields = self._get_removed_fields(dataset.features.keys())
+            if removed_fields:
                 dataset = dataset.remove_columns(removed_fields)
-            export_method = Exporter._router()[suffix]
             if self.export_shard_size <= 0:
                 # export the whole dataset into one single file.
                 logger.info("Export dataset into a single file...")
-                export_method(dataset, export_path, num_proc=self.num_proc if self.export_in_parallel else 1)
+                export_file(
+                    dataset,
+                    self._get_export_file(export_path),
+                    suffix,
+                    num_proc=self.num_proc if self.export_in_parallel else 1,
+                    compression=self.export_compression,
+                    row_group_size=self.export_row_group_size,
+                )
+                inc_metric("exported_samples_total", len(dataset))
             else:
                 # compute the dataset size and number of shards to split
                 if dataset._indices is not None:
@@ -153,7 +393,8 @@ class Exporter:
                 else:
                     dataset_nbytes = dataset.data.nbytes
                 num_shards = int(dataset_nbytes / self.export_shard_size) + 1
-                num_shards = min(num_shards, len(dataset))
+                # an empty dataset is exported to a single empty shard
+                num_shards = max(min(num_shards, len(dataset)), 1)
 
                 # split the dataset into multiple shards
                 logger.info(
@@ -161,7 +402,7 @@ class Exporter:
                     f"shards. Size of each shard <= "
                     f"{self.max_shard_size_str}"
                 )
-                shards = [dataset.shard(num_shards=num_shards, index=i, contiguous=True) for i in range(num_shards)]
+                bounds = shard_bounds(len(dataset), num_shards)
                 len_num = len(str(num_shards)) + 1
                 num_fmt = f"%0{len_num}d"
 
@@ -171,25 +412,17 @@ class Exporter:
                 basename = os.path.basename(self.export_path).split(".")[0]
                 os.makedirs(dirname, exist_ok=True)
                 filenames = [
-                    os.path.join(
-                        dirname, f"{basename}-{num_fmt % index}-of-" f"{num_fmt % num_shards}" f".{self.suffix}"
+                    self._get_export_file(
+                        os.path.join(
+                            dirname, f"{basename}-{num_fmt % index}-of-" f"{num_fmt % num_shards}" f".{self.suffix}"
+                        )
                     )
                     for index in range(num_shards)
                 ]
 
-                # export dataset into multiple shards using multiprocessing
+                # export shards by concurrent writers
                 logger.info(f"Start to exporting to {num_shards} shards.")
-                pool = Pool(self.num_proc)
-                for i in range(num_shards):
-                    pool.apply_async(
-                        export_method,
-                        args=(
-                            shards[i],
-                            filenames[i],
-                        ),
-                    )
-                pool.close()
-                pool.join()
+                self._export_shards(dataset, filenames, bounds, suffix)
 
     def export(self, dataset):
         """
@@ -200,6 +433,73 @@ class Exporter:
         """
         self._export_impl(dataset, self.export_path, self.suffix, self.export_stats)
 
+    def export_stream(self, batches):
+        """
+        Export method for a stream of batches, e.g. the processed batches of a
+        StreamingDataset. Each batch is written to the target files as soon as
+        it arrives, so the whole dataset is never materialized. If
+        export_shard_size is set, a new shard file is opened once the current
+        one exceeds the shard size.
+
+        :param batches: an iterable of batches in "dict of lists" format.
+        :return: the number of exported samples.
+        """
+        export_columns = [Fields.stats, Fields.meta]
+        stats_writer = None
+        if self.export_stats:
+            stats_file = self.export_path.replace("." + self.suffix, "_stats.jsonl")
+            stats_writer = StreamWriter(stats_file, "jsonl")
+
+        dirname = os.path.dirname(os.path.abspath(self.export_path))
+        basename = os.path.basename(self.export_path).split(".")[0]
+        os.makedirs(dirname, exist_ok=True)
+        shard_idx = 0
+        writer = None
+        num_samples = 0
+        logger.info("Exporting the processed stream...")
+        for samples in batches:
+            if stats_writer is not None:
+                stats = {key: samples[key] for key in export_columns if key in samples}
+                if stats:
+                    stats_writer.write_batch(stats)
+            if not self.export_ds:
+                continue
+            removed_fields = self._get_removed_fields(samples.keys())
+            samples = {key: val for key, val in samples.items() if key not in removed_fields}
+            if writer is None:
+                if self.export_shard_size > 0:
+                    filename = os.path.join(dirname, f"{basename}-{shard_idx:05d}.{self.suffix}")
+                    shard_idx += 1
+                else:
+                    filename = self.export_path
+                writer = StreamWriter(
+                    self._get_export_file(filename),
+                    self.suffix,
+                    compression=self.export_compression,
+                    row_group_size=self.export_row_group_size,
+                )
+            writer.write_batch(samples)
+            num_rows = len(next(iter(samples.values()))) if samples else 0
+            num_samples += num_rows
+            inc_metric("exported_samples_total", num_rows)
+            if 0 < self.export_shard_size <= writer.nbytes:
+                writer.close()
+                writer = None
+
+        if writer is None and self.export_ds and self.export_shard_size <= 0:
+            # export an empty file for an empty stream
+            writer = StreamWriter(
+                self._get_export_file(self.export_path), self.suffix, compression=self.export_compression
+            )
+        if writer is not None:
+            writer.close()
+        if stats_writer is not None:
+            stats_writer.close()
+            if stats_writer.num_rows == 0:
+                os.remove(stats_writer.export_path)
+        logger.info(f"Exported {num_samples} samples in {max(shard_idx, 1)} file(s).")
+        return num_samples
+
     def export_compute_stats(self, dataset, export_path):
         """
         Export method for saving compute status in filters
@@ -236,16 +536,20 @@ class Exporter:
         dataset.to_json(export_path, force_ascii=False, num_proc=num_proc, lines=False)
 
     @staticmethod
-    def to_parquet(dataset, export_path, **kwargs):
+    def to_parquet(dataset, export_path, compression=None, row_group_size=None, **kwargs):
         """
         Export method for parquet target files.
 
         :param dataset: the dataset to export.
         :param export_path: the path to store the exported dataset.
+        :param compression: compression codec of the pages. In default, it's
+            None, which means snappy.
+        :param row_group_size: the max number of rows in each row group. In
+            default, it's determined by the features of the dataset.
         :param kwargs: extra arguments.
         :return:
         """
-        dataset.to_parquet(export_path)
+        dataset.to_parquet(export_path, batch_size=row_group_size, compression=compression or "snappy")
 
     # suffix to export method
     @staticmethod
@@ -260,3 +564,93 @@ class Exporter:
             "json": Exporter.to_json,
             "parquet": Exporter.to_parquet,
         }
+
+
+class StreamWriter:
+    """A writer that appends batches of samples to a single target file in
+    jsonl, json or parquet format."""
+
+    def __init__(self, export_path, suffix, compression=None, row_group_size=None):
+        """
+        Initialization method.
+
+        :param export_path: the path of the target file.
+        :param suffix: the format of the target file.
+        :param compression: compression codec of the target file, one of
+            [gzip, zstd]. Jsonl and json files are compressed as a whole,
+            while parquet files are compressed by pages.
+        :param row_group_size: the max number of rows in each row group of
+            parquet files.
+        """
+        self.export_path = export_path
+        self.suffix = suffix
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self.nbytes = 0
+        self.num_rows = 0
+        self._parquet_writer = None
+        self._file = None
+        if suffix in ("jsonl", "json"):
+            if compression is not None:
+                self._file = pa.CompressedOutputStream(export_path, compression)
+            else:
+                self._file = open(export_path, "wb")
+            if suffix == "json":
+                self._file.write(b"[")
+        elif suffix != "parquet":
+            raise NotImplementedError(f"Streaming export to [{suffix}] files is not supported.")
+
+    def write_batch(self, samples):
+        """
+        Append a batch of samples to the target file.
+
+        :param samples: a batch of samples in "dict of lists" format.
+        """
+        if self.suffix == "parquet":
+            if self._parquet_writer is None:
+                table = pa.Table.from_pydict(samples)
+            else:
+                table = pa.Table.from_pydict(samples, schema=self._parquet_writer.schema)
+            self.write_table(table)
+            return
+        self._write_rows(to_json_lines(pa.Table.from_pydict(samples)))
+
+    def write_table(self, table):
+        """
+        Append an Arrow table of samples to the target file.
+
+        :param table: a pyarrow Table of samples.
+        """
+        if self.suffix == "parquet":
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(
+                    self.export_path, table.schema, compression=self.compression or "snappy"
+                )
+            self._parquet_writer.write_table(table, row_group_size=self.row_group_size)
+            self.nbytes += table.nbytes
+            self.num_rows += table.num_rows
+            return
+        self._write_rows(to_json_lines(table))
+
+    def _write_rows(self, lines):
+        if not lines:
+            return
+        if self.suffix == "jsonl":
+            content = "\n".join(lines) + "\n"
+        else:
+            content = ("," if self.num_rows > 0 else "") + ",".join(lines)
+        content = content.encode("utf-8")
+        self._file.write(content)
+        self.nbytes += len(content)
+        self.num_rows += len(lines)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        elif self.suffix == "parquet":
+            # nothing is written, write an empty parquet file
+            pq.write_table(pa.table({}), self.export_path)
+        if self._file is not None:
+            if self.suffix == "json":
+                self._file.write(b"]")
+            self._file.close()
@@ -74,6 +74,9 @@ class Monitor:
     }
     '''
     Only those fields in DYNAMIC_FIELDS will be analyzed.
+
+    If the API response cache is enabled, the numbers of its hits and misses
+    during each OP are recorded in the 'api_response_cache' field as well.
     """
 
     DYNAMIC_FIELDS = {
@@ -1,7 +1,14 @@
 import os
 from typing import List, Union
 
-from datasets import Dataset, DatasetDict, concatenate_datasets, load_dataset
+from datasets import (
+    Dataset,
+    DatasetDict,
+    IterableDataset,
+    IterableDatasetDict,
+    concatenate_datasets,
+    load_dataset,
+)
 from loguru import logger
 
 from data_juicer.utils.constant import Fields
@@ -18,6 +25,9 @@ class BaseFormatter:
     def load_dataset(self, *args) -> Dataset:
         raise NotImplementedError
 
+    def load_iterable_dataset(self, *args) -> IterableDataset:
+        raise NotImplementedError
+
 
 class LocalFormatter(BaseFormatter):
     """The class is used to load a dataset from local files or local
@@ -78,6 +88,37 @@ class LocalFormatter(BaseFormatter):
         ds = unify_format(datasets, text_keys=self.text_keys, num_proc=num_proc, global_cfg=global_cfg)
         return ds
 
+    def load_iterable_dataset(self, global_cfg=None) -> IterableDataset:
+        """
+        Load a dataset from dataset file or dataset directory as a stream of
+        samples, and unify its format lazily. Nothing is materialized on the
+        disk, which is used by the streaming mode of the executor.
+
+        :param global_cfg: global cfg used in consequent processes,
+        :return: formatted iterable dataset
+        """
+        self.kwargs.pop("num_proc", None)
+        datasets = load_dataset(
+            self.type,
+            data_files={key.strip("."): self.data_files[key] for key in self.data_files},
+            streaming=True,
+            **self.kwargs,
+        )
+        if self.add_suffix:
+            from data_juicer.core.data import add_same_content_to_new_column
+
+            datasets = IterableDatasetDict(
+                {
+                    key: ds.map(
+                        add_same_content_to_new_column,
+                        fn_kwargs={"new_column_name": Fields.suffix, "initial_value": "." + key},
+                    )
+                    for key, ds in datasets.items()
+                }
+            )
+        datasets = concatenate_datasets([ds for _, ds in datasets.items()])
+        return unify_iterable_format(datasets, text_keys=self.text_keys, global_cfg=global_cfg)
+
 
 class RemoteFormatter(BaseFormatter):
     """The class is used to load a dataset from repository of huggingface
@@ -109,6 +150,59 @@ class RemoteFormatter(BaseFormatter):
         return ds
 
 
+def non_empty_text(sample, target_keys):
+    """
+    Check whether the sample has valid texts in all the target keys.
+
+    :param sample: the sample to check.
+    :param target_keys: the text keys to check.
+    :return: False if any of the target keys is None.
+    """
+    for target_key in target_keys:
+        # TODO: case for CFT, in which the len(sample[target_key]) == 0
+        if sample[target_key] is None:
+            # we filter out the samples contains at least None column
+            # since the op can not handle it now
+            return False
+    return True
+
+
+def rel2abs(sample, path_keys, dataset_dir):
+    """
+    Convert the relative paths of multimodal data in the sample to their
+    absolute versions.
+
+    :param sample: the sample to convert.
+    :param path_keys: the keys of fields that store the path lists.
+    :param dataset_dir: the base directory of the relative paths.
+    :return: the converted sample.
+    """
+    for path_key in path_keys:
+        if path_key not in sample:
+            continue
+        paths = sample[path_key]
+        if not paths:
+            continue
+        new_paths = [path if is_absolute_path(path) else os.path.join(dataset_dir, path) for path in paths]
+        sample[path_key] = new_paths
+    return sample
+
+
+def get_dataset_dir(global_cfg):
+    """
+    Get the base directory of the input dataset from the global cfg.
+
+    :param global_cfg: the global cfg.
+    :return: the dataset directory, or an empty string if it's not found.
+    """
+    if global_cfg.get("dataset_path", None) and os.path.exists(global_cfg.dataset_path):
+        if os.path.isdir(global_cfg.dataset_path):
+            return global_cfg.dataset_path
+        else:
+            return os.path.dirname(global_cfg.dataset_path)
+    return ""
+
+
 def add_suffixes(datasets: DatasetDict, num_proc: int = 1) -> Dataset:
     """
     Add suffix filed to datasets.
@@ -190,28 +284,13 @@ def unify_format(
     # TODO: optimize the filtering operation for better efficiency
     logger.info(f"There are {len(dataset)} sample(s) in the original dataset.")
 
-    def non_empty_text(sample, target_keys):
-        for target_key in target_keys:
-            # TODO: case for CFT, in which the len(sample[target_key]) == 0
-            if sample[target_key] is None:
-                # we filter out the samples contains at least None column
-                # since the op can not handle it now
-                return False
-        return True
-
     dataset = dataset.filter(non_empty_text, num_proc=num_proc, fn_kwargs={"target_keys": text_keys})
     logger.info(f"{len(dataset)} samples left after filtering empty text.")
 
     # 3. convert relative paths to absolute paths
     if global_cfg:
         # check and get dataset dir
-        if global_cfg.get("dataset_path", None) and os.path.exists(global_cfg.dataset_path):
-            if os.path.isdir(global_cfg.dataset_path):
-                ds_dir = global_cfg.dataset_path
-            else:
-                ds_dir = os.path.dirname(global_cfg.dataset_path)
-        else:
-            ds_dir = ""
+        ds_dir = get_dataset_dir(global_cfg)
         image_key = global_cfg.get("image_key", SpecialTokens.image)
         audio_key = global_cfg.get("audio_key", SpecialTokens.audio)
         video_key = global_cfg.get("video_key", SpecialTokens.video)
@@ -236,18 +315,6 @@ def unify_format(
             "dataset file)"
         )
 
-        # function to convert relative paths to absolute paths
-        def rel2abs(sample, path_keys, dataset_dir):
-            for path_key in path_keys:
-                if path_key not in sample:
-                    continue
-                paths = sample[path_key]
-                if not paths:
-                    continue
-                new_paths = [path if is_absolute_path(path) else os.path.join(dataset_dir, path) for path in paths]
-                sample[path_key] = new_paths
-            return sample
-
         dataset = dataset.map(
             rel2abs, num_proc=num_proc, fn_kwargs={"path_keys": data_path_keys, "dataset_dir": ds_dir}
         )
@@ -260,3 +327,64 @@ def unify_format(
         )
 
     return dataset
+
+
+def unify_iterable_format(
+    dataset: IterableDataset,
+    text_keys: Union[List[str], str] = "text",
+    global_cfg=None,
+) -> IterableDataset:
+    """
+    Get an unified internal format for an iterable dataset. It's the lazy
+    counterpart of `unify_format`: samples with empty or None text are
+    filtered out and relative paths are converted to absolute paths while
+    the samples are streamed.
+
+    :param dataset: input iterable dataset
+    :param text_keys: original text key(s) of dataset.
+    :param global_cfg: the global cfg used in consequent processes,
+        since cfg.text_key may be modified after unifying
+    :return: unified_format_dataset
+    """
+    if isinstance(dataset, IterableDatasetDict):
+        datasets = list(dataset.values())
+        assert len(datasets) == 1, "Please make sure the passed datasets " "contains only 1 dataset"
+        dataset = datasets[0]
+
+    if text_keys is None:
+        text_keys = []
+    if isinstance(text_keys, str):
+        text_keys = [text_keys]
+
+    logger.info("Unifying the input dataset formats lazily...")
+    if dataset.features is not None:
+        for key in text_keys:
+            if key not in dataset.features:
+                err_msg = (
+                    f"There is no key [{key}] in dataset. You might set "
+                    f"wrong text_key in the config file for your dataset. "
+                    f"Please check and retry!"
+                )
+                logger.error(err_msg)
+                raise ValueError(err_msg)
+
+    dataset = dataset.filter(non_empty_text, fn_kwargs={"target_keys": text_keys})
+
+    if global_cfg:
+        ds_dir = get_dataset_dir(global_cfg)
+        if ds_dir != "":
+            # the features of a streamed dataset might be unknown before
+            # iteration, so all the path keys are checked for each sample
+            data_path_keys = [
+                global_cfg.get("image_key", SpecialTokens.image),
+                global_cfg.get("audio_key", SpecialTokens.audio),
+                global_cfg.get("video_key", SpecialTokens.video),
+            ]
+            dataset = dataset.map(rel2abs, fn_kwargs={"path_keys": data_path_keys, "dataset_dir": ds_dir})
+    else:
+        logger.warning(
+            "No global config passed into unify_iterable_format function. "
+            "Relative paths in the dataset might not be converted "
+            "to their absolute versions."
+        )
+    return dataset
@@ -1,14 +1,26 @@
 import copy
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 
 import numpy as np
 import pyarrow as pa
+import pyarrow.compute as pc
+import xxhash
 from loguru import logger
 
 from data_juicer import is_cuda_available
 from data_juicer.utils.constant import Fields
 from data_juicer.utils.mm_utils import size_to_bytes
-from data_juicer.utils.model_utils import free_models
+from data_juicer.utils.model_utils import is_api_model_key, release_models
+from data_juicer.utils.op_result_cache import (
+    OpResultCache,
+    normalize_op_args,
+    sample_digest,
+)
 from data_juicer.utils.process_utils import calculate_np
 from data_juicer.utils.registry import Registry
 
@@ -80,6 +92,16 @@ def catch_map_batches_exception(method, skip_op_error=False, op_name=None):
     return wrapper
 
 
+def is_batched(sample):
+    """Whether the sample is a batch in "dict of lists" format."""
+    val_iter = iter(sample.values())
+    first_val = next(val_iter)
+    if not isinstance(first_val, list):
+        return False
+    first_len = len(first_val)
+    return all(isinstance(val, list) and len(val) == first_len for val in val_iter)
+
+
 def catch_map_single_exception(method, return_sample=True, skip_op_error=False, op_name=None):
     """
     For single-map sample-level fault tolerance.
@@ -89,14 +111,6 @@ def catch_map_single_exception(method, return_sample=True, skip_op_error=False,
     if op_name is None:
         op_name = method.__name__
 
-    def is_batched(sample):
-        val_iter = iter(sample.values())
-        first_val = next(val_iter)
-        if not isinstance(first_val, list):
-            return False
-        first_len = len(first_val)
-        return all(isinstance(val, list) and len(val) == first_len for val in val_iter)
-
     @wraps(method)
     @convert_arrow_to_python
     def wrapper(sample, *args, **kwargs):
@@ -131,9 +145,273 @@ def catch_map_single_exception(method, return_sample=True, skip_op_error=False,
     return wrapper
 
 
+def catch_map_arrow_exception(method, return_mask=False, skip_op_error=False, op_name=None):
+    """
+    For Arrow-native batched-map batch-level fault tolerance. The input is
+    a pyarrow Table, and the whole batch is dropped if an error occurs.
+    """
+
+    if op_name is None:
+        op_name = method.__name__
+
+    @wraps(method)
+    def wrapper(table, *args, **kwargs):
+        try:
+            return method(table, *args, **kwargs)
+        except Exception as e:
+            if not skip_op_error:
+                raise
+            import traceback
+
+            from loguru import logger
+
+            logger.error(
+                f"An error occurred in {op_name} when processing "
+                f"{table.num_rows} samples -- {type(e)}: {e} -- "
+                f"{traceback.format_exc()}"
+            )
+            if return_mask:
+                return pa.repeat(False, table.num_rows)
+            return table.slice(0, 0)
+
+    return wrapper
+
+
+# the key of the fields deleted by the OP in the cached changes of a sample
+DELETED_FIELDS_KEY = "__dj__deleted_fields__"
+
+
+def _result_changes(old, new, field=None):
+    if field is not None:
+        old, new = old.get(field) or {}, new.get(field) or {}
+    changes = {}
+    for key, value in new.items():
+        try:
+            unchanged = key in old and bool(old[key] == value)
+        except Exception:
+            unchanged = False
+        if not unchanged:
+            changes[key] = value
+    deleted = [key for key in old if key not in new]
+    if deleted:
+        changes[DELETED_FIELDS_KEY] = deleted
+    return changes
+
+
+def _apply_result_changes(row, changes, field=None):
+    deleted = changes.pop(DELETED_FIELDS_KEY, [])
+    if field is not None:
+        row[field] = {key: value for key, value in (row.get(field) or {}).items() if key not in deleted}
+        row[field].update(changes)
+    else:
+        for key in deleted:
+            row.pop(key, None)
+        row.update(changes)
+    return row
+
+
+def add_new_columns(method, columns, index_key=None, batched=True, pass_indices=False):
+    """
+    Wrap a map function to add new columns to the samples before calling it,
+    which avoids extra passes over the whole dataset only to add columns.
+
+    :param method: the map function
+    :param columns: a dict from names of the new columns to their initial
+        values, which are copied for each sample
+    :param index_key: the name of the index column if not None. Then the
+        function should be mapped with indices, which are passed as the
+        second positional argument.
+    :param batched: whether the function is called on batches
+    :param pass_indices: whether to pass the indices to the function as well
+    """
+
+    @wraps(method)
+    def wrapper(samples, *args, **kwargs):
+        if index_key is not None:
+            indices = args[0]
+            if not pass_indices:
+                args = args[1:]
+        if isinstance(samples, pa.Table):
+            for name, value in columns.items():
+                samples = samples.append_column(name, pa.array([value] * samples.num_rows))
+            if index_key is not None:
+                samples = samples.append_column(index_key, pa.array(indices, type=pa.int64()))
+        elif batched:
+            num_samples = len(next(iter(samples.values()))) if samples else 0
+            for name, value in columns.items():
+                samples[name] = [copy.deepcopy(value) for _ in range(num_samples)]
+            if index_key is not None:
+                samples[index_key] = list(indices)
+        else:
+            for name, value in columns.items():
+                samples[name] = copy.deepcopy(value)
+            if index_key is not None:
+                samples[index_key] = indices
+        return method(samples, *args, **kwargs)
+
+    return wrapper
+
+
+def cache_op_results(method, op, field=None):
+    """
+    Wrap the runtime method of a Filter or Mapper with the persistent OP
+    result cache. Only the changes made by the OP to each sample are cached,
+    i.e. the new stats in the `field` for Filters, or the new and modified
+    fields for Mappers, and they are applied to the samples that hit the
+    cache instead of calling the method. The results of batches whose
+    numbers of samples are changed by the method are not cached.
+
+    :param method: the runtime method, e.g. compute_stats of Filters
+    :param op: the OP instance
+    :param field: the field storing results, e.g. Fields.stats for Filters.
+        If it's None, the whole samples are the results.
+    """
+
+    @wraps(method)
+    @convert_arrow_to_python
+    def wrapper(samples, *args, **kwargs):
+        if not op.is_result_cacheable():
+            return method(samples, *args, **kwargs)
+        # single-sample OPs might be called with batches of one sample
+        batched = op.is_batched_op() or is_batched(samples)
+        if batched:
+            keys = list(samples.keys())
+            num_samples = len(samples[keys[0]]) if keys else 0
+            rows = [{key: samples[key][i] for key in keys} for i in range(num_samples)]
+        else:
+            rows = [samples]
+        # snapshot the inputs, which might be modified in place
+        rows = [
+            {**row, field: copy.deepcopy(row.get(field))} if field is not None else copy.deepcopy(row) for row in rows
+        ]
+        cache = op.get_result_cache()
+        cache_keys = [op.result_cache_key(row) for row in rows]
+        results = cache.get_many(cache_keys)
+        missed = [i for i, res in enumerate(results) if res is None]
+        if not missed:
+            out_rows = [_apply_result_changes(row, res, field) for row, res in zip(rows, results)]
+            if not batched:
+                return out_rows[0]
+            out_keys = list(dict.fromkeys(key for row in out_rows for key in row))
+            return {key: [row.get(key) for row in out_rows] for key in out_keys}
+
+        if batched:
+            res_samples = method({key: [samples[key][i] for i in missed] for key in samples}, *args, **kwargs)
+            res_keys = list(res_samples.keys())
+            num_res = len(res_samples[res_keys[0]]) if res_keys else 0
+            res_rows = [{key: res_samples[key][i] for key in res_keys} for i in range(num_res)]
+        else:
+            res_samples = method(samples, *args, **kwargs)
+            res_rows = [res_samples]
+        if len(res_rows) != len(missed):
+            # e.g. the failed samples are skipped or the samples are split
+            if len(missed) == len(rows):
+                return res_samples
+            return method(samples, *args, **kwargs)
+        cache.put_many(
+            [(cache_keys[i], _result_changes(rows[i], res_row, field)) for i, res_row in zip(missed, res_rows)]
+        )
+        if len(missed) == len(rows):
+            return res_samples
+        out_rows = [
+            res_rows[missed.index(i)] if res is None else _apply_result_changes(rows[i], res, field)
+            for i, res in enumerate(results)
+        ]
+        out_keys = list(dict.fromkeys(key for row in out_rows for key in row))
+        return {key: [row.get(key) for row in out_rows] for key in out_keys}
+
+    return wrapper
+
+
+def fuse_compute_stats_and_filter(compute_stats, process, side_stream=None):
+    """
+    Fuse the runtime compute_stats and process methods of a Filter into one
+    batched map function, which computes the stats of a batch and only
+    returns the samples to keep. So the rejected samples are never written
+    to the mapped dataset.
+
+    :param compute_stats: the runtime compute_stats method
+    :param process: the runtime process method, which returns the boolean
+        indicators, or a mask for pyarrow Tables
+    :param side_stream: a SideStream to write the samples with stats before
+        filtering if not None. Then the function should be mapped with
+        indices, which are passed as the second positional argument.
+    """
+
+    @wraps(compute_stats)
+    def wrapper(samples, *args, **kwargs):
+        if side_stream is not None:
+            indices, *args = args
+        samples = compute_stats(samples, *args, **kwargs)
+        if isinstance(samples, pa.Table):
+            if side_stream is not None:
+                side_stream.write(indices[: samples.num_rows], samples.to_pylist())
+            if samples.num_rows == 0:
+                return samples
+            return samples.filter(process(samples))
+        keys = list(samples.keys())
+        num_samples = len(samples[keys[0]]) if keys else 0
+        if num_samples == 0:
+            return samples
+        if side_stream is not None:
+            side_stream.write(indices[:num_samples], convert_dict_list_to_list_dict(samples))
+        keep = process(samples)
+        # the samples are dropped if errors are skipped in process
+        keep = [False] * num_samples if isinstance(keep, dict) else list(keep)
+        return {key: [value for value, flag in zip(samples[key], keep) if flag] for key in keys}
+
+    return wrapper
+
+
+def update_stats_arrow(table, stats):
+    """
+    Merge the stats computed in Arrow-native OPs into the stats column of the
+    table. Stats that are already in the stats column won't be overwritten.
+
+    :param table: a pyarrow Table with the stats column.
+    :param stats: a dict from stats keys to the arrays of stats values.
+    :return: the table with the updated stats column.
+    """
+    if Fields.stats in table.column_names:
+        idx = table.column_names.index(Fields.stats)
+        column = table.column(idx).combine_chunks()
+        names = [field.name for field in column.type]
+        arrays = column.flatten()
+    else:
+        idx, names, arrays = None, [], []
+    for key, values in stats.items():
+        if key in names:
+            continue
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        names.append(key)
+        arrays.append(values)
+    column = pa.StructArray.from_arrays(arrays, names=names)
+    if idx is None:
+        return table.append_column(Fields.stats, column)
+    return table.set_column(idx, Fields.stats, column)
+
+
+def in_range_arrow(values, min_val, max_val):
+    """
+    Get the boolean mask of whether the values are within [min_val, max_val],
+    which is a common condition of Arrow-native Filters. Nulls are regarded
+    as out of range.
+    """
+    mask = pc.and_(pc.greater_equal(values, min_val), pc.less_equal(values, max_val))
+    return pc.fill_null(mask, False)
+
+
 class OP:
     _accelerator = "cpu"
     _batched_op = False
+    _arrow_op = False
+
+    # name patterns of the attributes that don't affect the cached results
+    _result_cache_ignored_attrs = ()
+    # the fields of samples that the OP reads, from which the keys of cached
+    # results are computed. All fields are read if it's None
+    _result_cache_read_keys = None
 
     def __init__(self, *args, **kwargs):
         """
@@ -154,6 +432,16 @@ class OP:
         :param index_key: index the samples before process if not None
         :param batch_size: the batch size for processing
         :param work_dir: the working directory for this operator
+        :param op_result_cache_dir: the directory of the persistent cache
+            of per-sample results of model-based OPs. If it's set, the
+            results of samples whose input fields are unchanged are reused
+            across runs. In default, it's None, which means no cache.
+        :param op_result_cache_size: the max size of the result cache, e.g.
+            "10GB". The least recently used results are evicted beyond it.
+        :param api_concurrency: the number of samples in a batch processed
+            concurrently by OPs calling models through APIs. If it's larger
+            than 1, such OPs process samples in batches, and fan the samples
+            of each batch out to concurrent API requests. In default, it's 1.
         """
         # init data keys
         self.text_key = kwargs.get("text_key", "text")
@@ -190,6 +478,21 @@ class OP:
 
         self.turbo = kwargs.get("turbo", False)
 
+        # persistent cache of per-sample results of model-based OPs
+        self.op_result_cache_dir = kwargs.get("op_result_cache_dir", None)
+        self.op_result_cache_size = kwargs.get("op_result_cache_size", "10GB")
+        if isinstance(self.op_result_cache_size, str):
+            self.op_result_cache_size = size_to_bytes(self.op_result_cache_size)
+        self._result_cache = None
+        self._result_cache_fingerprint = None
+
+        # process the samples of a batch concurrently for OPs calling APIs,
+        # whose throughput is bounded by the latency of requests. It only
+        # takes effect once an API model key is set, see `__setattr__`
+        self.api_concurrency = kwargs.get("api_concurrency", 1)
+        if self.api_concurrency > 1 and is_api_model_key(getattr(self, "model_key", None)):
+            self._batched_op = True
+
         # nested wrappers
         from data_juicer.core.data import wrap_func_with_nested_access
 
@@ -200,12 +503,79 @@ class OP:
                 method = wrap_func_with_nested_access(method)
                 setattr(self, name, method)
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        # the model keys are set by subclasses after the runtime wrappers are
+        # initialized, so they are re-initialized for the batched mode
+        if (
+            name == "model_key"
+            and getattr(self, "api_concurrency", 1) > 1
+            and is_api_model_key(value)
+            and not self._batched_op
+        ):
+            self._batched_op = True
+            self._init_runtime_wrappers()
+
+    def _init_runtime_wrappers(self):
+        """Initialize the runtime wrappers of the processing methods, which
+        depend on whether the OP is batched."""
+        pass
+
     def is_batched_op(self):
         return self._batched_op
 
+    def apply_single(self, method, samples, *args, **kwargs):
+        """
+        Apply a sample-level method to a list of samples. For OPs calling
+        models through APIs with `api_concurrency` > 1, the samples are
+        processed concurrently by a thread pool, which shares the connection
+        pool of the API client.
+
+        :param method: the sample-level method, e.g. `process_single`
+        :param samples: list of samples
+        :return: list of results in the order of samples
+        """
+        if self.api_concurrency > 1 and len(samples) > 1 and is_api_model_key(getattr(self, "model_key", None)):
+            with ThreadPoolExecutor(max_workers=min(self.api_concurrency, len(samples))) as executor:
+                return list(executor.map(lambda sample: method(sample, *args, **kwargs), samples))
+        return [method(sample, *args, **kwargs) for sample in samples]
+
+    def is_arrow_op(self):
+        """Whether this OP runs on pyarrow Tables with the Arrow-native
+        methods (e.g. `process_arrow`) instead of python dicts."""
+        return self._arrow_op and self.is_batched_op()
+
     def process(self, *args, **kwargs):
         raise NotImplementedError
 
+    def is_result_cacheable(self):
+        """Whether the per-sample results of this OP are cached. Only the
+        results of model-based OPs are cached, which are expensive to
+        compute."""
+        return self.op_result_cache_dir is not None and getattr(self, "model_key", None) is not None
+
+    def get_result_cache(self):
+        """Get the persistent result cache of this OP and the fingerprint
+        of its normalized arguments, which are initialized lazily after the
+        OP is initialized."""
+        if self._result_cache is None:
+            self._result_cache = OpResultCache(self.op_result_cache_dir, self.op_result_cache_size)
+            args = normalize_op_args(self, self._result_cache_ignored_attrs)
+            self._result_cache_fingerprint = xxhash.xxh3_128(
+                json.dumps({"op": self._name, "args": args}, sort_keys=True).encode("utf-8")
+            ).hexdigest()
+        return self._result_cache
+
+    def result_cache_key(self, sample):
+        """The key of the cached results of a sample, computed from the
+        fields of the sample that this OP reads. In default, they are all
+        fields including meta, stats and context, except the index column."""
+        media_keys = (self.image_key, self.audio_key, self.video_key)
+        read_keys = self._result_cache_read_keys
+        if read_keys is None:
+            read_keys = sorted(key for key in sample if key != self.index_key)
+        return OpResultCache.make_key(self._result_cache_fingerprint, sample_digest(sample, read_keys, media_keys))
+
     def use_cuda(self):
         return self.accelerator == "cuda" and is_cuda_available()
 
@@ -237,43 +607,73 @@ class OP:
         related_parameters.update(extra_param_dict)
         return related_parameters
 
-    def run(self, dataset):
+    def required_columns(self):
+        """
+        The columns required by this OP with their initial values, e.g. the
+        meta column for OPs that produce tags and the stats column for
+        Filters that produce stats.
+
+        :return: a dict from column names to initial values
+        """
+        columns = {}
+        if self._name in TAGGING_OPS.modules:
+            columns[Fields.meta] = {}
+        if isinstance(self, Filter) and self._name not in NON_STATS_FILTERS.modules:
+            columns[Fields.stats] = {}
+        return columns
+
+    def with_new_columns(self, dataset, function, batched=None, with_indices=False):
+        """
+        Wrap the map function of this OP to add the required columns missing
+        in the dataset, and the index column if index_key is set, to each
+        batch right before it's processed. So these columns are materialized
+        in the same map of the OP instead of separate passes over the whole
+        dataset.
+
+        :param dataset: the dataset to be mapped
+        :param function: the map function of this OP
+        :param batched: whether the function is called on batches. In
+            default, it's the same as the batch mode of OP methods in map.
+        :param with_indices: whether the function itself takes the indices
+            as the second positional argument
+        :return: the wrapped function and whether it requires indices
+        """
+        columns = {name: value for name, value in self.required_columns().items() if name not in dataset.features}
+        index_key = self.index_key if self.index_key is not None and self.index_key not in dataset.features else None
+        if not columns and index_key is None:
+            return function, with_indices
+        if batched is None:
+            batched = self.is_batched_op() or not self.turbo
+        function = add_new_columns(function, columns, index_key=index_key, batched=batched, pass_indices=with_indices)
+        return function, index_key is not None or with_indices
+
+    def run(self, dataset, lazy_columns=False):
+        """
+        Prepare the dataset for this OP.
+
+        :param dataset: the input dataset
+        :param lazy_columns: whether the required columns are added lazily
+            in the map of the OP by `with_new_columns`. If False, they are
+            added in a separate pass for OPs without row-wise maps.
+        :return: the prepared dataset
+        """
         from data_juicer.core.data import NestedDataset
 
         if not isinstance(dataset, NestedDataset):
             dataset = NestedDataset(dataset)
-        # add meta field for OPs that produce tags
-        from data_juicer.core.data import add_same_content_to_new_column
-
-        if self._name in TAGGING_OPS.modules and Fields.meta not in dataset.features:
-            dataset = dataset.map(
-                add_same_content_to_new_column,
-                fn_kwargs={"new_column_name": Fields.meta, "initial_value": {}},
-                num_proc=self.runtime_np(),
-                batch_size=self.batch_size,
-                desc="Adding new column for meta",
-            )
-        # add stats field for Filters that produce stats
-        if (
-            isinstance(self, Filter)
-            and self._name not in NON_STATS_FILTERS.modules
-            and Fields.stats not in dataset.features
-        ):
+        if lazy_columns:
+            return dataset
+        identity = lambda samples: samples  # noqa: E731
+        function, with_indices = self.with_new_columns(dataset, identity, batched=True)
+        if function is not identity:
             dataset = dataset.map(
-                add_same_content_to_new_column,
-                fn_kwargs={"new_column_name": Fields.stats, "initial_value": {}},
+                function,
+                batched=True,
+                with_indices=with_indices,
                 num_proc=self.runtime_np(),
                 batch_size=self.batch_size,
-                desc="Adding new column for stats",
+                desc="Adding new columns",
             )
-        if self.index_key is not None and self.index_key not in dataset.features:
-
-            def add_index(sample, idx):
-                sample[self.index_key] = idx
-                return sample
-
-            dataset = dataset.map(add_index, with_indices=True)
-
         return dataset
 
     def empty_history(self):
@@ -299,8 +699,9 @@ class Mapper(OP):
             queries and responses
         """
         super(Mapper, self).__init__(*args, **kwargs)
+        self._init_runtime_wrappers()
 
-        # runtime wrappers
+    def _init_runtime_wrappers(self):
         if self.is_batched_op():
             self.process = catch_map_batches_exception(
                 self.process_batched, skip_op_error=self.skip_op_error, op_name=self._name
@@ -309,6 +710,8 @@ class Mapper(OP):
             self.process = catch_map_single_exception(
                 self.process_single, skip_op_error=self.skip_op_error, op_name=self._name
             )
+        if self.op_result_cache_dir is not None:
+            self.process = cache_op_results(self.process, self)
 
     # set the process method is not allowed to be overridden
     @classmethod
@@ -331,9 +734,9 @@ class Mapper(OP):
         num_samples = len(samples[first_key])
 
         new_keys = {}
-        for i in range(num_samples):
-            this_sample = {key: samples[key][i] for key in keys}
-            res_sample = self.process_single(this_sample, *args, **kwargs)
+        this_samples = [{key: samples[key][i] for key in keys} for i in range(num_samples)]
+        res_samples = self.apply_single(self.process_single, this_samples, *args, **kwargs)
+        for i, res_sample in enumerate(res_samples):
             res_keys = res_sample.keys()
             for key in res_keys:
                 if key not in keys:
@@ -357,22 +760,52 @@ class Mapper(OP):
         """
         raise NotImplementedError
 
+    def process_arrow(self, table):
+        """
+        Arrow-native counterpart of `process_batched`, which is only used
+        when `is_arrow_op()` is True. The batch is passed as a pyarrow Table
+        without being converted to python objects.
+
+        :param table: a pyarrow Table of samples to process
+        :return: processed pyarrow Table
+        """
+        raise NotImplementedError
+
     def run(self, dataset, *, exporter=None, tracer=None):
-        dataset = super(Mapper, self).run(dataset)
-        new_dataset = dataset.map(
-            self.process,
-            num_proc=self.runtime_np(),
-            with_rank=self.use_cuda(),
-            batch_size=self.batch_size,
-            desc=self._name + "_process",
-        )
+        dataset = super(Mapper, self).run(dataset, lazy_columns=True)
+        if self.is_arrow_op():
+            process, with_indices = self.with_new_columns(
+                dataset,
+                catch_map_arrow_exception(self.process_arrow, skip_op_error=self.skip_op_error, op_name=self._name),
+            )
+            new_dataset = dataset.with_format("arrow").map(
+                process,
+                with_indices=with_indices,
+                num_proc=self.runtime_np(),
+                batch_size=self.batch_size,
+                desc=self._name + "_process",
+            )
+            new_dataset = new_dataset.with_format(None)
+        else:
+            process, with_indices = self.with_new_columns(dataset, self.process)
+            new_dataset = dataset.map(
+                process,
+                with_indices=with_indices,
+                num_proc=self.runtime_np(),
+                with_rank=self.use_cuda(),
+                batch_size=self.batch_size,
+                desc=self._name + "_process",
+            )
         if tracer:
             tracer.trace_mapper(self._name, dataset, new_dataset, self.text_key)
-        free_models()
+        release_models(self)
         return new_dataset
 
 
 class Filter(OP):
+    # thresholds are only used to filter samples by their stats
+    _result_cache_ignored_attrs = ("min_*", "max_*", "any_or_all", "reversed_range")
+
     def __init__(self, *args, **kwargs):
         """
         Base class that removes specific info.
@@ -392,8 +825,9 @@ class Filter(OP):
         """
         super(Filter, self).__init__(*args, **kwargs)
         self.stats_export_path = kwargs.get("stats_export_path", None)
+        self._init_runtime_wrappers()
 
-        # runtime wrappers
+    def _init_runtime_wrappers(self):
         if self.is_batched_op():
             self.compute_stats = catch_map_batches_exception(
                 self.compute_stats_batched, skip_op_error=self.skip_op_error, op_name=self._name
@@ -408,6 +842,8 @@ class Filter(OP):
             self.process = catch_map_single_exception(
                 self.process_single, return_sample=False, skip_op_error=self.skip_op_error, op_name=self._name
             )
+        if self.op_result_cache_dir is not None:
+            self.compute_stats = cache_op_results(self.compute_stats, self, field=Fields.stats)
 
     # set the process method is not allowed to be overridden
     @classmethod
@@ -427,9 +863,9 @@ class Filter(OP):
     def compute_stats_batched(self, samples, *args, **kwargs):
         keys = samples.keys()
         num_samples = len(samples[Fields.stats])
-        for i in range(num_samples):
-            this_sample = {key: samples[key][i] for key in keys}
-            res_sample = self.compute_stats_single(this_sample, *args, **kwargs)
+        this_samples = [{key: samples[key][i] for key in keys} for i in range(num_samples)]
+        res_samples = self.apply_single(self.compute_stats_single, this_samples, *args, **kwargs)
+        for i, res_sample in enumerate(res_samples):
             samples[Fields.stats][i] = res_sample[Fields.stats]
             if "context" in kwargs and kwargs["context"]:
                 samples[Fields.context][i] = res_sample[Fields.context]
@@ -460,24 +896,99 @@ class Filter(OP):
         """
         raise NotImplementedError
 
+    def compute_stats_arrow(self, table):
+        """
+        Arrow-native counterpart of `compute_stats_batched`, which is only
+        used when `is_arrow_op()` is True. Stats are usually computed with
+        pyarrow.compute kernels and merged into the stats column by
+        `update_stats_arrow`.
+
+        :param table: a pyarrow Table of samples.
+        :return: pyarrow Table with computed stats
+        """
+        raise NotImplementedError
+
+    def process_arrow(self, table):
+        """
+        Arrow-native counterpart of `process_batched`, which is only used
+        when `is_arrow_op()` is True.
+
+        :param table: a pyarrow Table of samples with computed stats.
+        :return: a boolean pyarrow Array, true for keeping and false for
+            filtering
+        """
+        raise NotImplementedError
+
     def run(self, dataset, *, exporter=None, tracer=None, reduce=True):
-        dataset = super(Filter, self).run(dataset)
-        new_dataset = dataset.map(
-            self.compute_stats,
-            num_proc=self.runtime_np(),
-            with_rank=self.use_cuda(),
-            batch_size=self.batch_size,
-            desc=self._name + "_compute_stats",
-        )
-        if exporter and self.stats_export_path is not None:
-            exporter.export_compute_stats(new_dataset, self.stats_export_path)
-        if reduce:
-            new_dataset = new_dataset.filter(
-                self.process, num_proc=self.runtime_np(), batch_size=self.batch_size, desc=self._name + "_process"
+        dataset = super(Filter, self).run(dataset, lazy_columns=True)
+        if self.is_arrow_op():
+            compute_stats = catch_map_arrow_exception(
+                self.compute_stats_arrow, skip_op_error=self.skip_op_error, op_name=self._name
             )
-            if tracer:
-                tracer.trace_filter(self._name, dataset, new_dataset)
-        free_models()
+            process = catch_map_arrow_exception(
+                self.process_arrow, return_mask=True, skip_op_error=self.skip_op_error, op_name=self._name
+            )
+            map_dataset = dataset.with_format("arrow")
+        else:
+            compute_stats, process = self.compute_stats, self.process
+            map_dataset = dataset
+        map_kwargs = dict(num_proc=self.runtime_np(), batch_size=self.batch_size)
+        if not self.is_arrow_op():
+            map_kwargs["with_rank"] = self.use_cuda()
+        export_stats = exporter and self.stats_export_path is not None
+        # samples can only be dropped in batched maps, which are not used by
+        # single-sample OPs in turbo mode
+        if reduce and (self.is_batched_op() or not self.turbo):
+            # compute stats and filter samples in one pass, so the rejected
+            # samples are never written. The samples with stats to export are
+            # written to a side stream along the way.
+            side_stream = None
+            if export_stats:
+                from data_juicer.core.exporter import SideStream
+
+                export_dir = os.path.dirname(os.path.abspath(self.stats_export_path))
+                os.makedirs(export_dir, exist_ok=True)
+                side_stream = SideStream(tempfile.mkdtemp(prefix=f".{self._name}_stats_", dir=export_dir))
+                # the side stream is only written when the map is computed
+                map_kwargs["load_from_cache_file"] = False
+            try:
+                function, with_indices = self.with_new_columns(
+                    dataset,
+                    fuse_compute_stats_and_filter(compute_stats, process, side_stream=side_stream),
+                    with_indices=side_stream is not None,
+                )
+                new_dataset = map_dataset.map(
+                    function, with_indices=with_indices, desc=self._name + "_compute_stats_and_process", **map_kwargs
+                )
+                if side_stream is not None:
+                    side_stream.close()
+                    # the samples in the side stream are in the same schema
+                    # as the kept ones
+                    features = new_dataset.features if len(new_dataset) > 0 else None
+                    stats_dataset = side_stream.to_dataset(features=features)
+                    if stats_dataset is not None:
+                        exporter.export_compute_stats(stats_dataset, self.stats_export_path)
+            finally:
+                if side_stream is not None:
+                    side_stream.close()
+                    shutil.rmtree(side_stream.dirname, ignore_errors=True)
+        else:
+            function, with_indices = self.with_new_columns(dataset, compute_stats)
+            new_dataset = map_dataset.map(
+                function, with_indices=with_indices, desc=self._name + "_compute_stats", **map_kwargs
+            )
+            if export_stats:
+                stats_dataset = new_dataset.with_format(None) if self.is_arrow_op() else new_dataset
+                exporter.export_compute_stats(stats_dataset, self.stats_export_path)
+            if reduce:
+                new_dataset = new_dataset.filter(
+                    process, num_proc=self.runtime_np(), batch_size=self.batch_size, desc=self._name + "_process"
+                )
+        if self.is_arrow_op():
+            new_dataset = new_dataset.with_format(None)
+        if reduce and tracer:
+            tracer.trace_filter(self._name, dataset, new_dataset)
+        release_models(self)
         return new_dataset
 
 
@@ -498,8 +1009,17 @@ class Deduplicator(OP):
         :param response_key: the key name of field that stores responses
         :param history_key: the key name of field that stores history of
             queries and responses
+        :param dedup_index_dir: the root directory of persistent dedup
+            indexes. If it's set, samples are also deduplicated against
+            the samples seen in former runs with the same OP config, and
+            the new samples are committed to the index after the processed
+            dataset is exported.
         """
         super(Deduplicator, self).__init__(*args, **kwargs)
+        self.dedup_index_dir = kwargs.get("dedup_index_dir", None)
+        # the index with keys staged in the last run, which are committed
+        # by commit_dedup_index
+        self._dedup_index = None
 
         # runtime wrappers
         if self.is_batched_op():
@@ -531,17 +1051,88 @@ class Deduplicator(OP):
         """
         raise NotImplementedError
 
+    def dedup_index_config(self):
+        """
+        The OP config that affects the hash values, which is used to
+        fingerprint the persistent dedup index.
+        """
+        params = getattr(self, "_init_parameters", {})
+        config = {key: val for key, val in params.items() if key not in ["args", "kwargs"]}
+        # the keys of the fields to hash are passed in kwargs
+        config["text_key"] = self.text_key
+        config["image_key"] = self.image_key
+        config["audio_key"] = self.audio_key
+        config["video_key"] = self.video_key
+        return config
+
+    def load_dedup_index(self):
+        """
+        Load the persistent dedup index of this OP. The keys added to it in
+        this run are only staged, and they are committed by
+        commit_dedup_index.
+
+        :return: a DedupIndex, or None if dedup_index_dir is not set.
+        """
+        if self.dedup_index_dir is None:
+            return None
+        from data_juicer.utils.dedup_index import DedupIndex
+
+        self._dedup_index = DedupIndex(self.dedup_index_dir, self._name, self.dedup_index_config())
+        return self._dedup_index
+
+    def commit_dedup_index(self):
+        """
+        Save the keys staged in the dedup index in the last run. It should
+        be called only after the processed dataset is exported, so that a
+        failed run won't leave the keys of samples that are never exported
+        in the index.
+        """
+        if self._dedup_index is None:
+            return
+        self._dedup_index.save()
+        self._dedup_index = None
+
+    def filter_by_dedup_index(self, dataset, index, keys, valid=None):
+        """
+        Remove samples whose keys are in the dedup index, and stage the keys
+        of the other samples in the index. It's used by exact-matching
+        deduplicators.
+
+        :param dataset: input dataset
+        :param index: the DedupIndex
+        :param keys: void array of the dedup keys of samples
+        :param valid: boolean array of whether each sample takes part in
+            deduplication. All samples take part in default.
+        :return: the dataset without samples seen in former runs.
+        """
+        seen = index.contains(keys)
+        if valid is not None:
+            seen &= valid
+            index.add(keys[valid & ~seen])
+        else:
+            index.add(keys[~seen])
+        if seen.any():
+            dataset = dataset.select(np.flatnonzero(~seen))
+        logger.info(f"Removed {int(seen.sum())} samples seen in the dedup index.")
+        return dataset
+
     def run(self, dataset, *, exporter=None, tracer=None, reduce=True):
-        dataset = super(Deduplicator, self).run(dataset)
+        dataset = super(Deduplicator, self).run(dataset, lazy_columns=True)
+        compute_hash, with_indices = self.with_new_columns(dataset, self.compute_hash)
         new_dataset = dataset.map(
-            self.compute_hash, num_proc=self.runtime_np(), with_rank=self.use_cuda(), desc=self._name + "_compute_hash"
+            compute_hash,
+            with_indices=with_indices,
+            num_proc=self.runtime_np(),
+            with_rank=self.use_cuda(),
+            batch_size=self.batch_size,
+            desc=self._name + "_compute_hash",
         )
         if reduce:
             show_num = tracer.show_num if tracer else 0
             new_dataset, dup_pairs = self.process(new_dataset, show_num)
             if tracer:
                 tracer.trace_deduplicator(self._name, dup_pairs)
-        free_models()
+        release_models(self)
         return new_dataset
 
 
@@ -574,12 +1165,24 @@ class Selector(OP):
         """
         raise NotImplementedError
 
+    def process_ray(self, dataset):
+        """
+        Ray dataset --> Ray dataset. Selectors without a distributed
+        implementation collect the dataset to the driver and run `process`.
+
+        :param dataset: input Ray dataset
+        :return: selected Ray dataset.
+        """
+        from data_juicer.core.data.ray_dataset import run_on_driver
+
+        return run_on_driver(dataset, self)
+
     def run(self, dataset, *, exporter=None, tracer=None):
         dataset = super(Selector, self).run(dataset)
         new_dataset = self.process(dataset)
         if tracer:
             tracer.trace_filter(self._name, dataset, new_dataset)
-        free_models()
+        release_models(self)
         return new_dataset
 
 
@@ -612,6 +1215,18 @@ class Grouper(OP):
         """
         raise NotImplementedError
 
+    def process_ray(self, dataset):
+        """
+        Ray dataset --> Ray dataset. Groupers without a distributed
+        implementation collect the dataset to the driver and run `process`.
+
+        :param dataset: input Ray dataset
+        :return: Ray dataset of batched samples.
+        """
+        from data_juicer.core.data.ray_dataset import run_on_driver
+
+        return run_on_driver(dataset, self)
+
     def run(self, dataset, *, exporter=None, tracer=None):
         dataset = super(Grouper, self).run(dataset)
         batched_samples = self.process(dataset)
@@ -620,7 +1235,7 @@ class Grouper(OP):
         new_dataset = NestedDataset.from_list(batched_samples)
         if tracer:
             tracer.trace_filter(self._name, dataset, new_dataset)
-        free_models()
+        release_models(self)
         return new_dataset
 
 
@@ -647,6 +1262,12 @@ class Aggregator(OP):
             self.process_single, skip_op_error=self.skip_op_error, op_name=self._name
         )
 
+    def required_columns(self):
+        # add batched meta field for OPs that produce aggregations
+        columns = super(Aggregator, self).required_columns()
+        columns[Fields.batch_meta] = {}
+        return columns
+
     def process_single(self, sample):
         """
         For sample level, batched sample --> sample,
@@ -657,21 +1278,23 @@ class Aggregator(OP):
         """
         raise NotImplementedError
 
-    def run(self, dataset, *, exporter=None, tracer=None):
-        dataset = super(Aggregator, self).run(dataset)
-        # add batched meta field for OPs that produce aggregations
-        if Fields.batch_meta not in dataset.features:
-            from data_juicer.core.data import add_same_content_to_new_column
+    def process_ray(self, dataset):
+        """
+        Ray dataset --> Ray dataset. Each row of the input is a batched
+        sample of a group, e.g. from the `map_groups` of a Grouper, so the
+        groups are aggregated by a row-wise map.
 
-            dataset = dataset.map(
-                add_same_content_to_new_column,
-                fn_kwargs={"new_column_name": Fields.batch_meta, "initial_value": {}},
-                num_proc=self.runtime_np(),
-                batch_size=self.batch_size,
-                desc="Adding new column for aggregation",
-            )
+        :param dataset: input Ray dataset of batched samples
+        :return: Ray dataset of aggregated samples.
+        """
+        return dataset.map_batches(self.process, batch_size=1, batch_format="pyarrow")
+
+    def run(self, dataset, *, exporter=None, tracer=None):
+        dataset = super(Aggregator, self).run(dataset, lazy_columns=True)
+        process, with_indices = self.with_new_columns(dataset, self.process)
         new_dataset = dataset.map(
-            self.process,
+            process,
+            with_indices=with_indices,
             num_proc=self.runtime_np(),
             with_rank=self.use_cuda(),
             batch_size=self.batch_size,
@@ -679,5 +1302,5 @@ class Aggregator(OP):
         )
         if tracer:
             tracer.trace_mapper(self._name, dataset, new_dataset, self.text_key)
-        free_models()
+        release_models(self)
         return new_dataset
@@ -10,6 +10,7 @@ from typing import Dict, Set
 import regex as re
 
 from data_juicer.utils.constant import HashKeys
+from data_juicer.utils.dedup_index import digest_keys
 
 from ..base_op import OPERATORS, Deduplicator
 
@@ -32,6 +33,7 @@ class DocumentDeduplicator(Deduplicator):
         :param args: extra args
         :param kwargs: extra args.
         """
+        self._init_parameters = self.remove_extra_parameters(locals())
         super().__init__(*args, **kwargs)
         self.lowercase = lowercase
         self.remove_non_character_regex = (
@@ -70,6 +72,10 @@ class DocumentDeduplicator(Deduplicator):
             open.
         :return: deduplicated dataset and the sampled duplicate pairs.
         """
+        index = self.load_dedup_index()
+        if index is not None:
+            dataset = self.filter_by_dedup_index(dataset, index, digest_keys(dataset[HashKeys.hash]))
+
         # no need to deduplicate because too few samples
         if len(dataset) <= 1:
             return dataset, {}
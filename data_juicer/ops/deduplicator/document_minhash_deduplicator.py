@@ -2,24 +2,27 @@
 # https://github.com/bigcode-project/bigcode-dataset/blob/main/near_deduplication/minhash_deduplication.py
 # --------------------------------------------------------
 
-import hashlib
-import struct
-from collections import defaultdict
+import os
+import shutil
+import tempfile
 from typing import Optional
 
 import numpy as np
+import pyarrow as pa
 import regex
+import xxhash
 from loguru import logger
 from pydantic import Field, PositiveInt
 from tqdm import tqdm
 from typing_extensions import Annotated
 
 from data_juicer.utils.constant import HashKeys
+from data_juicer.utils.dedup_index import uint64_to_keys
 from data_juicer.utils.lazy_loader import LazyLoader
 from data_juicer.utils.model_utils import prepare_sentencepiece_model
 
 from ..base_op import OPERATORS, Deduplicator
-from ..common.helper_func import UnionFind, split_on_whitespace
+from ..common.helper_func import ArrayUnionFind, split_on_whitespace
 
 integrate = LazyLoader("scipy.integrate")
 
@@ -27,21 +30,100 @@ OP_NAME = "document_minhash_deduplicator"
 
 MERSENNE_PRIME = np.uint64((1 << 61) - 1)
 MAX_HASH = np.uint64((1 << 32) - 1)
+# max number of shingles permuted together in one matrix operation, which
+# bounds the size of the temp matrix to 8 * 4096 * num_permutations bytes
+MAX_SHINGLES_PER_CHUNK = 1 << 12
+KEY_MIX_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# the record of a band key spilled to disk in the external sort mode
+SPILL_RECORD_DTYPE = np.dtype([("band", np.uint32), ("key", np.uint64), ("doc", np.int64)])
 
 
-def sha1_hash32(data):
+def xxh32_hashes(tokens):
     """
-    Directly taken from datasketch package to avoid dependency.
+    Hash the tokens with the non-cryptographic xxHash32, which is much
+    faster than SHA-1 for short shingles.
 
-    Parameters
-    ----------
-    data : bytes
+    :param tokens: a collection of bytes
+    :return: a uint64 array of 32-bit hash values
+    """
+    return np.fromiter(map(xxhash.xxh32_intdigest, tokens), dtype=np.uint64, count=len(tokens))
+
+
+def compute_minhash_matrix(token_hashes, perm_a, perm_b):
+    """
+    Compute the minhash values of a batch of samples. The permutations of
+    the shingle hashes of many samples are computed together in one matrix
+    operation, and the min values of each sample are reduced by the segments
+    of its shingles.
+
+    :param token_hashes: list of shingle hash arrays of samples
+    :param perm_a: uint64 array of the multipliers of the permutations
+    :param perm_b: uint64 array of the offsets of the permutations
+    :return: uint64 matrix of minhash values in shape of
+        (num_samples, num_permutations). Samples without any shingles get
+        the max hash values.
+    """
+    minhashes = np.full((len(token_hashes), len(perm_a)), MAX_HASH, dtype=np.uint64)
+
+    def _compute_chunk(chunk):
+        hv = np.concatenate([token_hashes[idx] for idx in chunk])
+        starts = np.cumsum([0] + [len(token_hashes[idx]) for idx in chunk[:-1]])
+        phv = np.bitwise_and((hv[:, None] * perm_a + perm_b) % MERSENNE_PRIME, MAX_HASH)
+        minhashes[chunk] = np.minimum.reduceat(phv, starts, axis=0)
+
+    chunk, chunk_size = [], 0
+    for idx, hv in enumerate(token_hashes):
+        if len(hv) == 0:
+            continue
+        if chunk and chunk_size + len(hv) > MAX_SHINGLES_PER_CHUNK:
+            _compute_chunk(chunk)
+            chunk, chunk_size = [], 0
+        chunk.append(idx)
+        chunk_size += len(hv)
+    if chunk:
+        _compute_chunk(chunk)
+    return minhashes
+
+
+def binary_to_matrix(column, width):
+    """
+    Get a zero-copy uint8 matrix view of a binary Arrow array whose values
+    are all in the same width.
+
+    :param column: a pyarrow binary Array or ChunkedArray
+    :param width: the width in bytes of each value
+    :return: uint8 matrix in shape of (len(column), width)
+    """
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    offsets = np.frombuffer(column.buffers()[1], dtype=np.int32)[column.offset : column.offset + len(column) + 1]
+    if offsets[-1] - offsets[0] != len(column) * width:
+        raise ValueError(f"Values of the binary column are not all in the width of {width} bytes.")
+    data = np.frombuffer(column.buffers()[2], dtype=np.uint8) if len(column) > 0 else np.empty(0, dtype=np.uint8)
+    return data[offsets[0] : offsets[-1]].reshape(len(column), width)
+
+
+def band_keys_of(band_values):
+    """
+    Combine the minhash values in a band into a 64-bit key. Two values are
+    packed into the key losslessly, and more values are mixed by a
+    multiply-xorshift hash.
 
-    Returns
-    -------
-    int
+    :param band_values: uint64 matrix of 32-bit minhash values in shape of
+        (num_samples, num_rows_per_band)
+    :return: uint64 array of band keys
     """
-    return struct.unpack("<I", hashlib.sha1(data).digest()[:4])[0]
+    num_rows = band_values.shape[1]
+    if num_rows == 1:
+        return band_values[:, 0].copy()
+    if num_rows == 2:
+        return (band_values[:, 0] << np.uint64(32)) | band_values[:, 1]
+    keys = np.zeros(len(band_values), dtype=np.uint64)
+    for j in range(num_rows):
+        keys ^= band_values[:, j]
+        keys *= KEY_MIX_MULTIPLIER
+        keys ^= keys >> np.uint64(29)
+    return keys
 
 
 def optimal_param(
@@ -105,6 +187,8 @@ class DocumentMinhashDeduplicator(Deduplicator):
     kept in the final dataset.
     """
 
+    _batched_op = True
+
     def __init__(
         self,
         tokenization: str = "space",
@@ -116,6 +200,8 @@ class DocumentMinhashDeduplicator(Deduplicator):
         num_bands: Optional[PositiveInt] = None,
         num_rows_per_band: Optional[PositiveInt] = None,
         tokenizer_model: Optional[str] = None,
+        external_sort: bool = False,
+        num_sort_partitions: PositiveInt = 64,
         *args,
         **kwargs,
     ):
@@ -149,7 +235,18 @@ class DocumentMinhashDeduplicator(Deduplicator):
             params computation algorithm
         :param tokenizer_model: path for the sentencepiece model, used for
             sentencepiece tokenization.
+        :param external_sort: whether to cluster in the external memory
+            mode for corpora whose band keys don't fit in memory. The
+            (band_id, band_key, doc_id) records are spilled to partitioned
+            files on disk, and each partition is sorted and clustered
+            separately, so only the union-find parent array (8 bytes per
+            sample) and one partition are in memory at a time.
+        :param num_sort_partitions: number of on-disk partitions in the
+            external sort mode. Each partition takes about
+            20 * num_samples * num_bands / num_sort_partitions bytes of
+            disk and memory when sorted.
         """
+        self._init_parameters = self.remove_extra_parameters(locals())
         super().__init__(*args, **kwargs)
         # about minhash computation
         self.tokenization = tokenization
@@ -181,6 +278,9 @@ class DocumentMinhashDeduplicator(Deduplicator):
         self.num_bands = num_bands
         self.num_rows_per_band = num_rows_per_band
 
+        self.external_sort = external_sort
+        self.num_sort_partitions = num_sort_partitions
+
         # initialize deduplication parameters
         # check number of bands and rows
         if self.num_bands is None or self.num_rows_per_band is None:
@@ -193,7 +293,6 @@ class DocumentMinhashDeduplicator(Deduplicator):
         self.hash_ranges = [
             (i * self.num_rows_per_band, (i + 1) * self.num_rows_per_band) for i in range(self.num_bands)
         ]
-        self.hash_tables = [defaultdict(set) for _ in range(self.num_bands)]
 
         # generate permutations
         gen = np.random.RandomState(seed=42)
@@ -208,19 +307,13 @@ class DocumentMinhashDeduplicator(Deduplicator):
             dtype=np.uint64,
         ).T
 
-    def compute_hash(self, sample):
+    def get_shingles(self, text):
         """
-        Compute minhash values for the sample.
+        Get the set of shingles of the text for the tokenization method.
 
-        :param sample: input sample
-        :return: sample with minhash value.
+        :param text: input text
+        :return: set of encoded shingles
         """
-        # check if it's computed already
-        if HashKeys.minhash in sample:
-            return sample
-
-        text = sample[self.text_key]
-
         if self.lowercase:
             text = text.lower()
         if self.ignore_pattern:
@@ -249,13 +342,168 @@ class DocumentMinhashDeduplicator(Deduplicator):
             }
         else:
             raise NotImplementedError(f"Unimplemented tokenization method [{self.tokenization}]")
+        return tokens
+
+    def compute_minhashes(self, token_hashes):
+        """
+        Compute the minhash values of a batch of samples.
 
-        # compute minhash value
-        hv = np.fromiter((sha1_hash32(token) for token in tokens), dtype=np.uint64, count=len(tokens))
-        phv = np.bitwise_and((hv[:, None] * self.perm_a + self.perm_b) % MERSENNE_PRIME, MAX_HASH)
-        hash_values = phv.min(axis=0)
-        sample[HashKeys.minhash] = [bytes(hash_values[start:end].byteswap().data) for start, end in self.hash_ranges]
-        return sample
+        :param token_hashes: list of shingle hash arrays of samples
+        :return: uint64 matrix of minhash values in shape of
+            (num_samples, num_permutations). Samples without any shingles
+            get the max hash values.
+        """
+        return compute_minhash_matrix(token_hashes, self.perm_a, self.perm_b)
+
+    def compute_hash(self, samples):
+        """
+        Compute minhash values for the batch of samples.
+
+        :param samples: input samples
+        :return: samples with minhash values, each of which is the
+            big-endian uint32 values of all bands in fixed-width bytes.
+        """
+        # check if it's computed already
+        if HashKeys.minhash in samples:
+            return samples
+
+        token_hashes = [xxh32_hashes(self.get_shingles(text)) for text in samples[self.text_key]]
+        minhashes = self.compute_minhashes(token_hashes)
+        band_hashes = minhashes[:, : self.num_bands * self.num_rows_per_band].astype(">u4")
+        samples[HashKeys.minhash] = [row.tobytes() for row in band_hashes]
+        return samples
+
+    def iter_band_keys(self, dataset, batch_size=100000):
+        """
+        Read the minhash values from the dataset batch by batch and compute
+        the 64-bit keys of all bands.
+
+        :param dataset: dataset with computed minhash values
+        :param batch_size: number of samples read at a time
+        :return: iterator of the offset of each batch and its uint64 matrix
+            of band keys in shape of (num_bands, batch_size)
+        """
+        num_values = self.num_bands * self.num_rows_per_band
+        offset = 0
+        for table in tqdm(
+            dataset.with_format("arrow").select_columns([HashKeys.minhash]).iter(batch_size=batch_size),
+            total=(len(dataset) + batch_size - 1) // batch_size,
+            dynamic_ncols=True,
+            desc="Iterating MinHashes of samples...",
+        ):
+            values = binary_to_matrix(table[HashKeys.minhash], num_values * 4).view(">u4").astype(np.uint64)
+            band_keys = np.empty((self.num_bands, len(values)), dtype=np.uint64)
+            for band_idx, (start, end) in enumerate(self.hash_ranges):
+                band_keys[band_idx] = band_keys_of(values[:, start:end])
+            yield offset, band_keys
+            offset += len(values)
+
+    def cluster_in_memory(self, dataset):
+        """
+        Cluster samples by sorting the band keys of each band in memory and
+        unioning samples with the same key in any band.
+
+        :param dataset: dataset with computed minhash values
+        :return: the ArrayUnionFind of samples
+        """
+        band_keys = np.empty((self.num_bands, len(dataset)), dtype=np.uint64)
+        for offset, keys in self.iter_band_keys(dataset):
+            band_keys[:, offset : offset + keys.shape[1]] = keys
+
+        union_find = ArrayUnionFind(len(dataset))
+        for keys in tqdm(band_keys, dynamic_ncols=True, desc="Clustering"):
+            union_find.union_by_keys(keys)
+        return union_find
+
+    def cluster_external(self, dataset):
+        """
+        Cluster samples in the external memory mode. The band key records
+        are spilled to partitions on disk by their keys, so records with the
+        same band key are in the same partition. Then each partition is
+        loaded and sorted by (band_id, band_key), and samples in each run of
+        equal records are unioned.
+
+        :param dataset: dataset with computed minhash values
+        :return: the ArrayUnionFind of samples
+        """
+        spill_dir = tempfile.mkdtemp(prefix="minhash_spill_", dir=self.work_dir)
+        try:
+            paths = [os.path.join(spill_dir, f"part-{i:05d}.bin") for i in range(self.num_sort_partitions)]
+            files = [open(path, "wb") for path in paths]
+            try:
+                for offset, band_keys in self.iter_band_keys(dataset):
+                    records = np.empty(band_keys.shape, dtype=SPILL_RECORD_DTYPE)
+                    records["band"] = np.arange(self.num_bands, dtype=np.uint32)[:, None]
+                    records["key"] = band_keys
+                    records["doc"] = np.arange(offset, offset + band_keys.shape[1], dtype=np.int64)
+                    records = records.ravel()
+                    partitions = records["key"] % np.uint64(self.num_sort_partitions)
+                    order = np.argsort(partitions, kind="stable")
+                    bounds = np.searchsorted(partitions[order], np.arange(self.num_sort_partitions + 1))
+                    records = records[order]
+                    for part_idx, fout in enumerate(files):
+                        records[bounds[part_idx] : bounds[part_idx + 1]].tofile(fout)
+            finally:
+                for fout in files:
+                    fout.close()
+
+            union_find = ArrayUnionFind(len(dataset))
+            for path in tqdm(paths, dynamic_ncols=True, desc="Clustering partitions"):
+                records = np.fromfile(path, dtype=SPILL_RECORD_DTYPE)
+                os.remove(path)
+                if len(records) == 0:
+                    continue
+                order = np.lexsort((records["key"], records["band"]))
+                records = records[order]
+                is_start = np.ones(len(records), dtype=bool)
+                is_start[1:] = (records["band"][1:] != records["band"][:-1]) | (
+                    records["key"][1:] != records["key"][:-1]
+                )
+                union_find.union_runs(records["doc"], is_start)
+                del records, order, is_start
+            return union_find
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    def dedup_index_config(self):
+        config = super().dedup_index_config()
+        # they don't affect the results
+        config.pop("external_sort", None)
+        config.pop("num_sort_partitions", None)
+        config["num_bands"] = self.num_bands
+        config["num_rows_per_band"] = self.num_rows_per_band
+        # the band keys depend on how the texts are tokenized
+        config["tokenization"] = self.tokenization
+        config["window_size"] = self.window_size
+        config["lowercase"] = self.lowercase
+        config["ignore_pattern"] = self.ignore_pattern.pattern if self.ignore_pattern else None
+        return config
+
+    def query_dedup_index(self, dataset, index, union_find):
+        """
+        Query the band keys of samples against the dedup index, and stage
+        them in the index. Samples in the same cluster
+        as any sample similar to a sample in the index are regarded as seen
+        in former runs.
+
+        :param dataset: dataset with computed minhash values
+        :param index: the DedupIndex
+        :param union_find: the ArrayUnionFind of samples
+        :return: boolean array of whether each sample is seen
+        """
+        seen = np.zeros(len(dataset), dtype=bool)
+        for offset, band_keys in self.iter_band_keys(dataset):
+            # mix the band id into the keys so that keys of different bands
+            # are different
+            band_ids = np.arange(1, self.num_bands + 1, dtype=np.uint64)[:, None]
+            keys = uint64_to_keys((band_keys ^ (band_ids * KEY_MIX_MULTIPLIER)).ravel())
+            hit = index.contains(keys).reshape(band_keys.shape).any(axis=0)
+            seen[offset : offset + band_keys.shape[1]] = hit
+            index.add(keys)
+        roots = union_find.find(np.arange(len(dataset)))
+        seen_clusters = np.zeros(len(dataset), dtype=bool)
+        seen_clusters[roots[seen]] = True
+        return seen_clusters[roots]
 
     def process(self, dataset, show_num=0):
         """
@@ -266,46 +514,38 @@ class DocumentMinhashDeduplicator(Deduplicator):
             open.
         :return: deduplicated dataset and the sampled duplicate pairs.
         """
+        index = self.load_dedup_index()
         # no need to deduplicate because too few samples
-        if len(dataset) <= 1:
+        if len(dataset) <= 1 and index is None:
             return dataset, {}
 
-        minhashes = dataset[HashKeys.minhash]
-        # remove bytes minhash column otherwise unexpected error would occur
-        # when exporting the processed dataset
-        dataset = dataset.remove_columns([HashKeys.minhash])
-
-        # make clusters -- construct the minhash lookup tables of seg to ids
+        # make clusters -- sort the band keys of each band and union samples
+        # with the same key in any band
         logger.info(f"Start clustering for {len(dataset)} samples...")
-        batch_size = 10000
-        for i in tqdm(
-            range(0, len(minhashes), batch_size), dynamic_ncols=True, desc="Iterating MinHashes of samples..."
-        ):
-            batch = minhashes[i : i + batch_size]
-            for idx, hs in enumerate(batch):
-                for h, hashtable in zip(hs, self.hash_tables):
-                    hashtable[h].add(idx + i)
-
-        # using UnionFind set to union samples within the same clusters
-        union_find = UnionFind()
-        for table in tqdm(self.hash_tables, dynamic_ncols=True, desc="Clustering"):
-            for cluster in table.values():
-                if len(cluster) <= 1:
-                    continue
-                idx = min(cluster)
-                for x in cluster:
-                    union_find.union(x, idx)
+        if self.external_sort:
+            union_find = self.cluster_external(dataset)
+        else:
+            union_find = self.cluster_in_memory(dataset)
+        is_root = union_find.roots_mask()
         logger.info(
-            f"There are {len(set(union_find.parent.values()))} "
+            f"There are {len(np.unique(union_find.parent[~is_root]))} "
             f"clusters that includes multiple near-duplicate samples."
         )
+        keep = is_root
+        if index is not None:
+            seen = self.query_dedup_index(dataset, index, union_find)
+            logger.info(f"{int(seen.sum())} samples are similar to the samples in the dedup index.")
+            keep = is_root & ~seen
+        # remove bytes minhash column otherwise unexpected error would occur
+        # when exporting the processed dataset
+        dataset = dataset.remove_columns([HashKeys.minhash])
 
         # record the duplicate sample pairs
         dup_pairs = {}
         if show_num > 0:
-            for i in range(len(dataset)):
-                cluster_idx = union_find.find(i)
-                if cluster_idx not in dup_pairs and cluster_idx != i:
+            for i in np.flatnonzero(~is_root).tolist():
+                cluster_idx = int(union_find.parent[i])
+                if cluster_idx not in dup_pairs:
                     dup_pairs[cluster_idx] = [
                         dataset[cluster_idx],
                         dataset[i],
@@ -317,13 +557,7 @@ class DocumentMinhashDeduplicator(Deduplicator):
         # including:
         # 1. samples that form a cluster by themselves
         # 2. the first sample in a cluster that includes multiple samples
-        def _filter_minhash_dup_helper(sample, index):
-            return union_find.find(index) == index
-
-        dataset = dataset.filter(
-            _filter_minhash_dup_helper,
-            with_indices=True,
-        )
+        dataset = dataset.select(np.flatnonzero(keep))
         logger.info(f"Keep {len(dataset)} samples after MinHash dedup.")
 
         return dataset, dup_pairs
@@ -2,8 +2,10 @@
 # https://github.com/bigscience-workshop/data-preparation
 # --------------------------------------------------------
 
-from collections import defaultdict, deque
-from typing import Dict, Optional, Set
+from functools import partial, reduce
+from itertools import combinations
+from operator import or_
+from typing import Optional
 
 import numpy as np
 import regex
@@ -11,15 +13,215 @@ from loguru import logger
 from pydantic import PositiveInt
 
 from data_juicer.utils.constant import HashKeys
+from data_juicer.utils.dedup_index import keys_to_uint64, uint64_to_keys
 from data_juicer.utils.lazy_loader import LazyLoader
 
 from ..base_op import OPERATORS, Deduplicator
-from ..common.helper_func import split_on_whitespace
+from ..common.helper_func import ArrayUnionFind, split_on_whitespace
 
 simhash = LazyLoader("simhash", "simhash-pybind")
 
 OP_NAME = "document_simhash_deduplicator"
 
+# number of set bits of each byte value
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# the hash values of the table queried by the current worker process
+_TABLE_VALUES = None
+
+
+def popcount64(values):
+    """Count the set bits of each value in a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def table_masks(num_blocks, hamming_distance):
+    """
+    Get the bit masks of the multi-index tables. The 64 bits of simhash
+    values are split into `num_blocks` blocks. If the hamming distance of two
+    values is at most `hamming_distance`, they must be equal in at least
+    `num_blocks - hamming_distance` blocks, so there is one table for each
+    combination of that many blocks.
+
+    :param num_blocks: number of blocks of simhash values
+    :param hamming_distance: the max hamming distance of matches
+    :return: list of uint64 masks, one for each table
+    """
+    if hamming_distance >= num_blocks:
+        raise ValueError(
+            f"The hamming distance [{hamming_distance}] should be less than " f"the number of blocks [{num_blocks}]."
+        )
+    bounds = [64 * i // num_blocks for i in range(num_blocks + 1)]
+    block_masks = [((1 << (hi - lo)) - 1) << lo for lo, hi in zip(bounds[:-1], bounds[1:])]
+    return [np.uint64(reduce(or_, blocks)) for blocks in combinations(block_masks, num_blocks - hamming_distance)]
+
+
+def table_blocks(num_blocks, hamming_distance):
+    """
+    Get the bit layouts of the multi-index tables persisted in the dedup
+    index. In the table of each combination of
+    `num_blocks - hamming_distance` blocks, the bits of these blocks are
+    moved to the top of hash values, so the values sorted in the table are
+    grouped by the bits under the mask of the table. The permutation of bits
+    doesn't change hamming distances.
+
+    :param num_blocks: number of blocks of simhash values
+    :param hamming_distance: the max hamming distance of matches
+    :return: list of (blocks, prefix_bits) for each table, where blocks is
+        the list of (low, high) bit bounds of blocks in the permuted order,
+        and prefix_bits is the number of bits of the selected blocks
+    """
+    if hamming_distance >= num_blocks:
+        raise ValueError(
+            f"The hamming distance [{hamming_distance}] should be less than " f"the number of blocks [{num_blocks}]."
+        )
+    bounds = [64 * i // num_blocks for i in range(num_blocks + 1)]
+    blocks = list(zip(bounds[:-1], bounds[1:]))
+    tables = []
+    for selected in combinations(blocks, num_blocks - hamming_distance):
+        others = [block for block in blocks if block not in selected]
+        tables.append((list(selected) + others, sum(hi - lo for lo, hi in selected)))
+    return tables
+
+
+def permute_bits(values, blocks):
+    """Move the bits of blocks of uint64 values to the order of `blocks`
+    from the top bits."""
+    permuted = np.zeros(len(values), dtype=np.uint64)
+    shift = 64
+    for lo, hi in blocks:
+        shift -= hi - lo
+        block = (values >> np.uint64(lo)) & np.uint64((1 << (hi - lo)) - 1)
+        permuted |= block << np.uint64(shift)
+    return permuted
+
+
+def build_table(segment, blocks):
+    """Build a multi-index table from a segment of the dedup index."""
+    return np.sort(permute_bits(keys_to_uint64(segment), blocks))
+
+
+def query_table(table, values, blocks, prefix_bits, hamming_distance):
+    """
+    Query hash values against a persisted multi-index table. The run of
+    table values with the same top bits as each query is found by binary
+    search, and only the values in the run are compared.
+
+    :param table: sorted uint64 array of permuted hash values
+    :param values: uint64 array of hash values to query
+    :param blocks: the bit layout of the table
+    :param prefix_bits: number of top bits to match exactly
+    :param hamming_distance: the max hamming distance of matches
+    :return: boolean array of whether each value has a match in the table
+    """
+    permuted = permute_bits(values, blocks)
+    low_mask = np.uint64((1 << (64 - prefix_bits)) - 1)
+    starts = np.searchsorted(table, permuted & ~low_mask, side="left")
+    ends = np.searchsorted(table, permuted | low_mask, side="right")
+    matched = np.zeros(len(values), dtype=bool)
+    offset = 0
+    active = np.flatnonzero(starts < ends)
+    while len(active) > 0:
+        distances = popcount64(np.asarray(table[starts[active] + offset]) ^ permuted[active])
+        matched[active[distances <= hamming_distance]] = True
+        offset += 1
+        active = active[~matched[active] & (starts[active] + offset < ends[active])]
+    return matched
+
+
+def find_matches_in_table(values, mask, hamming_distance):
+    """
+    Find the matches of hash values in one table. Values are sorted by
+    their bits under the mask, and only the values in the same run of equal
+    masked bits are compared, by vectorized scans over the offsets in runs.
+
+    :param values: uint64 array of unique hash values
+    :param mask: the bit mask of the table
+    :param hamming_distance: the max hamming distance of matches
+    :return: union-find of the values, where matched values are unioned
+    """
+    num = len(values)
+    union_find = ArrayUnionFind(num)
+    keys = values & mask
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    sorted_values = values[order]
+    is_start = np.ones(num, dtype=bool)
+    is_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    starts = np.flatnonzero(is_start)
+    ends = np.repeat(np.append(starts[1:], num), np.diff(np.append(starts, num)))
+    # number of values after each value in its run
+    remaining = ends - np.arange(num) - 1
+
+    # compare each value with the one `offset` positions after it in the same
+    # run, and union the matched pairs once there are enough of them to
+    # bound the memory usage
+    pending_x, pending_y, num_pending = [], [], 0
+    offset = 1
+    active = np.flatnonzero(remaining >= offset)
+    while len(active) > 0:
+        distances = popcount64(sorted_values[active] ^ sorted_values[active + offset])
+        matched = active[distances <= hamming_distance]
+        if len(matched) > 0:
+            pending_x.append(order[matched])
+            pending_y.append(order[matched + offset])
+            num_pending += len(matched)
+        if num_pending >= num:
+            union_find.union_pairs(np.concatenate(pending_x), np.concatenate(pending_y))
+            pending_x, pending_y, num_pending = [], [], 0
+        offset += 1
+        active = active[remaining[active] >= offset]
+    if num_pending > 0:
+        union_find.union_pairs(np.concatenate(pending_x), np.concatenate(pending_y))
+    return union_find
+
+
+def _init_table_worker(values):
+    global _TABLE_VALUES
+    _TABLE_VALUES = values
+
+
+def _run_table_worker(mask, hamming_distance):
+    union_find = find_matches_in_table(_TABLE_VALUES, mask, hamming_distance)
+    union_find.compress()
+    # only the values unioned with others are returned
+    members = np.flatnonzero(union_find.parent != np.arange(len(union_find.parent)))
+    return members, union_find.parent[members]
+
+
+def find_clusters(values, num_blocks, hamming_distance, num_proc=1):
+    """
+    Cluster the hash values whose hamming distances are within the threshold
+    transitively, with multi-index tables. Tables are queried in parallel
+    processes if num_proc > 1, and their results are merged into one
+    array-backed union-find.
+
+    :param values: uint64 array of unique hash values
+    :param num_blocks: number of blocks of simhash values
+    :param hamming_distance: the max hamming distance of matches
+    :param num_proc: number of processes to query tables
+    :return: union-find of the values
+    """
+    masks = table_masks(num_blocks, hamming_distance)
+    union_find = ArrayUnionFind(len(values))
+    num_proc = min(num_proc, len(masks))
+    if num_proc <= 1:
+        _init_table_worker(values)
+        results = (_run_table_worker(mask, hamming_distance) for mask in masks)
+        for members, roots in results:
+            union_find.union_pairs(members, roots)
+        _init_table_worker(None)
+        return union_find
+
+    import multiprocess as mp
+
+    with mp.Pool(num_proc, initializer=_init_table_worker, initargs=(values,)) as pool:
+        for members, roots in pool.starmap(_run_table_worker, [(mask, hamming_distance) for mask in masks]):
+            union_find.union_pairs(members, roots)
+    return union_find
+
 
 @OPERATORS.register_module(OP_NAME)
 class DocumentSimhashDeduplicator(Deduplicator):
@@ -56,6 +258,7 @@ class DocumentSimhashDeduplicator(Deduplicator):
             deduplication. This threshold should be always less than
             num_blocks
         """
+        self._init_parameters = self.remove_extra_parameters(locals())
         # about simhash computation
         super().__init__(*args, **kwargs)
         self.tokenization = tokenization
@@ -119,6 +322,34 @@ class DocumentSimhashDeduplicator(Deduplicator):
         sample[HashKeys.simhash] = str(np.uint64(simhash.compute(map(simhash.unsigned_hash, tokens))))
         return sample
 
+    def dedup_index_config(self):
+        config = super().dedup_index_config()
+        # the simhash values depend on how the texts are tokenized
+        config["tokenization"] = self.tokenization
+        config["window_size"] = self.window_size
+        config["lowercase"] = self.lowercase
+        config["ignore_pattern"] = self.ignore_pattern.pattern if self.ignore_pattern else None
+        return config
+
+    def query_dedup_index(self, values, index):
+        """
+        Query hash values against the multi-index tables of the dedup
+        index. The tables are persisted next to the segments of the index,
+        so the cost is in proportion to the number of values to query
+        rather than the size of the index.
+
+        :param values: uint64 array of hash values
+        :param index: the DedupIndex
+        :return: boolean array of whether each value is similar to any
+            value in the index
+        """
+        seen = np.zeros(len(values), dtype=bool)
+        for i, (blocks, prefix_bits) in enumerate(table_blocks(self.num_blocks, self.hamming_distance)):
+            for table in index.load_views(f"table{i}", partial(build_table, blocks=blocks)):
+                rest = np.flatnonzero(~seen)
+                seen[rest] = query_table(table, values[rest], blocks, prefix_bits, self.hamming_distance)
+        return seen
+
     def process(self, dataset, show_num=0):
         """
         For doc-level, dataset --> dataset.
@@ -128,96 +359,65 @@ class DocumentSimhashDeduplicator(Deduplicator):
             open.
         :return: deduplicated dataset and the sampled duplicate pairs.
         """
+        index = self.load_dedup_index()
         # no need to deduplicate because too few samples
-        if len(dataset) <= 1:
+        if len(dataset) == 0 or (len(dataset) == 1 and index is None):
             return dataset, {}
 
-        # find matches
-        logger.info(f"Start querying {len(dataset)} samples.")
-        matches = simhash.find_all(
-            np.uint64(dataset[HashKeys.simhash]),
+        hash_values = np.uint64(dataset[HashKeys.simhash])
+        unique_values, inverse = np.unique(hash_values, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        # find matches of unique hash values with multi-index tables and
+        # cluster them
+        logger.info(f"Start querying {len(unique_values)} hash values.")
+        value_union_find = find_clusters(
+            unique_values,
             self.num_blocks,
             self.hamming_distance,
+            num_proc=self.runtime_np(),
         )
-        logger.info(f"Querying done, found {len(matches)} matches.")
-
-        # compute hash diff distribution
-        graph = defaultdict(dict)
-        for x, y in matches:
-            x = str(x)
-            y = str(y)
-            graph[x][y] = graph[y][x] = True
-
-        hash2ids: Dict[str, Set[str]] = defaultdict(set)
-        hashes: Set[str] = set(dataset[HashKeys.simhash])
-        hash2cluster: Dict[str, int] = {}
-        visited: Set[str] = set()
-        cluster_id: int = 0
-
-        for sid, hash_val in enumerate(dataset[HashKeys.simhash]):
-            hash2ids[hash_val].add(str(sid))
-
-        # clustering
-        dup_pairs = {}  # store duplicate pairs when show_num > 0
-        while hashes:
-            hash_val = hashes.pop()
-            if hash_val in visited:
-                continue
-
-            # if this hash value is not in the matches list, it's regarded as a
-            # single cluster
-            if hash_val not in graph:
-                continue
-
-            # Otherwise, BFS to find the cluster
-            q = deque([hash_val])
-            visited.add(hash_val)
-            hash2cluster[hash_val] = cluster_id
-            if show_num > 0 and len(dup_pairs) < show_num:
-                dup_pairs[cluster_id] = []
-
-            while q:
-                curr = q.popleft()
-                for neighbor in graph[curr]:
-                    if neighbor in visited:
-                        continue
-                    visited.add(neighbor)
-                    q.append(neighbor)
-                    hash2cluster[neighbor] = cluster_id
-
-            cluster_id += 1
-        logger.info(f"Found {cluster_id} clusters and {len(graph)} hashes.")
+        value_roots = value_union_find.find(inverse)
+        logger.info("Querying done.")
+
+        # clustering -- samples whose hash values are in the same cluster are
+        # unioned, and the first sample in each cluster is the root
+        union_find = ArrayUnionFind(len(dataset))
+        union_find.union_by_keys(value_roots)
+        is_root = union_find.roots_mask()
+        logger.info(
+            f"There are {len(np.unique(union_find.parent[~is_root]))} "
+            f"clusters that includes multiple near-duplicate samples."
+        )
+        keep = is_root
+        if index is not None:
+            # the clusters including hash values similar to the ones seen in
+            # former runs are regarded as visited
+            seen_values = self.query_dedup_index(unique_values, index)
+            seen_clusters = np.zeros(len(unique_values), dtype=bool)
+            seen_clusters[value_union_find.find(np.flatnonzero(seen_values))] = True
+            seen = seen_clusters[value_roots]
+            logger.info(f"{int(seen.sum())} samples are similar to the samples in the dedup index.")
+            keep = is_root & ~seen
+            index.add(uint64_to_keys(hash_values))
+
+        # record the duplicate sample pairs
+        dup_pairs = {}
+        if show_num > 0:
+            for i in np.flatnonzero(~is_root).tolist():
+                cluster_idx = int(union_find.parent[i])
+                if cluster_idx not in dup_pairs:
+                    dup_pairs[cluster_idx] = [
+                        dataset[cluster_idx],
+                        dataset[i],
+                    ]
+                if len(dup_pairs) >= show_num:
+                    break
 
         # filter duplicated samples
         # NOTICE: For now, we only keep the first sample in a cluster. Maybe
         # there are some better strategies later.
-        def _filter_simhash_dup_helper(sample, visited_clusters, visited_hashes):
-            sample_hash_val = sample[HashKeys.simhash]
-            if sample_hash_val not in hash2cluster:
-                # single-sample cluster, we need to check hash value still.
-                if sample_hash_val in visited_hashes:
-                    return False
-                else:
-                    visited_hashes.add(sample_hash_val)
-                    return True
-            else:
-                cluster_num = hash2cluster[sample_hash_val]
-                if show_num > 0 and cluster_num in dup_pairs and len(dup_pairs[cluster_num]) < 2:
-                    dup_pairs[cluster_num].append(sample)
-                # regular cluster, check cluster number.
-                if cluster_num in visited_clusters:
-                    return False
-                else:
-                    visited_clusters.add(cluster_num)
-                    return True
-
-        cluster_record = set()
-        hash_record = set()
-        dataset = dataset.filter(
-            _filter_simhash_dup_helper,
-            fn_kwargs=dict(visited_clusters=cluster_record, visited_hashes=hash_record),
-            load_from_cache_file=False if show_num > 0 else True,
-        )
+        dataset = dataset.select(np.flatnonzero(keep))
         logger.info(f"Keep {len(dataset)} samples after SimHash dedup.")
 
         return dataset, dup_pairs
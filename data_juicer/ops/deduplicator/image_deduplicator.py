@@ -4,6 +4,7 @@ from typing import Dict, Set, Tuple
 import numpy as np
 
 from data_juicer.utils.constant import HashKeys
+from data_juicer.utils.dedup_index import digest_keys
 from data_juicer.utils.lazy_loader import LazyLoader
 from data_juicer.utils.mm_utils import load_data_with_context, load_image
 
@@ -47,6 +48,7 @@ class ImageDeduplicator(Deduplicator):
         :param args: extra args
         :param kwargs: extra args
         """
+        self._init_parameters = self.remove_extra_parameters(locals())
         super().__init__(*args, **kwargs)
         if method not in HASH_METHOD:
             raise ValueError(f"Keep strategy [{method}] is not supported. " f"Can only be one of {HASH_METHOD}.")
@@ -78,6 +80,12 @@ class ImageDeduplicator(Deduplicator):
             sample[HashKeys.imagehash] += self.hasher.encode_image(image_array=np.array(images[key]))
         return sample
 
+    def dedup_index_config(self):
+        config = super().dedup_index_config()
+        if self.consider_text:
+            config["text_dedup"] = self.text_dedup_op.dedup_index_config()
+        return config
+
     def process(self, dataset, show_num=0):
         """
         For doc-level, dataset --> dataset.
@@ -87,6 +95,16 @@ class ImageDeduplicator(Deduplicator):
             open.
         :return: deduplicated dataset and the sampled duplicate pairs.
         """
+        index = self.load_dedup_index()
+        if index is not None:
+            if self.consider_text:
+                hashes = list(zip(dataset[HashKeys.imagehash], dataset[HashKeys.hash]))
+            else:
+                hashes = dataset[HashKeys.imagehash]
+            # samples without images are never deduplicated
+            valid = np.array([bool(hash_val) for hash_val in dataset[HashKeys.imagehash]], dtype=bool)
+            dataset = self.filter_by_dedup_index(dataset, index, digest_keys(hashes), valid)
+
         # no need to deduplicate because too few samples
         if len(dataset) <= 1:
             return dataset, {}
@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import List, Optional
 
-from data_juicer.utils.constant import HashKeys
+from data_juicer.utils.constant import Fields, HashKeys
 from data_juicer.utils.lazy_loader import LazyLoader
 
 from ..base_op import Filter
@@ -22,6 +24,11 @@ class DedupSet:
         else:
             return False
 
+    def is_unique_batch(self, keys):
+        """Check and record a batch of keys in one call. Only the first
+        occurrence of a key in the batch is unique."""
+        return [self.is_unique(key) for key in keys]
+
 
 def get_remote_dedup_set():
     """Get the remote version of DedupSet with Ray decorator applied at runtime."""
@@ -41,6 +48,11 @@ class Backend(ABC):
     def is_unique(self, md5_value: str):
         pass
 
+    def is_unique_batch(self, md5_values: List[str]) -> List[bool]:
+        """Check a batch of hash values. Backends should override it to
+        reduce the number of round trips."""
+        return [self.is_unique(md5_value) for md5_value in md5_values]
+
 
 class ActorBackend(Backend):
     """
@@ -53,10 +65,32 @@ class ActorBackend(Backend):
             RemoteDedupSet = get_remote_dedup_set()
         self.dedup_sets = [RemoteDedupSet.remote() for _ in range(self.dedup_set_num)]
 
+    def get_dedup_set_id(self, md5_value: str):
+        return int.from_bytes(md5_value.encode(), byteorder="little") % MERSENNE_PRIME % self.dedup_set_num
+
     def is_unique(self, md5_value: str):
-        dedup_set_id = int.from_bytes(md5_value.encode(), byteorder="little") % MERSENNE_PRIME % self.dedup_set_num
+        dedup_set_id = self.get_dedup_set_id(md5_value)
         return ray.get(self.dedup_sets[dedup_set_id].is_unique.remote(md5_value))
 
+    def is_unique_batch(self, md5_values: List[str]) -> List[bool]:
+        # group the hash values by their dedup sets, so that each dedup set
+        # is called once per batch
+        groups = defaultdict(list)
+        for idx, md5_value in enumerate(md5_values):
+            groups[self.get_dedup_set_id(md5_value)].append(idx)
+        # submit all calls before waiting for any of them, so that the calls
+        # to different dedup sets are in flight concurrently
+        refs = {
+            dedup_set_id: self.dedup_sets[dedup_set_id].is_unique_batch.remote([md5_values[i] for i in indices])
+            for dedup_set_id, indices in groups.items()
+        }
+        results = dict(zip(refs.keys(), ray.get(list(refs.values()))))
+        res = [False] * len(md5_values)
+        for dedup_set_id, indices in groups.items():
+            for idx, is_unique in zip(indices, results[dedup_set_id]):
+                res[idx] = is_unique
+        return res
+
 
 class RedisBackend(Backend):
     """
@@ -71,35 +105,71 @@ class RedisBackend(Backend):
     def is_unique(self, md5_value: str):
         return self.redis_client.setnx(md5_value, 1)
 
+    def is_unique_batch(self, md5_values: List[str]) -> List[bool]:
+        # send all SETNX commands of the batch in one round trip
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for md5_value in md5_values:
+            pipeline.setnx(md5_value, 1)
+        return [bool(res) for res in pipeline.execute()]
+
 
 class RayBasicDeduplicator(Filter):
     """
     A basic exact matching deduplicator for RAY.
     Although its functionality is deduplication,
     it is implemented as Filter sub-class.
+
+    Samples are processed in batches, and the hash values of each batch are
+    checked with one call per dedup set (or one Redis pipeline) instead of
+    one remote call per sample. With the 'ray_shuffle' backend, the dataset
+    is deduplicated by a hash-partitioned shuffle instead, which needs no
+    central state.
     """
 
+    _batched_op = True
+
     # TODO: Set a more reasonable value
     EMPTY_HASH_VALUE = "EMPTY"
 
-    def __init__(self, backend: str = "ray_actor", redis_address: str = "redis://localhost:6379", *args, **kwargs):
+    def __init__(
+        self,
+        backend: str = "ray_actor",
+        redis_address: str = "redis://localhost:6379",
+        num_shuffle_partitions: Optional[int] = None,
+        preserve_order: bool = False,
+        *args,
+        **kwargs,
+    ):
         """
         Initialization.
-        :param backend: the backend for dedup, either 'ray_actor' or 'redis'
+        :param backend: the backend for dedup, one of 'ray_actor', 'redis'
+            and 'ray_shuffle'
         :param redis_address: the address of redis server
+        :param num_shuffle_partitions: number of partitions of the shuffle
+            for the 'ray_shuffle' backend. Default it's None, and it will be
+            the number of CPUs in the cluster.
+        :param preserve_order: whether to keep the first sample of each
+            hash value and the original order of samples for the
+            'ray_shuffle' backend. It costs an extra pass and a sort.
         :param args: extra args
         :param kwargs: extra args
         """
         super().__init__(*args, **kwargs)
         self.redis_address = redis_address
         self.backend = backend
+        self.num_shuffle_partitions = num_shuffle_partitions
+        self.preserve_order = preserve_order
+        self.use_shuffle = backend == "ray_shuffle"
         if backend == "ray_actor":
-            dedup_set_num = int(ray.cluster_resources().get("CPU") / 2)
+            dedup_set_num = max(int(ray.cluster_resources().get("CPU") / 2), 1)
             self.backend = ActorBackend(dedup_set_num)
         elif backend == "redis":
             # TODO: add a barrier to ensure that flushdb is performed before
             # the operator is called
             self.backend = RedisBackend(redis_address)
+        elif backend == "ray_shuffle":
+            if self.num_shuffle_partitions is None:
+                self.num_shuffle_partitions = max(int(ray.cluster_resources().get("CPU", 1)), 1)
         else:
             raise ValueError(f"Unknown backend: {backend}")
 
@@ -114,5 +184,40 @@ class RayBasicDeduplicator(Filter):
         sample[HashKeys.is_unique] = self.backend.is_unique(md5_value)
         return sample
 
+    def compute_stats_batched(self, samples, context=False):
+        # compute hashes
+        keys = samples.keys()
+        num_samples = len(next(iter(samples.values())))
+        md5_values = []
+        for i in range(num_samples):
+            this_sample = {key: samples[key][i] for key in keys}
+            md5_values.append(self.calculate_hash(this_sample, context))
+            if context:
+                samples[Fields.context][i] = this_sample[Fields.context]
+        # check existing in one batch
+        samples[HashKeys.is_unique] = self.backend.is_unique_batch(md5_values)
+        return samples
+
+    def compute_hashes(self, table):
+        """Calculate hash values for a pyarrow table of samples."""
+        samples = table.to_pydict()
+        keys = samples.keys()
+        return [self.calculate_hash({key: samples[key][i] for key in keys}) for i in range(table.num_rows)]
+
+    def process_ray(self, dataset):
+        """
+        Deduplicate a Ray dataset by a hash-partitioned shuffle, which is
+        used by the 'ray_shuffle' backend.
+
+        :param dataset: input Ray dataset
+        :return: deduplicated Ray dataset
+        """
+        from data_juicer.core.data.ray_dataset import ray_dedup
+
+        return ray_dedup(dataset, self.compute_hashes, self.num_shuffle_partitions, self.preserve_order)
+
     def process_single(self, sample):
         return sample[HashKeys.is_unique]
+
+    def process_batched(self, samples):
+        return samples[HashKeys.is_unique]
@@ -1,9 +1,10 @@
 import os
 import time
-from typing import List, Optional, Union
+from typing import Optional, Union
 
 import numpy as np
 import pyarrow as pa
+import pyarrow.compute as pc
 import regex
 from loguru import logger
 from pydantic import Field, PositiveInt
@@ -17,10 +18,10 @@ from data_juicer.utils.resource_utils import get_ray_gpu_count, get_ray_gpu_memo
 from ..base_op import OPERATORS, Deduplicator
 from ..common.helper_func import split_on_whitespace
 from .document_minhash_deduplicator import (
-    MAX_HASH,
     MERSENNE_PRIME,
+    compute_minhash_matrix,
     optimal_param,
-    sha1_hash32,
+    xxh32_hashes,
 )
 
 ray = LazyLoader("ray")
@@ -84,7 +85,13 @@ class BTSUnionFind:
         self.num_edge_buffer_task_returns = num_edge_buffer_task_returns
 
     def add_key_value_pairs(self, pairs):
-        for key, value in pairs:
+        """
+        Add band keys with the uids of their samples to the hash table.
+
+        :param pairs: a pyarrow table, whose first column is the fixed-width
+            binary band keys and second column is the uids.
+        """
+        for key, value in zip(pairs.column(0).to_pylist(), pairs.column(1).to_pylist()):
             if key not in self.hash_table:
                 self.hash_table[key] = []
             self.hash_table[key].append(value)
@@ -314,6 +321,7 @@ class RayBTSMinhashDeduplicator(Deduplicator):
         merge_batch_size: Optional[int] = 1000,
         minhash_batch_size: Optional[int] = "auto",
         memory_per_sample: Optional[float] = 0.1,  # MB per sample
+        reread_source: bool = False,
         *args,
         **kwargs,
     ):
@@ -368,6 +376,17 @@ class RayBTSMinhashDeduplicator(Deduplicator):
         :param memory_per_sample: estimated memory needed per sample in MB.
             Used to calculate batch size based on available GPU memory.
             Default is 0.1 MB per sample.
+        :param reread_source: whether to read the source dataset again in
+            the filtering pass instead of spilling the whole dataset with
+            uids to the work dir after hashing. If it's True, only the text
+            column is read for hashing and only the uid column is kept,
+            which is zipped with the source in the same row order, so no
+            scratch space in the work dir is needed except the uids. The
+            upstream OPs of this OP are executed again, so they should be
+            deterministic. If there are stateful upstream OPs, e.g.
+            Deduplicators, Selectors and Ray dedup filters, the input is
+            materialized first instead. The deduplicated result is kept lazy
+            and its rows are read in order. Default it's False.
         """
 
         super().__init__(*args, **kwargs)
@@ -377,6 +396,7 @@ class RayBTSMinhashDeduplicator(Deduplicator):
         self.lowercase = lowercase
         self.ignore_pattern = ignore_pattern
         self.memory_per_sample = memory_per_sample
+        self.reread_source = reread_source
         if minhash_batch_size == "auto":
             if self.use_cuda():
                 self.minhash_batch_size = 200_000
@@ -503,64 +523,78 @@ class RayBTSMinhashDeduplicator(Deduplicator):
             for i in range(self.union_find_parallel_num)
         ]
 
-        empty_hash_value = np.full((self.num_rows_per_band,), MAX_HASH, dtype=np.uint32)
-        self.empty_hash_value = b"\x00\x00\x00\x00" + empty_hash_value.tobytes()
-        self.empty_hash_table_id = int(MAX_HASH % self.union_find_parallel_num)
-
     def band_minhash(self, minhash_list, uid_list):
         """
-        Logic for creating and pusing LSH bands to the union find list
+        Logic for creating and pushing LSH bands of the minhash values
+        computed on GPU to the union find list
         """
-        pairs = {}
-        minhash_list = minhash_list.to_numpy(zero_copy_only=False)
-        for minhash, uid in zip(minhash_list, uid_list):
-            for i, (start, end) in enumerate(self.hash_ranges):
-                hash_value = i.to_bytes(4, "big") + minhash[start:end].tobytes()
-                hash_table_id = minhash[start] % self.union_find_parallel_num
-                if hash_table_id not in pairs:
-                    pairs[hash_table_id] = []
-                pairs[hash_table_id].append((hash_value, uid))
-        result_refs = []
-        for i, p in pairs.items():
-            if len(result_refs) > self.max_pending_filter_tasks:
-                ready_refs, result_refs = ray.wait(result_refs, num_returns=self.num_filter_task_returns)
-                ray.get(ready_refs)
-            result_refs.append(self.union_find_list[i].add_key_value_pairs.remote(p))
-        ray.get(result_refs)
+        if isinstance(minhash_list, pa.ChunkedArray):
+            minhash_list = minhash_list.combine_chunks()
+        values = minhash_list.flatten().to_numpy(zero_copy_only=False)
+        minhashes = values.reshape(len(minhash_list), -1) if len(minhash_list) > 0 else values.reshape(0, 0)
+        self.push_band_keys(minhashes, uid_list)
 
-    def calc_minhash(self, text_list: pa.Array, uid_list: List) -> pa.Table:
+    def calc_minhash(self, text_list: pa.Array, uid_list: np.ndarray):
         """
         Logic for computing minhash values for each text in the input table
+        and pushing their LSH bands to the union find list
         """
-        pairs = {}
-        for text, uid in zip(text_list, uid_list):
-            text = text.as_py()
-            if self.lowercase:
-                text = text.lower()
-            if self.ignore_pattern:
-                text = self.ignore_pattern.sub("", text)
-
-            tokens = self.tokenization_func(text)
-            if len(tokens) > 0:
-                hv = np.array([sha1_hash32(token) for token in tokens], dtype=np.uint64)
-                phv = ((hv[:, None] * self.perm_a[None, :] + self.perm_b) % MERSENNE_PRIME).astype(np.uint32)
-                hash_values = phv.min(axis=0)
-                for i, (start, end) in enumerate(self.hash_ranges):
-                    hash_value = i.to_bytes(4, "big") + hash_values[start:end].tobytes()
-                    hash_table_id = hash_values[start] % self.union_find_parallel_num
-                    if hash_table_id not in pairs:
-                        pairs[hash_table_id] = []
-                    pairs[hash_table_id].append((hash_value, uid))
-            else:
-                if self.empty_hash_table_id not in pairs:
-                    pairs[self.empty_hash_table_id] = []
-                pairs[self.empty_hash_table_id].append((self.empty_hash_value, uid))
+        if self.lowercase:
+            text_list = pc.utf8_lower(text_list)
+        texts = text_list.to_pylist()
+        if self.ignore_pattern:
+            texts = [self.ignore_pattern.sub("", text) for text in texts]
+        token_hashes = [xxh32_hashes(self.tokenization_func(text)) for text in texts]
+        minhashes = compute_minhash_matrix(token_hashes, self.perm_a, self.perm_b)
+        is_empty = np.fromiter((len(hv) == 0 for hv in token_hashes), dtype=np.bool_, count=len(token_hashes))
+        self.push_band_keys(minhashes, uid_list, is_empty)
+
+    def push_band_keys(self, minhashes: np.ndarray, uid_list: np.ndarray, is_empty: Optional[np.ndarray] = None):
+        """
+        Build the LSH band keys of a batch of samples and push them to the
+        union find list. Each band key is the big-endian band index followed
+        by the minhash values of the band, which are stored as a fixed-width
+        binary Arrow column. The keys are routed to the union finds by a
+        stable argsort on their target ids, so each union find gets one
+        Arrow table of (band key, uid) pairs.
+
+        :param minhashes: matrix of 32-bit minhash values in shape of
+            (num_samples, num_permutations)
+        :param uid_list: uids of the samples
+        :param is_empty: whether each sample has no tokens. Empty samples
+            only get one shared key, so they are all regarded as duplicates.
+        """
+        num_samples = len(minhashes)
+        if num_samples == 0:
+            return
+        uid_list = np.asarray(uid_list, dtype=np.int64)
+        band_values = minhashes[:, : self.num_bands * self.num_rows_per_band].astype(np.uint32)
+        band_values = band_values.reshape(num_samples, self.num_bands, self.num_rows_per_band)
+        keys = np.empty((num_samples, self.num_bands, self.num_rows_per_band + 1), dtype=np.uint32)
+        keys[:, :, 0] = np.arange(self.num_bands, dtype=">u4").view(np.uint32)
+        keys[:, :, 1:] = band_values
+        key_width = keys.shape[2] * keys.itemsize
+        keys = keys.reshape(num_samples * self.num_bands, keys.shape[2])
+        uids = np.repeat(uid_list, self.num_bands)
+        table_ids = (band_values[:, :, 0] % self.union_find_parallel_num).ravel()
+        if is_empty is not None and is_empty.any():
+            # the first band of empty samples is exactly the empty hash value
+            keep = ~(is_empty[:, None] & (np.arange(self.num_bands) > 0)[None, :]).ravel()
+            keys, uids, table_ids = keys[keep], uids[keep], table_ids[keep]
+
+        order = np.argsort(table_ids, kind="stable")
+        table_ids = table_ids[order]
+        bounds = np.flatnonzero(np.diff(table_ids)) + 1
         result_refs = []
-        for i, p in pairs.items():
+        for part in np.split(np.arange(len(order)), bounds):
+            index = order[part]
+            part_keys = np.ascontiguousarray(keys[index])
+            key_array = pa.Array.from_buffers(pa.binary(key_width), len(index), [None, pa.py_buffer(part_keys)])
+            pairs = pa.Table.from_arrays([key_array, pa.array(uids[index])], names=["key", HashKeys.uid])
             if len(result_refs) > self.max_pending_filter_tasks:
                 ready_refs, result_refs = ray.wait(result_refs, num_returns=self.num_filter_task_returns)
                 ray.get(ready_refs)
-            result_refs.append(self.union_find_list[i].add_key_value_pairs.remote(p))
+            result_refs.append(self.union_find_list[int(table_ids[part[0]])].add_key_value_pairs.remote(pairs))
         ray.get(result_refs)
 
     def merge_op_batch(self, object_refs):
@@ -605,6 +639,18 @@ class RayBTSMinhashDeduplicator(Deduplicator):
 
     def run(self, dataset, **kwargs):
         # Ignore additional parameters like exporter, tracer, etc.
+        if not self.reread_source:
+            return self._dedup(dataset)
+        # the uids are zipped with the source read again by the row order, so
+        # the order must be the same in both passes. It's set on the contexts
+        # of the datasets instead of the global one, and the re-read pass is
+        # executed lazily with the context of the result
+        dataset.context.execution_options.preserve_order = True
+        result = self._dedup(dataset)
+        result.context.execution_options.preserve_order = True
+        return result
+
+    def _dedup(self, dataset):
         start_time = time.time()
         # Get remote IdGenerator only when needed
         remote_classes = get_remote_classes()
@@ -613,20 +659,27 @@ class RayBTSMinhashDeduplicator(Deduplicator):
         def band_with_uid(table: pa.Table) -> pa.Table:
             num_rows = len(table)
             min_id, max_id = ray.get(id_generator.get_next_id.remote(num_rows))
-            uid_list = range(min_id, max_id)
+            uid_list = np.arange(min_id, max_id, dtype=np.int64)
             self.band_minhash(table["_minhash"], uid_list)
-            new_table = table.append_column(HashKeys.uid, pa.array(list(uid_list)))
+            if self.reread_source:
+                return pa.table({HashKeys.uid: uid_list})
+            new_table = table.append_column(HashKeys.uid, pa.array(uid_list))
             new_table = new_table.drop_columns(["_minhash"])
             return new_table
 
         def minhash_with_uid(table: pa.Table) -> pa.Table:
             num_rows = len(table)
             min_id, max_id = ray.get(id_generator.get_next_id.remote(num_rows))
-            uid_list = range(min_id, max_id)
+            uid_list = np.arange(min_id, max_id, dtype=np.int64)
             self.calc_minhash(table[self.text_key], uid_list)
-            new_table = table.append_column(HashKeys.uid, pa.array(list(uid_list)))
+            if self.reread_source:
+                return pa.table({HashKeys.uid: uid_list})
+            new_table = table.append_column(HashKeys.uid, pa.array(uid_list))
             return new_table
 
+        source = dataset
+        if self.reread_source:
+            dataset = dataset.select_columns([self.text_key])
         tmp_dir = os.path.join(self.work_dir, ".tmp", ray.get_runtime_context().get_job_id())
         if self.use_cuda():
             logger.info("Using GPU for MinHash computation")
@@ -669,22 +722,26 @@ class RayBTSMinhashDeduplicator(Deduplicator):
                 concurrency=concurrency,
                 batch_size=batch_size,
             )
-            dataset.map_batches(
+            hashed = dataset.map_batches(
                 band_with_uid,
                 batch_format="pyarrow",
                 zero_copy_batch=True,
-            ).write_parquet(tmp_dir)
-            del dataset
+            )
         else:
             logger.info("Using CPU for MinHash computation")
-            dataset.map_batches(
+            hashed = dataset.map_batches(
                 minhash_with_uid,
                 batch_format="pyarrow",
                 zero_copy_batch=True,
-            ).write_parquet(tmp_dir)
+            )
+        del dataset
+        if self.reread_source:
+            new_dataset = source.zip(hashed.materialize())
+        else:
+            hashed.write_parquet(tmp_dir)
+            new_dataset = ray.data.read_parquet(tmp_dir)
         end_time = time.time()
         logger.info(f"MinHash time = {end_time - start_time}")
-        new_dataset = ray.data.read_parquet(tmp_dir)
         start_time = time.time()
         self.merge()
         end_time = time.time()
@@ -1,5 +1,6 @@
 import hashlib
 import string
+from typing import Optional
 
 import regex as re
 
@@ -21,20 +22,36 @@ class RayDocumentDeduplicator(RayBasicDeduplicator):
         redis_address: str = "redis://localhost:6379",
         lowercase: bool = False,
         ignore_non_character: bool = False,
+        num_shuffle_partitions: Optional[int] = None,
+        preserve_order: bool = False,
         *args,
         **kwargs,
     ):
         """
         Initialization method.
-        :param backend: the backend for dedup, either 'ray_actor' or 'redis'
+        :param backend: the backend for dedup, one of 'ray_actor', 'redis'
+            and 'ray_shuffle'
         :param redis_address: the address of redis server
         :param lowercase: Whether to convert sample text to lower case
         :param ignore_non_character: Whether to ignore non-alphabet
         characters, including whitespaces, digits, and punctuations
+        :param num_shuffle_partitions: number of partitions of the shuffle
+            for the 'ray_shuffle' backend. Default it's None, and it will be
+            the number of CPUs in the cluster.
+        :param preserve_order: whether to keep the first sample of each
+            hash value and the original order of samples for the
+            'ray_shuffle' backend. It costs an extra pass and a sort.
         :param args: extra args
         :param kwargs: extra args.
         """
-        super().__init__(backend=backend, redis_address=redis_address, *args, **kwargs)
+        super().__init__(
+            backend=backend,
+            redis_address=redis_address,
+            num_shuffle_partitions=num_shuffle_partitions,
+            preserve_order=preserve_order,
+            *args,
+            **kwargs,
+        )
         self.lowercase = lowercase
         self.remove_non_character_regex = (
             re.compile(f"\s+|\d+|[{re.escape(string.punctuation)}]") if ignore_non_character else None  # noqa: W605
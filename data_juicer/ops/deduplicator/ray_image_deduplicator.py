@@ -1,3 +1,5 @@
+from typing import Optional
+
 import numpy as np
 
 from data_juicer.utils.lazy_loader import LazyLoader
@@ -38,17 +40,33 @@ class RayImageDeduplicator(RayBasicDeduplicator):
         backend: str = "ray_actor",
         redis_address: str = "redis://localhost:6379",
         method: str = "phash",
+        num_shuffle_partitions: Optional[int] = None,
+        preserve_order: bool = False,
         *args,
         **kwargs,
     ):
         """
         Initialization.
-        :param backend: the backend for dedup, either 'ray_actor' or 'redis'
+        :param backend: the backend for dedup, one of 'ray_actor', 'redis'
+            and 'ray_shuffle'
         :param redis_address: the address of redis server
+        :param num_shuffle_partitions: number of partitions of the shuffle
+            for the 'ray_shuffle' backend. Default it's None, and it will be
+            the number of CPUs in the cluster.
+        :param preserve_order: whether to keep the first sample of each
+            hash value and the original order of samples for the
+            'ray_shuffle' backend. It costs an extra pass and a sort.
         :param args: extra args
         :param kwargs: extra args
         """
-        super().__init__(backend=backend, redis_address=redis_address, *args, **kwargs)
+        super().__init__(
+            backend=backend,
+            redis_address=redis_address,
+            num_shuffle_partitions=num_shuffle_partitions,
+            preserve_order=preserve_order,
+            *args,
+            **kwargs,
+        )
         if method not in HASH_METHOD:
             raise ValueError(f"Keep strategy [{method}] is not supported. " f"Can only be one of {HASH_METHOD}.")
         self.hasher = get_hash_method(method)()
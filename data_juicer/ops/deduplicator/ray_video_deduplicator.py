@@ -1,4 +1,5 @@
 import hashlib
+from typing import Optional
 
 from data_juicer.utils.mm_utils import close_video, load_data_with_context, load_video
 
@@ -17,15 +18,37 @@ class RayVideoDeduplicator(RayBasicDeduplicator):
     of videos between documents.
     """
 
-    def __init__(self, backend: str = "ray_actor", redis_address: str = "redis://localhost:6379", *args, **kwargs):
+    def __init__(
+        self,
+        backend: str = "ray_actor",
+        redis_address: str = "redis://localhost:6379",
+        num_shuffle_partitions: Optional[int] = None,
+        preserve_order: bool = False,
+        *args,
+        **kwargs,
+    ):
         """
         Initialization.
-        :param backend: the backend for dedup, either 'ray_actor' or 'redis'
+        :param backend: the backend for dedup, one of 'ray_actor', 'redis'
+            and 'ray_shuffle'
         :param redis_address: the address of redis server
+        :param num_shuffle_partitions: number of partitions of the shuffle
+            for the 'ray_shuffle' backend. Default it's None, and it will be
+            the number of CPUs in the cluster.
+        :param preserve_order: whether to keep the first sample of each
+            hash value and the original order of samples for the
+            'ray_shuffle' backend. It costs an extra pass and a sort.
         :param args: extra args
         :param kwargs: extra args
         """
-        super().__init__(backend=backend, redis_address=redis_address, *args, **kwargs)
+        super().__init__(
+            backend=backend,
+            redis_address=redis_address,
+            num_shuffle_partitions=num_shuffle_partitions,
+            preserve_order=preserve_order,
+            *args,
+            **kwargs,
+        )
 
     def calculate_hash(self, sample, context=False):
         if self.video_key not in sample or not sample[self.video_key]:
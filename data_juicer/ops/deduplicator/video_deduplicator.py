@@ -2,7 +2,10 @@ import hashlib
 from collections import defaultdict
 from typing import Dict, Set, Tuple
 
+import numpy as np
+
 from data_juicer.utils.constant import HashKeys
+from data_juicer.utils.dedup_index import digest_keys
 from data_juicer.utils.mm_utils import close_video, load_data_with_context, load_video
 
 from ..base_op import OPERATORS, Deduplicator
@@ -29,6 +32,7 @@ class VideoDeduplicator(Deduplicator):
         :param args: extra args
         :param kwargs: extra args
         """
+        self._init_parameters = self.remove_extra_parameters(locals())
         super().__init__(*args, **kwargs)
         self.consider_text = consider_text
         self.text_dedup_op = None
@@ -66,6 +70,12 @@ class VideoDeduplicator(Deduplicator):
         sample[HashKeys.videohash] = md5_hash.hexdigest()
         return sample
 
+    def dedup_index_config(self):
+        config = super().dedup_index_config()
+        if self.consider_text:
+            config["text_dedup"] = self.text_dedup_op.dedup_index_config()
+        return config
+
     def process(self, dataset, show_num=0):
         """
         For doc-level, dataset --> dataset.
@@ -75,6 +85,16 @@ class VideoDeduplicator(Deduplicator):
             open.
         :return: deduplicated dataset and the sampled duplicate pairs.
         """
+        index = self.load_dedup_index()
+        if index is not None:
+            if self.consider_text:
+                hashes = list(zip(dataset[HashKeys.videohash], dataset[HashKeys.hash]))
+            else:
+                hashes = dataset[HashKeys.videohash]
+            # samples without videos are never deduplicated
+            valid = np.array([bool(hash_val) for hash_val in dataset[HashKeys.videohash]], dtype=bool)
+            dataset = self.filter_by_dedup_index(dataset, index, digest_keys(hashes), valid)
+
         # no need to deduplicate because too few samples
         if len(dataset) <= 1:
             return dataset, {}
@@ -1,9 +1,12 @@
 import sys
 
+import pyarrow as pa
+import pyarrow.compute as pc
+
 from data_juicer.utils.constant import Fields, StatsKeys
 from data_juicer.utils.model_utils import get_model, prepare_model
 
-from ..base_op import OPERATORS, Filter
+from ..base_op import OPERATORS, Filter, in_range_arrow, update_stats_arrow
 from ..common import get_words_from_document
 
 OP_NAME = "alphanumeric_filter"
@@ -15,6 +18,7 @@ class AlphanumericFilter(Filter):
     range."""
 
     _batched_op = True
+    _arrow_op = True
 
     def __init__(
         self, tokenization: bool = False, min_ratio: float = 0.25, max_ratio: float = sys.maxsize, *args, **kwargs
@@ -47,6 +51,8 @@ class AlphanumericFilter(Filter):
                 pretrained_model_name_or_path="EleutherAI/pythia-6.9b-deduped",
                 return_model=False,
             )
+            # tokenizers only work on python strings
+            self._arrow_op = False
 
     def compute_stats_batched(self, samples):
         samples_list = samples[self.text_key]
@@ -73,6 +79,20 @@ class AlphanumericFilter(Filter):
 
         return samples
 
+    def compute_stats_arrow(self, table):
+        texts = table[self.text_key]
+        # letters and numbers are exactly what str.isalnum counts
+        alnum_count = pc.count_substring_regex(texts, r"[\p{L}\p{N}]")
+        text_len = pc.utf8_length(texts)
+        alnum_ratio = pc.if_else(
+            pc.equal(text_len, 0), 0.0, pc.divide(pc.cast(alnum_count, pa.float64()), pc.cast(text_len, pa.float64()))
+        )
+        return update_stats_arrow(table, {StatsKeys.alnum_ratio: alnum_ratio})
+
+    def process_arrow(self, table):
+        alnum_ratio = pc.struct_field(table[Fields.stats], StatsKeys.alnum_ratio)
+        return in_range_arrow(alnum_ratio, self.min_ratio, self.max_ratio)
+
     def process_batched(self, samples):
         ratio_key = StatsKeys.alpha_token_ratio if self.tokenization else StatsKeys.alnum_ratio
         if isinstance(samples[Fields.stats], list):
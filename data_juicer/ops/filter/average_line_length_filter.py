@@ -1,12 +1,18 @@
 import sys
 
+import pyarrow as pa
+import pyarrow.compute as pc
+
 from data_juicer.utils.constant import Fields, InterVars, StatsKeys
 
-from ..base_op import OPERATORS, Filter
+from ..base_op import OPERATORS, Filter, in_range_arrow, update_stats_arrow
 from ..op_fusion import INTER_LINES
 
 OP_NAME = "average_line_length_filter"
 
+# the line boundaries of str.splitlines
+LINE_BREAK_PATTERN = "\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]"
+
 
 @OPERATORS.register_module(OP_NAME)
 @INTER_LINES.register_module(OP_NAME)
@@ -15,6 +21,7 @@ class AverageLineLengthFilter(Filter):
     range."""
 
     _batched_op = True
+    _arrow_op = True
 
     def __init__(self, min_len: int = 10, max_len: int = sys.maxsize, *args, **kwargs):
         """
@@ -53,6 +60,23 @@ class AverageLineLengthFilter(Filter):
             samples_stats[idx][StatsKeys.avg_line_length] = len(cur_text) / len(lines) if len(lines) != 0 else 0.0
         return samples
 
+    def compute_stats_arrow(self, table):
+        texts = table[self.text_key]
+        text_len = pc.cast(pc.utf8_length(texts), pa.float64())
+        # the same number of lines as str.splitlines: one for each line break
+        # and one more for the last line if it's not ended with a line break
+        num_breaks = pc.count_substring_regex(texts, LINE_BREAK_PATTERN)
+        open_last_line = pc.and_(
+            pc.greater(text_len, 0), pc.invert(pc.match_substring_regex(texts, f"(?:{LINE_BREAK_PATTERN})$"))
+        )
+        num_lines = pc.cast(pc.add(num_breaks, pc.cast(open_last_line, pa.int32())), pa.float64())
+        avg_line_length = pc.if_else(pc.equal(num_lines, 0), 0.0, pc.divide(text_len, num_lines))
+        return update_stats_arrow(table, {StatsKeys.avg_line_length: avg_line_length})
+
+    def process_arrow(self, table):
+        avg_line_length = pc.struct_field(table[Fields.stats], StatsKeys.avg_line_length)
+        return in_range_arrow(avg_line_length, self.min_len, self.max_len)
+
     def process_batched(self, samples):
         if isinstance(samples[Fields.stats], list):
             return map(
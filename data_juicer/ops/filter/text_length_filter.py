@@ -1,8 +1,11 @@
 import sys
 
+import pyarrow as pa
+import pyarrow.compute as pc
+
 from data_juicer.utils.constant import Fields, StatsKeys
 
-from ..base_op import OPERATORS, Filter
+from ..base_op import OPERATORS, Filter, in_range_arrow, update_stats_arrow
 
 
 @OPERATORS.register_module("text_length_filter")
@@ -11,6 +14,7 @@ class TextLengthFilter(Filter):
     range."""
 
     _batched_op = True
+    _arrow_op = True
 
     def __init__(self, min_len: int = 10, max_len: int = sys.maxsize, *args, **kwargs):
         """
@@ -41,6 +45,14 @@ class TextLengthFilter(Filter):
 
         return samples
 
+    def compute_stats_arrow(self, table):
+        text_len = pc.utf8_length(table[self.text_key]).cast(pa.int64())
+        return update_stats_arrow(table, {StatsKeys.text_len: text_len})
+
+    def process_arrow(self, table):
+        text_len = pc.struct_field(table[Fields.stats], StatsKeys.text_len)
+        return in_range_arrow(text_len, self.min_len, self.max_len)
+
     def process_batched(self, samples):
         if isinstance(samples[Fields.stats], list):
             return map(lambda stat: self.min_len <= stat[StatsKeys.text_len] <= self.max_len, samples[Fields.stats])
@@ -1,14 +1,22 @@
 import sys
 
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
 from data_juicer.utils.constant import Fields, InterVars, StatsKeys
 from data_juicer.utils.model_utils import get_model, prepare_model
 
-from ..base_op import OPERATORS, Filter
+from ..base_op import OPERATORS, Filter, in_range_arrow, update_stats_arrow
 from ..common import SPECIAL_CHARACTERS, get_words_from_document, words_refinement
 from ..op_fusion import INTER_WORDS
 
 OP_NAME = "words_num_filter"
 
+# words_refinement strips words character by character, so only the special
+# characters with a single code point take effect
+STRIP_CHARACTERS = "".join(sorted(char for char in SPECIAL_CHARACTERS if len(char) == 1))
+
 
 @OPERATORS.register_module(OP_NAME)
 @INTER_WORDS.register_module(OP_NAME)
@@ -17,6 +25,7 @@ class WordsNumFilter(Filter):
     range."""
 
     _batched_op = True
+    _arrow_op = True
 
     def __init__(
         self,
@@ -49,6 +58,8 @@ class WordsNumFilter(Filter):
 
         if tokenization:
             self.model_key = prepare_model(model_type="sentencepiece", lang=lang)
+            # tokenizers only work on python strings
+            self._arrow_op = False
 
     def compute_stats_batched(self, samples, context=False):
         samples_list = samples[self.text_key]
@@ -73,6 +84,24 @@ class WordsNumFilter(Filter):
 
         return samples
 
+    def compute_stats_arrow(self, table):
+        # the same as get_words_from_document + words_refinement without
+        # tokenization: split on spaces, newlines and tabs, strip the special
+        # characters of each word and count the non-empty ones
+        texts = table[self.text_key]
+        if isinstance(texts, pa.ChunkedArray):
+            texts = texts.combine_chunks()
+        words = pc.split_pattern_regex(texts, r"[ \n\t]")
+        stripped = pc.utf8_trim(pc.list_flatten(words), characters=STRIP_CHARACTERS)
+        non_empty = pc.not_equal(stripped, "").to_numpy(zero_copy_only=False)
+        parent = pc.list_parent_indices(words).to_numpy(zero_copy_only=False)
+        num_words = np.bincount(parent[non_empty], minlength=len(texts))
+        return update_stats_arrow(table, {StatsKeys.num_words: pa.array(num_words, type=pa.int64())})
+
+    def process_arrow(self, table):
+        num_words = pc.struct_field(table[Fields.stats], StatsKeys.num_words)
+        return in_range_arrow(num_words, self.min_num, self.max_num)
+
     def process_batched(self, samples):
         if isinstance(samples[Fields.stats], list):
             return map(lambda stat: self.min_num <= stat[StatsKeys.num_words] <= self.max_num, samples[Fields.stats])
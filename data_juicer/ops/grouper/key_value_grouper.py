@@ -43,3 +43,15 @@ class KeyValueGrouper(Grouper):
         batched_samples = [convert_list_dict_to_dict_list(sample_map[k]) for k in sample_map]
 
         return batched_samples
+
+    def process_ray(self, dataset):
+        """Group the samples of a Ray dataset by a hash shuffle on the values
+        in the given keys."""
+        from data_juicer.core.data.ray_dataset import ray_group
+
+        def key_func(table):
+            return [
+                dict_to_hash({key: nested_access(row, key) for key in self.group_by_keys}) for row in table.to_pylist()
+            ]
+
+        return ray_group(dataset, key_func)
@@ -21,3 +21,8 @@ class NaiveGrouper(Grouper):
         batched_sample = convert_list_dict_to_dict_list(dataset)
 
         return [batched_sample]
+
+    def process_ray(self, dataset):
+        from data_juicer.core.data.ray_dataset import ray_group
+
+        return ray_group(dataset)
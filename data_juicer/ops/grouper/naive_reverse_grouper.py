@@ -41,3 +41,25 @@ class NaiveReverseGrouper(Grouper):
                     f.write(json.dumps(batch_meta, ensure_ascii=False) + "\n")
 
         return samples
+
+    def process_ray(self, dataset):
+        """Split the batched samples of a Ray dataset by a row-wise flat map.
+        The batch metas to export are collected to the driver, which are one
+        per batched sample."""
+        import pyarrow
+
+        if self.batch_meta_export_path is not None and Fields.batch_meta in dataset.columns():
+            dataset = dataset.materialize()
+            create_directory_if_not_exists(os.path.dirname(self.batch_meta_export_path))
+            with open(self.batch_meta_export_path, "w") as f:
+                for row in dataset.select_columns([Fields.batch_meta]).iter_rows():
+                    f.write(json.dumps(row[Fields.batch_meta], ensure_ascii=False) + "\n")
+
+        def split(table):
+            samples = []
+            for sample in table.to_pylist():
+                sample = {k: sample[k] for k in sample if k != Fields.batch_meta}
+                samples.extend(convert_dict_list_to_list_dict(sample))
+            return pyarrow.Table.from_pylist(samples)
+
+        return dataset.map_batches(split, batch_format="pyarrow")
@@ -1,11 +1,20 @@
+import copy
 from typing import List
 
 import numpy as np
 from loguru import logger
 
-from data_juicer.ops.base_op import OP, OPERATORS, Filter, Mapper
+from data_juicer.ops.base_op import (
+    OP,
+    OPERATORS,
+    Filter,
+    Mapper,
+    cache_op_results,
+    catch_map_batches_exception,
+)
 from data_juicer.ops.load import load_ops
 from data_juicer.utils.constant import Fields, InterVars
+from data_juicer.utils.model_utils import release_models
 from data_juicer.utils.registry import Registry
 
 # Type of intermediate vars
@@ -59,6 +68,160 @@ def fuse_operators(ops, probe_res=None):
     return fused_ops
 
 
+def is_local_op(op):
+    """
+    Check whether an OP is row-local, i.e. it can be applied to any batch of
+    samples independently of the other samples in the dataset. Only Mappers,
+    Filters and the explicitly fused OPs of them are row-local. The other OPs
+    (Deduplicators, Selectors, Groupers, Aggregators) need to see the whole
+    dataset and act as pipeline barriers.
+
+    :param op: the op object to check.
+    :return: True if the op is row-local.
+    """
+    return isinstance(op, (Mapper, Filter, GeneralFusedOP))
+
+
+def add_required_columns(op, samples):
+    """
+    Add the stats/meta columns required by the op to a batch of samples in
+    place, which is the batch-level counterpart of `OP.with_new_columns`.
+
+    :param op: the op to be applied on the samples.
+    :param samples: a batch of samples in "dict of lists" format.
+    :return: the samples with the required columns.
+    """
+    num_samples = len(next(iter(samples.values()))) if samples else 0
+    for name, value in op.required_columns().items():
+        if name not in samples:
+            samples[name] = [copy.deepcopy(value) for _ in range(num_samples)]
+    return samples
+
+
+def get_batched_runtime_method(op, name):
+    """
+    Get the runtime method of an OP to apply on a batch of samples, e.g.
+    `process` of Mappers. Batched OPs are called through their own runtime
+    wrappers. For the other OPs, the batched counterpart of the method is
+    wrapped in the same way, i.e. with the fault tolerance and the OP result
+    cache. The `process` of Filters is always wrapped here, since its
+    indicators might be computed lazily.
+
+    :param op: the op object.
+    :param name: the name of the runtime method.
+    :return: the method to apply on a batch of samples.
+    """
+    if isinstance(op, Filter) and name == "process":
+        # the indicators might be computed lazily, so they are listed inside
+        # the wrapper to catch their errors
+
+        def process_batched(samples, *args, **kwargs):
+            return list(op.process_batched(samples, *args, **kwargs))
+
+        return catch_map_batches_exception(process_batched, skip_op_error=op.skip_op_error, op_name=op._name)
+    if op.is_batched_op():
+        return getattr(op, name)
+    method = catch_map_batches_exception(
+        getattr(op, f"{name}_batched"), skip_op_error=op.skip_op_error, op_name=op._name
+    )
+    if op.op_result_cache_dir is not None:
+        if isinstance(op, Mapper) and name == "process":
+            method = cache_op_results(method, op)
+        elif isinstance(op, Filter) and name == "compute_stats":
+            method = cache_op_results(method, op, field=Fields.stats)
+    return method
+
+
+def run_ops_on_batch(ops, samples, rank=None):
+    """
+    Apply a run of row-local OPs on a single batch of samples. Mappers edit
+    the batch, and Filters compute their stats and drop the rejected samples
+    right away, so the batch only passes through the ops once.
+
+    :param ops: a list of row-local op objects.
+    :param samples: a batch of samples in "dict of lists" format.
+    :param rank: the rank of the current worker, used by cuda ops.
+    :return: the processed batch of samples.
+    """
+    for op in ops:
+        if not samples or len(next(iter(samples.values()))) == 0:
+            # nothing left to process in this batch
+            break
+        samples = add_required_columns(op, samples)
+        process_args = {"rank": rank} if op.use_cuda() else {}
+        if isinstance(op, Mapper):
+            samples = get_batched_runtime_method(op, "process")(samples, **process_args)
+        elif isinstance(op, Filter):
+            samples = get_batched_runtime_method(op, "compute_stats")(samples, **process_args)
+            indicators = get_batched_runtime_method(op, "process")(samples)
+            if isinstance(indicators, dict):
+                # the failed batch is skipped
+                indicators = [False] * len(next(iter(samples.values()), []))
+            samples = {
+                key: [val for val, indicator in zip(values, indicators) if indicator] for key, values in samples.items()
+            }
+        elif isinstance(op, GeneralFusedOP):
+            samples = op.process_batched(samples, **process_args)
+        else:
+            raise NotImplementedError(
+                f"OP {op._name} of type {type(op)} is not row-local and can not be applied batch by batch."
+            )
+    return samples
+
+
+def is_stage_fusible(op):
+    """
+    Check whether an OP can be fused into a stage with its neighbours. It
+    should be row-local, and it should not need to see its own full results,
+    e.g. Filters that export their stats before filtering, or OPs that index
+    the samples before processing.
+
+    :param op: the op object to check.
+    :return: True if the op can be fused into a stage.
+    """
+    if not is_local_op(op):
+        return False
+    if getattr(op, "index_key", None) is not None:
+        return False
+    if isinstance(op, Filter) and op.stats_export_path is not None:
+        return False
+    return True
+
+
+def fuse_stages(ops, fusible=is_stage_fusible):
+    """
+    Collapse each maximal run of fusible row-local OPs (Mappers and Filters)
+    into one FusedStage, so that the whole run costs one Arrow round-trip
+    instead of one or two for each OP. Runs with only one OP are kept as they
+    are.
+
+    :param ops: the corresponding list of op objects.
+    :param fusible: function to check whether an op can be fused into a
+        stage, which is `is_stage_fusible` by default.
+    :return: a list of op objects with fused stages.
+    """
+    fused_ops = []
+    stage = []
+
+    def _flush_stage():
+        if len(stage) > 1:
+            fused_stage = FusedStage(stage)
+            logger.info(f"Ops are fused into one stage {fused_stage._name}.")
+            fused_ops.append(fused_stage)
+        else:
+            fused_ops.extend(stage)
+
+    for op in ops:
+        if fusible(op):
+            stage.append(op)
+        else:
+            _flush_stage()
+            stage = []
+            fused_ops.append(op)
+    _flush_stage()
+    return fused_ops
+
+
 def fuse_filter_group(original_filter_group):
     """
     Fuse single filter group and return the fused filter group.
@@ -203,6 +366,12 @@ class GeneralFusedOP(OP):
         # update num_proc with the min num_proc of all fusible filters
         self.num_proc = min([op.runtime_np() for op in self.fused_ops]) if self.fused_ops else 1
 
+    def required_columns(self):
+        columns = {}
+        for op in self.fused_ops:
+            columns.update(op.required_columns())
+        return columns
+
     def process_batched(self, samples, rank=None):
         for op in self.fused_ops:
             process_args = {"rank": rank} if op.accelerator == "cuda" else {}
@@ -230,15 +399,71 @@ class GeneralFusedOP(OP):
             dataset = NestedDataset(dataset)
         if not self.fused_ops:
             return dataset
-        # initialize for different kinds of datasets
+        # index the samples for fused ops that require it, while other
+        # required columns are added lazily in the map below
         for op in self.fused_ops:
-            dataset = OP.run(op, dataset)
+            if op.index_key is not None:
+                dataset = OP.run(op, dataset)
+        process, with_indices = self.with_new_columns(dataset, self.process_batched)
 
         new_dataset = dataset.map(
-            self.process_batched,
+            process,
+            with_indices=with_indices,
             num_proc=self.num_proc,
             with_rank=self.use_cuda(),
             batch_size=self.batch_size,
             desc=self._name + "_process",
         )
         return new_dataset
+
+
+class FusedStage(OP):
+    """A fused stage of consecutive row-local OPs. The OPs are applied one by
+    one on each batch inside the same worker, and the samples rejected by the
+    Filters are dropped right away, so the stage only reads and writes the
+    dataset once."""
+
+    _batched_op = True
+
+    def __init__(self, fused_ops: List):
+        """
+        Initialization method.
+
+        :param fused_ops: a list of row-local ops to be fused.
+        """
+        self._name = "FusedStage:(%s)" % ",".join([op._name for op in fused_ops])
+        super().__init__()
+        self.fused_ops = fused_ops
+        self._op_cfg = {self._name: [op._op_cfg for op in fused_ops if hasattr(op, "_op_cfg")]}
+        # set accelerator to 'cuda' if there exists any ops whose accelerator
+        # is 'cuda'
+        accelerator_methods = set([op.accelerator for op in self.fused_ops])
+        if "cuda" in accelerator_methods:
+            self.accelerator = "cuda"
+        # use the min batch size and num_proc of all fused ops
+        self.batch_size = min([op.batch_size for op in self.fused_ops])
+        self.num_proc = min([op.runtime_np() for op in self.fused_ops])
+
+    def required_columns(self):
+        columns = {}
+        for op in self.fused_ops:
+            columns.update(op.required_columns())
+        return columns
+
+    def process_batched(self, samples, rank=None):
+        return run_ops_on_batch(self.fused_ops, samples, rank=rank)
+
+    def run(self, dataset, *, exporter=None, tracer=None):
+        from data_juicer.core.data import NestedDataset
+
+        if not isinstance(dataset, NestedDataset):
+            dataset = NestedDataset(dataset)
+        new_dataset = dataset.map(
+            self.process_batched,
+            num_proc=self.runtime_np(),
+            with_rank=self.use_cuda(),
+            batch_size=self.batch_size,
+            desc=self._name + "_process",
+        )
+        release_models(self)
+        return new_dataset
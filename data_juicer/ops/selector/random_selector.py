@@ -1,5 +1,6 @@
 from typing import Optional
 
+import numpy as np
 from pydantic import Field, PositiveInt
 from typing_extensions import Annotated
 
@@ -34,6 +35,14 @@ class RandomSelector(Selector):
         self.select_ratio = select_ratio
         self.select_num = select_num
 
+    def _get_select_num(self, num_rows):
+        if not self.select_ratio:
+            return self.select_num
+        select_num = int(self.select_ratio * num_rows)
+        if self.select_num and self.select_num < select_num:
+            select_num = self.select_num
+        return select_num
+
     def process(self, dataset):
         if len(dataset) <= 1:
             return dataset
@@ -41,11 +50,27 @@ class RandomSelector(Selector):
         if self.select_ratio is None and self.select_num is None:
             return dataset
 
-        if not self.select_ratio:
-            select_num = self.select_num
-        else:
-            select_num = int(self.select_ratio * len(dataset))
-            if self.select_num and self.select_num < select_num:
-                select_num = self.select_num
-
+        select_num = self._get_select_num(len(dataset))
         return random_sample(dataset, sample_number=select_num)
+
+    def process_ray(self, dataset):
+        """Select samples of a Ray dataset uniformly at random, by taking the
+        samples with the smallest random keys."""
+        from data_juicer.core.data.ray_dataset import ray_topk
+
+        if self.select_ratio is None and self.select_num is None:
+            return dataset
+        # materialize the dataset once, so the upstream OPs aren't executed
+        # again by the selection after counting
+        dataset = dataset.materialize()
+        num_rows = dataset.count()
+        if num_rows <= 1:
+            return dataset
+        select_num = self._get_select_num(num_rows)
+        if select_num >= num_rows:
+            return dataset
+
+        def key_func(table):
+            return np.random.random(len(table))
+
+        return ray_topk(dataset, key_func, select_num, descending=False)
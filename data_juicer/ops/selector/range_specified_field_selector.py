@@ -61,6 +61,19 @@ class RangeSpecifiedFieldSelector(Selector):
         self.lower_rank = lower_rank
         self.upper_rank = upper_rank
 
+    def _get_bounds(self, num_rows):
+        lower_bound, upper_bound = 0, num_rows
+        if self.lower_percentile is not None:
+            lower_bound = int(self.lower_percentile * num_rows)
+        if self.lower_rank is not None:
+            lower_bound = max(lower_bound, self.lower_rank)
+        if self.upper_percentile is not None:
+            upper_bound = int(self.upper_percentile * num_rows)
+        if self.upper_rank is not None:
+            upper_bound = min(upper_bound, self.upper_rank)
+        upper_bound = max(lower_bound, upper_bound)
+        return lower_bound, upper_bound
+
     def process(self, dataset):
         if len(dataset) <= 1 or not self.field_key:
             return dataset
@@ -70,16 +83,7 @@ class RangeSpecifiedFieldSelector(Selector):
         if self.upper_percentile is None and self.upper_rank is None:
             return dataset
 
-        lower_bound, upper_bound = 0, len(dataset)
-        if self.lower_percentile is not None:
-            lower_bound = int(self.lower_percentile * len(dataset))
-        if self.lower_rank is not None:
-            lower_bound = max(lower_bound, self.lower_rank)
-        if self.upper_percentile is not None:
-            upper_bound = int(self.upper_percentile * len(dataset))
-        if self.upper_rank is not None:
-            upper_bound = min(upper_bound, self.upper_rank)
-        upper_bound = max(lower_bound, upper_bound)
+        lower_bound, upper_bound = self._get_bounds(len(dataset))
 
         field_keys = self.field_key.split(".")
         assert field_keys[0] in dataset.features.keys(), "'{}' not in {}".format(field_keys[0], dataset.features.keys())
@@ -108,3 +112,29 @@ class RangeSpecifiedFieldSelector(Selector):
         )
 
         return sub_dataset.select(select_index)
+
+    def process_ray(self, dataset):
+        """Select a range of samples of a Ray dataset by two rounds of partial
+        top-k: the smallest `upper_bound` samples, then the largest
+        `upper_bound - lower_bound` samples of them."""
+        from data_juicer.core.data.ray_dataset import get_field_values, ray_topk
+
+        if not self.field_key:
+            return dataset
+        if self.lower_percentile is None and self.lower_rank is None:
+            return dataset
+        if self.upper_percentile is None and self.upper_rank is None:
+            return dataset
+        # materialize the dataset once, so the upstream OPs aren't executed
+        # again by the selection after counting
+        dataset = dataset.materialize()
+        num_rows = dataset.count()
+        if num_rows <= 1:
+            return dataset
+        lower_bound, upper_bound = self._get_bounds(num_rows)
+
+        def key_func(table):
+            return [stats_to_number(value) for value in get_field_values(table, self.field_key)]
+
+        dataset = ray_topk(dataset, key_func, int(upper_bound), descending=False)
+        return ray_topk(dataset, key_func, int(upper_bound - lower_bound), descending=True)
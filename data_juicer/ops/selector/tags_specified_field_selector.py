@@ -45,3 +45,19 @@ class TagsSpecifiedFieldSelector(Selector):
                 selected_index.append(i)
 
         return dataset.select(selected_index)
+
+    def process_ray(self, dataset):
+        """Select the samples of a Ray dataset with the target tags, which is
+        a row-wise filter."""
+        import pyarrow
+
+        from data_juicer.core.data.ray_dataset import get_field_values
+
+        if not self.field_key:
+            return dataset
+
+        def select(table):
+            values = get_field_values(table, self.field_key)
+            return table.filter(pyarrow.array([value in self.target_tags for value in values], type=pyarrow.bool_()))
+
+        return dataset.map_batches(select, batch_format="pyarrow")
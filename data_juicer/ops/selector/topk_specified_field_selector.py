@@ -51,20 +51,21 @@ class TopkSpecifiedFieldSelector(Selector):
         self.topk = topk
         self.reverse = reverse
 
+    def _get_select_num(self, num_rows):
+        if not self.top_ratio:
+            return self.topk
+        select_num = self.top_ratio * num_rows
+        if self.topk and self.topk < select_num:
+            select_num = self.topk
+        return select_num
+
     def process(self, dataset):
         if len(dataset) <= 1 or not self.field_key:
             return dataset
 
-        select_num = 0
-        if not self.top_ratio:
-            if not self.topk:
-                return dataset
-            else:
-                select_num = self.topk
-        else:
-            select_num = self.top_ratio * len(dataset)
-            if self.topk and self.topk < select_num:
-                select_num = self.topk
+        select_num = self._get_select_num(len(dataset))
+        if not select_num:
+            return dataset
 
         field_keys = self.field_key.split(".")
         assert field_keys[0] in dataset.features.keys(), "'{}' not in {}".format(field_keys[0], dataset.features.keys())
@@ -85,3 +86,25 @@ class TopkSpecifiedFieldSelector(Selector):
         else:
             select_index = heapq.nsmallest(int(select_num), range(len(dataset)), field_value_list.__getitem__)
         return dataset.select(select_index)
+
+    def process_ray(self, dataset):
+        """Select the top samples of a Ray dataset by a partial top-k of
+        each block and a final merge."""
+        from data_juicer.core.data.ray_dataset import get_field_values, ray_topk
+
+        if not self.field_key:
+            return dataset
+        # materialize the dataset once, so the upstream OPs aren't executed
+        # again by the selection after counting
+        dataset = dataset.materialize()
+        num_rows = dataset.count()
+        if num_rows <= 1:
+            return dataset
+        select_num = self._get_select_num(num_rows)
+        if not select_num:
+            return dataset
+
+        def key_func(table):
+            return [stats_to_number(value, self.reverse) for value in get_field_values(table, self.field_key)]
+
+        return ray_topk(dataset, key_func, int(select_num), descending=self.reverse)
@@ -1,8 +1,14 @@
 import json
 import os
+import shutil
 
 from loguru import logger
 
+# the manifest of the committed output shards of an OP
+MANIFEST_FILE = "manifest.json"
+# the checkpoint that references the committed output shards of the latest OP
+LATEST_SHARDS_FILE = "latest.json"
+
 
 class CheckpointManager:
     """
@@ -12,21 +18,33 @@ class CheckpointManager:
 
     If any args of operator in process list is changed, all ops will be
     rerun from the beginning.
+
+    If `shard_size` is positive, the output of each OP is written as
+    committed shard files in the checkpoint directory, together with a
+    manifest of the input ranges that are done, so a rerun resumes an
+    interrupted OP from its last committed shard. The checkpoint of the
+    latest dataset then references the shard files instead of copying the
+    whole dataset.
     """
 
-    def __init__(self, ckpt_dir, original_process_list, num_proc=1):
+    def __init__(self, ckpt_dir, original_process_list, num_proc=1, shard_size=0):
         """
         Initialization method.
 
         :param ckpt_dir: path to save and load checkpoint
         :param original_process_list: process list in config
         :param num_proc: number of process workers when saving dataset
+        :param shard_size: number of input samples of each committed shard
+            of an OP. If it's 0, the dataset is only saved after OPs.
         """
         self.ckpt_dir = ckpt_dir
         self.ckpt_ds_dir = os.path.join(self.ckpt_dir, "latest")
+        self.ckpt_shards_record = os.path.join(self.ckpt_dir, LATEST_SHARDS_FILE)
         self.ckpt_op_record = os.path.join(self.ckpt_dir, "ckpt_op.json")
+        self.ckpt_ops_dir = os.path.join(self.ckpt_dir, "ops")
         self.process_list = original_process_list
         self.num_proc = num_proc
+        self.shard_size = shard_size
         self.op_record = []
 
         self.ckpt_available = self.check_ckpt()
@@ -48,8 +66,7 @@ class CheckpointManager:
         :return: True when checkpoint is available, else False
         """
         if (
-            os.path.exists(self.ckpt_ds_dir)
-            and os.path.isdir(self.ckpt_ds_dir)
+            (os.path.isdir(self.ckpt_ds_dir) or os.path.isfile(self.ckpt_shards_record))
             and os.path.exists(self.ckpt_op_record)
             and os.path.isfile(self.ckpt_op_record)
             and self.check_ops_to_skip()
@@ -122,15 +139,24 @@ class CheckpointManager:
 
     def save_ckpt(self, ds):
         """
-        Save dataset to checkpoint directory and dump processed ops list.
+        Save dataset to checkpoint directory and dump processed ops list. If
+        the dataset consists of the committed shard files of OPs, only the
+        references to them are saved.
 
         :param ds: input dataset to save
         """
-        left_sample_num = len(ds)
-        ds.save_to_disk(self.ckpt_ds_dir, num_proc=min(self.num_proc, left_sample_num))
-
-        with open(self.ckpt_op_record, "w") as fout:
-            json.dump(self.op_record, fout)
+        shard_files = self._get_shard_files(ds)
+        if shard_files is not None:
+            self._dump_json({"shards": shard_files}, self.ckpt_shards_record)
+            if os.path.exists(self.ckpt_ds_dir):
+                shutil.rmtree(self.ckpt_ds_dir)
+        else:
+            left_sample_num = len(ds)
+            ds.save_to_disk(self.ckpt_ds_dir, num_proc=min(self.num_proc, left_sample_num))
+            if os.path.exists(self.ckpt_shards_record):
+                os.remove(self.ckpt_shards_record)
+        self._dump_json(self.op_record, self.ckpt_op_record)
+        self._cleanup_op_dirs(shard_files or [])
 
     def load_ckpt(self):
         """
@@ -140,5 +166,148 @@ class CheckpointManager:
         """
         from data_juicer.core.data import NestedDataset
 
+        if os.path.isfile(self.ckpt_shards_record):
+            with open(self.ckpt_shards_record, "r") as fin:
+                shard_files = json.load(fin)["shards"]
+            return self._load_shards([os.path.join(self.ckpt_dir, fn) for fn in shard_files])
+
         ds = NestedDataset.load_from_disk(self.ckpt_ds_dir)
         return ds
+
+    def run_op(self, op, run, dataset, **run_args):
+        """
+        Run an OP and commit its output as shard files. Row-local OPs, i.e.
+        Mappers and Filters, are run on contiguous ranges of `shard_size`
+        input samples, and the output of each range is committed once it's
+        done, so only the unfinished ranges are run when resuming. Other OPs,
+        and row-local OPs whose stats are exported, whose results are traced
+        or which number samples with `index_key`, are run on the whole
+        dataset, and their output is committed as a single shard.
+
+        :param op: the OP to run
+        :param run: the function to run the OP, which takes the dataset and
+            `run_args` as keyword arguments
+        :param dataset: the input dataset
+        :param run_args: other arguments of `run`
+        :return: the output dataset loaded from the committed shards
+        """
+        from data_juicer.ops.base_op import Filter, Mapper
+        from data_juicer.ops.op_fusion import FusedStage
+        from data_juicer.utils.op_result_cache import normalize_op_args
+
+        num_rows = len(dataset)
+        if num_rows == 0:
+            return run(dataset=dataset, **run_args)
+        exporter, tracer = run_args.get("exporter"), run_args.get("tracer")
+        # the stats export and the tracer need the results of the whole
+        # dataset, and indices are numbered in the whole dataset
+        shardable = (
+            isinstance(op, (Mapper, Filter, FusedStage))
+            and tracer is None
+            and not (exporter and getattr(op, "stats_export_path", None))
+            and getattr(op, "index_key", None) is None
+        )
+        if shardable:
+            bounds = [[start, min(start + self.shard_size, num_rows)] for start in range(0, num_rows, self.shard_size)]
+        else:
+            bounds = [[0, num_rows]]
+
+        op_dir = os.path.join(self.ckpt_ops_dir, f"{len(self.op_record):04d}_{op._name}")
+        manifest_file = os.path.join(op_dir, MANIFEST_FILE)
+        manifest = {
+            "op": op._name,
+            "op_cfg": getattr(op, "_op_cfg", None),
+            "op_args": normalize_op_args(op),
+            "input": self._get_shard_files(dataset) or dataset._fingerprint,
+            "num_rows": num_rows,
+            "bounds": bounds,
+            "shards": {},
+        }
+        if os.path.isfile(manifest_file):
+            with open(manifest_file, "r") as fin:
+                committed = json.load(fin)
+            committed_shards = committed.pop("shards", {})
+            expected = json.loads(json.dumps({key: value for key, value in manifest.items() if key != "shards"}))
+            if committed == expected:
+                manifest["shards"] = {
+                    key: fn for key, fn in committed_shards.items() if os.path.isfile(os.path.join(op_dir, fn))
+                }
+                logger.info(f"Resume OP [{op._name}] from {len(manifest['shards'])}/{len(bounds)} committed shards.")
+            else:
+                logger.warning(f"Input or args of OP [{op._name}] are changed. Discard its committed shards.")
+                shutil.rmtree(op_dir)
+        os.makedirs(op_dir, exist_ok=True)
+
+        for index, (start, end) in enumerate(bounds):
+            key = f"{start}-{end}"
+            if key in manifest["shards"]:
+                continue
+            part = dataset if end - start == num_rows else dataset.select(range(start, end))
+            output = run(dataset=part, **run_args)
+            filename = f"shard-{index:05d}.arrow"
+            self._write_shard(output, os.path.join(op_dir, filename))
+            # commit the shard
+            manifest["shards"][key] = filename
+            self._dump_json(manifest, manifest_file)
+
+        shard_files = [os.path.join(op_dir, manifest["shards"][f"{start}-{end}"]) for start, end in bounds]
+        return self._load_shards(shard_files)
+
+    @staticmethod
+    def _write_shard(dataset, path):
+        """Write a dataset to an Arrow file atomically."""
+        from datasets.arrow_writer import ArrowWriter
+
+        tmp_path = f"{path}.tmp"
+        dataset = dataset.with_format("arrow")
+        writer = ArrowWriter(features=dataset.features, path=tmp_path)
+        try:
+            if len(dataset) == 0:
+                writer.write_table(dataset[:0])
+            for batch in dataset.iter(batch_size=1000):
+                writer.write_table(batch)
+            writer.finalize()
+        finally:
+            writer.close()
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _load_shards(shard_files):
+        from datasets import Dataset, concatenate_datasets
+
+        from data_juicer.core.data import NestedDataset
+
+        return NestedDataset(concatenate_datasets([Dataset.from_file(fn) for fn in shard_files]))
+
+    def _get_shard_files(self, ds):
+        """Get the paths of committed shard files relative to the checkpoint
+        directory that the dataset consists of, or None if it's not only
+        backed by them."""
+        if getattr(ds, "_indices", None) is not None or not getattr(ds, "cache_files", None):
+            return None
+        ops_dir = os.path.abspath(self.ckpt_ops_dir)
+        shard_files = []
+        for cache_file in ds.cache_files:
+            filename = os.path.abspath(cache_file["filename"])
+            if os.path.dirname(os.path.dirname(filename)) != ops_dir:
+                return None
+            shard_files.append(os.path.relpath(filename, self.ckpt_dir))
+        return shard_files
+
+    def _cleanup_op_dirs(self, keep_files):
+        """Remove the committed shards of OPs before the latest checkpoint,
+        which are not referenced anymore."""
+        if not os.path.isdir(self.ckpt_ops_dir):
+            return
+        keep_dirs = {os.path.basename(os.path.dirname(fn)) for fn in keep_files}
+        for dirname in os.listdir(self.ckpt_ops_dir):
+            index = dirname.split("_")[0]
+            if dirname not in keep_dirs and index.isdigit() and int(index) < len(self.op_record):
+                shutil.rmtree(os.path.join(self.ckpt_ops_dir, dirname))
+
+    @staticmethod
+    def _dump_json(obj, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as fout:
+            json.dump(obj, fout)
+        os.replace(tmp_path, path)
@@ -0,0 +1,209 @@
+import json
+import os
+import uuid
+from typing import Any, Dict
+
+import numpy as np
+import xxhash
+from loguru import logger
+
+# the index is compacted into one segment when it has more segments
+MAX_SEGMENTS = 16
+
+
+def uint64_to_keys(values):
+    """
+    Convert uint64 values (or matrices of them, one row per key) to the
+    fixed-width byte keys used by DedupIndex. Values are stored in
+    big-endian, so the byte order of keys is the same as the numeric order.
+
+    :param values: uint64 array in shape of (n,) or (n, k)
+    :return: void array of n keys, each of which is in 8 * k bytes
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if values.ndim == 1:
+        values = values[:, None]
+    width = values.shape[1] * 8
+    return np.ascontiguousarray(values.astype(">u8")).view(f"V{width}").reshape(len(values))
+
+
+def keys_to_uint64(keys):
+    """The inverse of `uint64_to_keys` for 8-byte keys."""
+    return np.asarray(keys).view(">u8").astype(np.uint64)
+
+
+def digest_keys(values):
+    """
+    Convert hash values in any string form (or tuples of them) to 16-byte
+    md5 digest keys used by DedupIndex.
+
+    :param values: list of strings or tuples of strings
+    :return: void array of 16-byte keys
+    """
+    import hashlib
+
+    digests = b"".join(
+        hashlib.md5(
+            ("\x00".join(map(str, value)) if isinstance(value, (tuple, list)) else str(value)).encode("utf-8")
+        ).digest()
+        for value in values
+    )
+    return np.frombuffer(digests, dtype="V16")
+
+
+class DedupIndex:
+    """
+    Persistent index of the dedup keys seen by a Deduplicator across runs,
+    so a new run only needs to query its new samples against the index
+    instead of deduplicating all data seen before again.
+
+    The index of an OP is stored in the directory
+    `<index_dir>/<op_name>-<fingerprint>`, where the fingerprint is computed
+    from the OP config that affects the hash values, so that changing the
+    config starts a new index. Keys are fixed-width bytes stored in
+    immutable sorted segments of `.npy` files, which are memory-mapped when
+    loaded and queried by binary search. Each save appends the new keys as a
+    new segment, and segments are compacted into one when there are more
+    than `MAX_SEGMENTS` of them. Deduplicators can also persist views of the
+    segments for other kinds of queries, which are built once per segment.
+    """
+
+    def __init__(self, index_dir: str, op_name: str, op_config: Dict[str, Any]):
+        """
+        Initialization method.
+
+        :param index_dir: root directory of dedup indexes
+        :param op_name: name of the Deduplicator
+        :param op_config: OP config that affects the hash values
+        """
+        self.op_name = op_name
+        self.op_config = op_config
+        self.fingerprint = self.compute_fingerprint(op_name, op_config)
+        self.path = os.path.join(index_dir, f"{op_name}-{self.fingerprint}")
+        self.meta_path = os.path.join(self.path, "meta.json")
+        self.segment_names = []
+        self.segments = []
+        self.pending = []
+        self.load()
+
+    @staticmethod
+    def compute_fingerprint(op_name, op_config):
+        m = xxhash.xxh64()
+        m.update(op_name.encode("utf-8"))
+        m.update(json.dumps(op_config, sort_keys=True, default=str).encode("utf-8"))
+        return m.hexdigest()
+
+    def load(self):
+        """Memory-map the segments of the index if it exists."""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as fin:
+            meta = json.load(fin)
+        self.segment_names = meta["segments"]
+        self.segments = [np.load(os.path.join(self.path, name), mmap_mode="r") for name in self.segment_names]
+        logger.info(f"Loaded dedup index of {len(self)} keys from [{self.path}].")
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def contains(self, keys):
+        """
+        Check whether the keys are in the saved index.
+
+        :param keys: void array of keys
+        :return: boolean array of whether each key is in the index
+        """
+        keys = np.asarray(keys)
+        res = np.zeros(len(keys), dtype=bool)
+        for segment in self.segments:
+            if len(segment) == 0:
+                continue
+            if segment.dtype != keys.dtype:
+                raise ValueError(
+                    f"The keys in {segment.dtype} don't match the dedup index " f"[{self.path}] in {keys.dtype}."
+                )
+            pos = np.searchsorted(segment, keys)
+            found = pos < len(segment)
+            found[found] = segment[pos[found]] == keys[found]
+            res |= found
+        return res
+
+    def all_keys(self):
+        """Get all saved keys of the index in one array."""
+        if not self.segments:
+            return None
+        return np.concatenate(self.segments)
+
+    def load_views(self, name, build):
+        """
+        Get a view of each saved segment, e.g. the keys sorted in another
+        order for near-duplicate queries. The view of a segment is built by
+        `build` and saved next to it the first time, and memory-mapped
+        afterwards, so its cost is only paid once for each segment.
+
+        :param name: name of the view
+        :param build: function that takes a segment and returns its view
+        :return: list of the memory-mapped views, one for each segment
+        """
+        views = []
+        for segment_name, segment in zip(self.segment_names, self.segments):
+            path = os.path.join(self.path, f"{segment_name[:-len('.npy')]}.{name}.npy")
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                with open(tmp_path, "wb") as fout:
+                    np.save(fout, build(segment))
+                os.replace(tmp_path, path)
+            views.append(np.load(path, mmap_mode="r"))
+        return views
+
+    def add(self, keys):
+        """Add keys to the index, which are saved in the next `save`."""
+        keys = np.asarray(keys)
+        if len(keys) > 0:
+            self.pending.append(keys)
+
+    def save(self):
+        """Save the added keys that are not in the index yet as a new
+        segment, and compact the segments if there are too many."""
+        if not self.pending:
+            return
+        keys = np.unique(np.concatenate(self.pending))
+        self.pending = []
+        keys = keys[~self.contains(keys)]
+        if len(keys) == 0:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        if len(self.segments) + 1 > MAX_SEGMENTS:
+            keys = np.unique(np.concatenate(self.segments + [keys]))
+            old_names = self.segment_names
+            self.segment_names = []
+        else:
+            old_names = []
+        name = f"segment-{uuid.uuid4().hex}.npy"
+        np.save(os.path.join(self.path, name), keys)
+        self.segment_names.append(name)
+        self._write_meta()
+        # the segments are memory-mapped again to release the merged ones
+        self.segments = [np.load(os.path.join(self.path, name), mmap_mode="r") for name in self.segment_names]
+        # remove the merged segments together with their views
+        old_prefixes = tuple(old_name[: -len(".npy")] + "." for old_name in old_names)
+        for old_name in old_names:
+            os.remove(os.path.join(self.path, old_name))
+        if old_prefixes:
+            for filename in os.listdir(self.path):
+                if filename.startswith(old_prefixes):
+                    os.remove(os.path.join(self.path, filename))
+        logger.info(f"Saved dedup index of {len(self)} keys to [{self.path}].")
+
+    def _write_meta(self):
+        meta = {
+            "op_name": self.op_name,
+            "op_config": self.op_config,
+            "segments": self.segment_names,
+        }
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w") as fout:
+            json.dump(meta, fout, indent=2, default=str)
+        # replace the meta file atomically so a crash never leaves an index
+        # pointing to partial segments
+        os.replace(tmp_path, self.meta_path)
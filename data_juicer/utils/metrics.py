@@ -0,0 +1,411 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loguru import logger
+
+# the metrics are configured by environment variables, so that worker
+# processes report to the exporter of the main process
+METRICS_DIR_ENV = "DATA_JUICER_METRICS_DIR"
+METRICS_PID_ENV = "DATA_JUICER_METRICS_PID"
+
+METRIC_PREFIX = "data_juicer_"
+
+# metrics of worker processes are flushed to their files at most once per
+# interval in seconds
+WORKER_FLUSH_INTERVAL = 1.0
+
+# help and type of the known metrics
+METRICS = {
+    "ops": ("gauge", "Number of OPs to run."),
+    "ops_done": ("gauge", "Number of finished OPs."),
+    "current_op": ("gauge", "The OP running now, labeled by its name and index."),
+    "op_samples_in": ("gauge", "Number of input samples of each finished OP."),
+    "op_samples_out": ("gauge", "Number of output samples of each finished OP."),
+    "op_duration_seconds": ("gauge", "Wall time of each finished OP."),
+    "op_throughput_samples_per_second": ("gauge", "Input samples per second of each finished OP."),
+    "op_samples_processed_total": ("counter", "Number of samples processed by the workers of each OP so far."),
+    "dataset_cache_bytes": ("gauge", "Size of the cache files of the current dataset."),
+    "cache_bytes": ("gauge", "Size of the cache directories, labeled by cache."),
+    "model_loads_total": ("counter", "Number of models loaded, labeled by model."),
+    "model_load_seconds_total": ("counter", "Time spent on loading models, labeled by model."),
+    "model_preload_queue_depth": ("gauge", "Number of models being preloaded."),
+    "api_requests_total": ("counter", "Number of requests sent to API models."),
+    "api_requests_in_flight": ("gauge", "Number of requests to API models waiting for responses."),
+    "exported_samples_total": ("counter", "Number of samples exported."),
+    "log_messages_total": ("counter", "Number of warning and error logs, labeled by level."),
+    "uptime_seconds": ("gauge", "Seconds since the metrics exporter started."),
+}
+
+_LOCK = threading.RLock()
+# {(name, labels): value}, where labels is a sorted tuple of (key, value)
+_VALUES = {}
+_LAST_FLUSH = 0.0
+_HOOKS_INSTALLED = False
+
+
+def _reset_after_fork():
+    # forked workers report their own metrics only, instead of the inherited
+    # ones of the main process
+    global _LOCK, _LAST_FLUSH
+    _LOCK = threading.RLock()
+    _VALUES.clear()
+    _LAST_FLUSH = 0.0
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def is_metrics_enabled():
+    """Whether the metrics are enabled in the current process."""
+    return bool(os.environ.get(METRICS_DIR_ENV))
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc_metric(name, value=1, **labels):
+    """
+    Increase a counter or gauge in the current process. It's a no-op if
+    the metrics are not enabled.
+
+    :param name: name of the metric without prefix
+    :param value: the value to add
+    :param labels: labels of the metric
+    """
+    if not is_metrics_enabled():
+        return
+    key = _key(name, labels)
+    with _LOCK:
+        _VALUES[key] = _VALUES.get(key, 0) + value
+    _maybe_flush()
+
+
+def set_metric(name, value, **labels):
+    """
+    Set a gauge in the current process. It's a no-op if the metrics are not
+    enabled.
+
+    :param name: name of the metric without prefix
+    :param value: the value of the gauge
+    :param labels: labels of the metric
+    """
+    if not is_metrics_enabled():
+        return
+    with _LOCK:
+        _VALUES[_key(name, labels)] = value
+    _maybe_flush()
+
+
+def clear_metric(name):
+    """Remove all the label sets of a metric in the current process."""
+    with _LOCK:
+        for key in [key for key in _VALUES if key[0] == name]:
+            del _VALUES[key]
+
+
+def _is_exporter_process():
+    return os.environ.get(METRICS_PID_ENV) == str(os.getpid())
+
+
+def _maybe_flush(force=False):
+    """Write the metrics of a worker process to its file, so they are
+    collected by the exporter of the main process."""
+    global _LAST_FLUSH
+    if _is_exporter_process():
+        return
+    now = time.time()
+    if not force and now - _LAST_FLUSH < WORKER_FLUSH_INTERVAL:
+        return
+    metrics_dir = os.environ.get(METRICS_DIR_ENV)
+    if not metrics_dir:
+        return
+    with _LOCK:
+        values = [[name, list(labels), value] for (name, labels), value in _VALUES.items()]
+        _LAST_FLUSH = now
+    path = os.path.join(metrics_dir, f"worker-{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as fout:
+        json.dump(values, fout)
+    os.replace(tmp_path, path)
+
+
+def flush_metrics():
+    """Write the metrics of the current worker process to its file."""
+    if is_metrics_enabled():
+        _maybe_flush(force=True)
+
+
+def _install_hooks():
+    """Flush the metrics of a worker when a writer of the results is
+    finalized, i.e. a shard of a map is done, so the counts of the last
+    batches are not lost when the worker is terminated."""
+    global _HOOKS_INSTALLED
+    if _HOOKS_INSTALLED:
+        return
+    from data_juicer.utils.process_utils import add_writer_hooks
+
+    add_writer_hooks(on_finalize=flush_metrics)
+    _HOOKS_INSTALLED = True
+
+
+def count_samples(function, op_name):
+    """
+    Wrap a function applied by a map of datasets to count the samples it
+    processes in the worker processes.
+
+    :param function: the function to wrap
+    :param op_name: name of the OP the function belongs to
+    :return: the wrapped function
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        _install_hooks()
+        result = function(*args, **kwargs)
+        batch = args[0] if args else None
+        if isinstance(batch, dict):
+            first = next(iter(batch.values()), None)
+            num = len(first) if isinstance(first, list) else 1
+        else:
+            num = getattr(batch, "num_rows", 1)
+        inc_metric("op_samples_processed_total", num, op=op_name)
+        return result
+
+    return wrapper
+
+
+def _is_pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for fn in files:
+            try:
+                total += os.path.getsize(os.path.join(root, fn))
+            except OSError:
+                pass
+    return total
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsExporter:
+    """
+    Publish the live metrics of a running job, e.g. the current OP, samples
+    in/out and throughput of each OP, cache sizes, model loads and error
+    logs, in the Prometheus text format. They are served over HTTP on
+    `port` and/or rewritten to the file `path` every `interval` seconds.
+
+    The metrics are collected in the main process, and worker processes
+    report their counters, e.g. the samples processed by a running OP and
+    the models they load, through files in a temporary directory. The files
+    of exited workers are removed once their counters are merged.
+    """
+
+    def __init__(self, work_dir, port=None, path=None, interval=15, cache_dirs=None, host="127.0.0.1"):
+        """
+        Initialization method.
+
+        :param work_dir: the work dir to store the reports of workers
+        :param port: the local port to serve the metrics on `/metrics`.
+            Not served if it's None.
+        :param path: the file to rewrite the metrics to periodically. Not
+            written if it's None.
+        :param interval: the interval to rewrite the metrics file and
+            measure the sizes of cache directories in seconds
+        :param cache_dirs: dict of cache names to the cache directories to
+            report the sizes of
+        :param host: the host to serve the metrics on. It's the loopback
+            address in default, and it can be set to "0.0.0.0" to serve on
+            all interfaces.
+        """
+        self.metrics_dir = os.path.join(work_dir, ".metrics")
+        self.host = host
+        self.port = port
+        self.path = path
+        self.interval = interval
+        self.cache_dirs = {name: path for name, path in (cache_dirs or {}).items() if path}
+        self._start_time = None
+        self._server = None
+        self._stop = threading.Event()
+        self._threads = []
+        self._log_handler = None
+        self._cache_sizes = {}
+        self._cache_sizes_time = 0.0
+        # the counters of exited workers, which are merged by collect under
+        # the lock since it's called by multiple server threads
+        self._exited_values = {}
+        self._collect_lock = threading.Lock()
+
+    def start(self):
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        for fn in os.listdir(self.metrics_dir):
+            os.remove(os.path.join(self.metrics_dir, fn))
+        self._exited_values = {}
+        os.environ[METRICS_DIR_ENV] = self.metrics_dir
+        os.environ[METRICS_PID_ENV] = str(os.getpid())
+        self._start_time = time.time()
+        self._stop.clear()
+        self._log_handler = logger.add(
+            lambda message: inc_metric("log_messages_total", level=message.record["level"].name),
+            level="WARNING",
+            format="{message}",
+        )
+
+        if self.port is not None:
+            exporter = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] not in ("/", "/metrics"):
+                        self.send_error(404)
+                        return
+                    body = exporter.render().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+            self._server.daemon_threads = True
+            self._threads.append(threading.Thread(target=self._server.serve_forever, daemon=True))
+            logger.info(f"Serving metrics on [http://{self.host}:{self._server.server_port}/metrics].")
+        if self.path is not None:
+            self._threads.append(threading.Thread(target=self._write_periodically, daemon=True))
+            logger.info(f"Writing metrics to [{self.path}] every {self.interval}s.")
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.path is not None:
+            self.write()
+        if self._log_handler is not None:
+            logger.remove(self._log_handler)
+            self._log_handler = None
+        os.environ.pop(METRICS_DIR_ENV, None)
+        os.environ.pop(METRICS_PID_ENV, None)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _write_periodically(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                logger.warning(f"Failed to write metrics to [{self.path}]: {e}")
+
+    def write(self):
+        """Rewrite the metrics file atomically."""
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(dirname, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as fout:
+            fout.write(self.render())
+        os.replace(tmp_path, self.path)
+
+    def collect(self):
+        """
+        Collect the metrics of the main process and the worker processes.
+        Counters and gauges of the same labels are summed across processes.
+
+        :return: dict of (name, labels) to values
+        """
+        with _LOCK:
+            values = dict(_VALUES)
+        with self._collect_lock:
+            self._collect_workers(values)
+
+        now = time.time()
+        if self._start_time is not None:
+            values[("uptime_seconds", ())] = now - self._start_time
+        if self.cache_dirs and now - self._cache_sizes_time >= self.interval:
+            self._cache_sizes = {name: _dir_size(path) for name, path in self.cache_dirs.items()}
+            self._cache_sizes_time = now
+        for name, size in self._cache_sizes.items():
+            values[("cache_bytes", (("cache", name),))] = size
+        return values
+
+    def _collect_workers(self, values):
+        """Add the metrics of worker processes to values. The files of
+        exited workers are removed after their counters are merged."""
+        if os.path.isdir(self.metrics_dir):
+            for fn in os.listdir(self.metrics_dir):
+                if not (fn.startswith("worker-") and fn.endswith(".json")):
+                    continue
+                # check before reading, so the last flush of an exited worker
+                # is always read
+                exited = not _is_pid_alive(int(fn[len("worker-") : -len(".json")]))
+                path = os.path.join(self.metrics_dir, fn)
+                try:
+                    with open(path) as fin:
+                        worker_values = json.load(fin)
+                except (OSError, ValueError):
+                    continue
+                for name, labels, value in worker_values:
+                    key = (name, tuple(tuple(label) for label in labels))
+                    if not exited:
+                        values[key] = values.get(key, 0) + value
+                    elif METRICS.get(name, ("untyped",))[0] == "counter":
+                        # the gauges of exited workers are dropped
+                        self._exited_values[key] = self._exited_values.get(key, 0) + value
+                if exited:
+                    os.remove(path)
+        for key, value in self._exited_values.items():
+            values[key] = values.get(key, 0) + value
+
+    def render(self):
+        """Render the collected metrics in the Prometheus text format."""
+        grouped = defaultdict(list)
+        for (name, labels), value in self.collect().items():
+            grouped[name].append((labels, value))
+        lines = []
+        for name in sorted(grouped):
+            metric_type, help_text = METRICS.get(name, ("untyped", ""))
+            full_name = METRIC_PREFIX + name
+            if help_text:
+                lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            for labels, value in sorted(grouped[name]):
+                label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                label_str = f"{{{label_str}}}" if label_str else ""
+                lines.append(f"{full_name}{label_str} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
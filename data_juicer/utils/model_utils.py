@@ -2,6 +2,11 @@ import fnmatch
 import inspect
 import io
 import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import redirect_stderr
 from functools import partial
 from pickle import UnpicklingError
@@ -15,10 +20,16 @@ from loguru import logger
 from data_juicer import cuda_device_count
 from data_juicer.utils.common_utils import nested_access
 from data_juicer.utils.lazy_loader import LazyLoader
+from data_juicer.utils.metrics import inc_metric, set_metric
 from data_juicer.utils.nltk_utils import (
     ensure_nltk_resource,
     patch_nltk_pickle_security,
 )
+from data_juicer.utils.op_result_cache import (
+    api_response_key,
+    get_api_response_cache,
+)
+from data_juicer.utils.profiler import record_model_load
 
 from .cache_utils import DATA_JUICER_MODELS_CACHE as DJMC
 
@@ -39,7 +50,26 @@ ultralytics = LazyLoader("ultralytics")
 tiktoken = LazyLoader("tiktoken")
 dashscope = LazyLoader("dashscope")
 
-MODEL_ZOO = {}
+# loaded models shared across OPs, keyed by `model_residency_key` in the
+# least recently used order
+MODEL_ZOO = OrderedDict()
+_MODEL_SIZES = {}
+
+# numbers of upcoming OPs using each model and the memory budget of loaded
+# models in bytes, which are set by `plan_models`
+MODEL_REFS = None
+MODEL_MEM_BUDGET = None
+# whether to load models of OPs running in forked workers in the main process
+# in advance, so the workers share them copy-on-write
+SHARE_MODELS = False
+
+# models being loaded in background by `preload_models`, which are only
+# valid in the process that starts the loading
+_PRELOAD_EXECUTOR = None
+_PRELOADING = {}
+_PRELOAD_PID = os.getpid()
+# guards the model zoo against concurrent samples of OPs calling APIs
+_MODEL_ZOO_LOCK = threading.RLock()
 
 # Default cached models links for downloading
 MODEL_LINKS = "https://dail-wlcb.oss-cn-wulanchabu.aliyuncs.com/" "data_juicer/models/"
@@ -139,11 +169,51 @@ def filter_arguments(func, args_dict):
     return filtered_args
 
 
+class TokenBucket:
+    """
+    Thread-safe token bucket to limit the rate of requests. Tokens are
+    refilled continuously at `rate` per second up to `capacity`, and each
+    request takes one token, waiting until it's available.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Initialization method.
+
+        :param rate: number of tokens refilled per second.
+        :param capacity: max number of tokens, i.e. the max burst of
+            requests. Defaults to max(1, rate).
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # reserve the token in advance, so waiting requests are served
+            # in order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
 class ChatAPIModel:
-    def __init__(self, model, endpoint=None, response_path=None, **kwargs):
+    def __init__(self, model, endpoint=None, response_path=None, rate_limit=None, **kwargs):
         """
         Initializes an instance of the APIModel class.
 
+        The instance is thread-safe, and the concurrent calls from the
+        samples of an OP with `api_concurrency` share the connection pool of
+        its client. Failed requests due to connection errors, rate limits
+        and server errors are retried with exponential backoff by the client,
+        up to `max_retries` times.
+
         :param model: The name of the model to be used for making API
             calls. This should correspond to a valid model identifier
             recognized by the API server.
@@ -156,16 +226,41 @@ class ChatAPIModel:
             extract the desired content from the API response. The default
             value is 'choices.0.message.content', which corresponds to the
             typical structure of an OpenAI API response.
+        :param rate_limit: The max number of requests per second of each
+            process. Defaults to None, which means no limit.
         :param kwargs: Additional keyword arguments for configuring the
             internal OpenAI client.
         """
         self.model = model
         self.endpoint = endpoint or "/chat/completions"
         self.response_path = response_path or "choices.0.message.content"
+        self._rate_limiter = TokenBucket(rate_limit) if rate_limit else None
 
         client_args = filter_arguments(openai.OpenAI, kwargs)
         self._client = openai.OpenAI(**client_args)
 
+    def _post(self, body, **kwargs):
+        # streamed responses are not cached
+        cache = None if kwargs.get("stream") else get_api_response_cache()
+        if cache is not None:
+            key = api_response_key(str(self._client.base_url), self.endpoint, body)
+            result = cache.get_many([key])[0]
+            if result is not None:
+                return result
+        # the requests waiting for the rate limiter are in flight as well
+        inc_metric("api_requests_in_flight")
+        try:
+            if self._rate_limiter is not None:
+                self._rate_limiter.acquire()
+            inc_metric("api_requests_total")
+            response = self._client.post(self.endpoint, body=body, cast_to=httpx.Response, **kwargs)
+            result = response.json()
+        finally:
+            inc_metric("api_requests_in_flight", -1)
+        if cache is not None:
+            cache.put_many([(key, result)])
+        return result
+
     def __call__(self, messages, **kwargs):
         """
         Sends messages to the configured API model and returns the parsed
@@ -187,18 +282,15 @@ class ChatAPIModel:
         stream_cls = openai.Stream[openai.types.chat.ChatCompletionChunk]
 
         try:
-            response = self._client.post(
-                self.endpoint, body=body, cast_to=httpx.Response, stream=stream, stream_cls=stream_cls
-            )
-            result = response.json()
+            result = self._post(body, stream=stream, stream_cls=stream_cls)
             return nested_access(result, self.response_path)
         except Exception as e:
             logger.exception(e)
             return ""
 
 
-class EmbeddingAPIModel:
-    def __init__(self, model, endpoint=None, response_path=None, **kwargs):
+class EmbeddingAPIModel(ChatAPIModel):
+    def __init__(self, model, endpoint=None, response_path=None, rate_limit=None, **kwargs):
         """
         Initializes an instance specialized for embedding APIs.
 
@@ -206,14 +298,17 @@ class EmbeddingAPIModel:
         :param endpoint: API endpoint URL. Defaults to '/embeddings'.
         :param response_path: Path to extract embeddings from response.
             Defaults to 'data.0.embedding'.
+        :param rate_limit: Max number of requests per second of each
+            process. Defaults to None, which means no limit.
         :param kwargs: Configuration for the OpenAI client.
         """
-        self.model = model
-        self.endpoint = endpoint or "/embeddings"
-        self.response_path = response_path or "data.0.embedding"
-
-        client_args = filter_arguments(openai.OpenAI, kwargs)
-        self._client = openai.OpenAI(**client_args)
+        super().__init__(
+            model,
+            endpoint=endpoint or "/embeddings",
+            response_path=response_path or "data.0.embedding",
+            rate_limit=rate_limit,
+            **kwargs,
+        )
 
     def __call__(self, input, **kwargs):
         """
@@ -230,8 +325,7 @@ class EmbeddingAPIModel:
         body.update(kwargs)
 
         try:
-            response = self._client.post(self.endpoint, body=body, cast_to=httpx.Response)
-            result = response.json()
+            result = self._post(body)
             return nested_access(result, self.response_path) or []
         except Exception as e:
             logger.exception(f"Embedding API error: {e}")
@@ -837,6 +931,40 @@ def prepare_video_blip_model(pretrained_model_name_or_path, *, return_model=True
     return (model, processor) if return_model else processor
 
 
+class CachedChatLLM:
+    """
+    Proxy of a vLLM engine, whose `chat` outputs are cached in the API
+    response cache, keyed by the model, sampling params and messages. Other
+    attributes are delegated to the engine.
+    """
+
+    def __init__(self, llm, model_name):
+        """
+        Initialization method.
+
+        :param llm: the vLLM engine
+        :param model_name: name or path of the model of the engine
+        """
+        self.llm = llm
+        self.model_name = model_name
+
+    def chat(self, messages, sampling_params=None, **kwargs):
+        cache = get_api_response_cache()
+        if cache is None or kwargs:
+            return self.llm.chat(messages, sampling_params, **kwargs)
+        key = api_response_key("vllm", self.model_name, repr(sampling_params), messages)
+        outputs = cache.get_many([key])[0]
+        if outputs is None:
+            outputs = self.llm.chat(messages, sampling_params)
+            cache.put_many([(key, outputs)])
+        return outputs
+
+    def __getattr__(self, name):
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+
 def prepare_vllm_model(pretrained_model_name_or_path, **model_params):
     """
     Prepare and load a HuggingFace model with the corresponding processor.
@@ -852,6 +980,8 @@ def prepare_vllm_model(pretrained_model_name_or_path, **model_params):
 
     model = vllm.LLM(model=pretrained_model_name_or_path, generation_config="auto", **model_params)
     tokenizer = model.get_tokenizer()
+    if get_api_response_cache() is not None:
+        model = CachedChatLLM(model, pretrained_model_name_or_path)
 
     return (model, tokenizer)
 
@@ -977,25 +1107,208 @@ def prepare_model(model_type, **model_kwargs):
     return model_key
 
 
+def model_residency_key(model_key, device="cpu"):
+    """
+    Get the key to share a model across OPs. Models are identified by their
+    prepare functions and arguments, instead of the identity of the model
+    keys returned by `prepare_model`, so OPs preparing the same model share
+    one loaded instance.
+
+    :param model_key: the model key returned by `prepare_model`
+    :param device: the device to load the model on
+    :return: a hashable key
+    """
+    if isinstance(model_key, partial):
+        func, args, kwargs = model_key.func, model_key.args, model_key.keywords
+    else:
+        func, args, kwargs = model_key, (), {}
+    name = f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}"
+    return name, repr(args), repr(sorted(kwargs.items())), device
+
+
+def get_op_model_keys(op):
+    """
+    Get the model keys prepared by an OP, including those of the OPs fused
+    in it.
+
+    :param op: the OP instance
+    :return: list of model keys
+    """
+    model_funcs = set(MODEL_FUNCTION_MAPPING.values())
+    model_keys = []
+    for value in vars(op).values():
+        if isinstance(value, partial) and value.func in model_funcs:
+            model_keys.append(value)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                if hasattr(item, "_name") and hasattr(item, "run"):
+                    model_keys.extend(get_op_model_keys(item))
+    return model_keys
+
+
+def estimate_model_size(model):
+    """Estimate the memory size of a loaded model in bytes from its torch
+    parameters and buffers. Models of other types are regarded as 0."""
+    if isinstance(model, (list, tuple)):
+        return sum(estimate_model_size(m) for m in model)
+    if isinstance(model, dict):
+        return sum(estimate_model_size(m) for m in model.values())
+    if "torch" in sys.modules and isinstance(model, torch.nn.Module):
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    return 0
+
+
+def plan_models(ops, mem_budget=None, share_models=False):
+    """
+    Plan the residency of models for a list of OPs to run. Models are kept
+    loaded across OPs until no upcoming OPs use them, instead of being freed
+    after each OP, and the least recently used ones are evicted if their total
+    size exceeds the memory budget.
+
+    :param ops: the list of OPs to run
+    :param mem_budget: the memory budget of resident models in bytes. In
+        default, it's None, which means no limit.
+    :param share_models: whether to load the models of OPs running in forked
+        workers in the main process in advance, so the workers share them
+        copy-on-write instead of loading their own copies.
+    """
+    global MODEL_REFS, MODEL_MEM_BUDGET, SHARE_MODELS
+    MODEL_REFS = Counter(model_residency_key(key)[:-1] for op in ops for key in get_op_model_keys(op))
+    MODEL_MEM_BUDGET = mem_budget
+    SHARE_MODELS = share_models
+
+
+def _load_model(model_key, device):
+    start = time.time()
+    model = model_key(device=device)
+    end = time.time()
+    model_name = model_residency_key(model_key, device)[0]
+    record_model_load(model_name, start, end)
+    inc_metric("model_loads_total", model=model_name)
+    inc_metric("model_load_seconds_total", end - start, model=model_name)
+    return model
+
+
+def preload_models(op, background=False):
+    """
+    Load the models of an OP on cpu in the current process before it runs,
+    so that they are shared by the OPs using them, and inherited by forked
+    workers copy-on-write.
+
+    :param op: the OP to preload models for
+    :param background: whether to load the models in a background thread,
+        so the loading overlaps with the running OP. The background thread
+        must be finished by `wait_preloaded_models` before forking workers.
+    """
+    global _PRELOAD_EXECUTOR
+    for model_key in get_op_model_keys(op):
+        key = model_residency_key(model_key)
+        if key in MODEL_ZOO or key in _PRELOADING:
+            continue
+        if background:
+            if _PRELOAD_EXECUTOR is None:
+                _PRELOAD_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model_preload")
+            logger.debug(f"Preloading model {key[0]} in background...")
+            _PRELOADING[key] = _PRELOAD_EXECUTOR.submit(_load_model, model_key, "cpu")
+            set_metric("model_preload_queue_depth", len(_PRELOADING))
+        else:
+            get_model(model_key)
+
+
+def wait_preloaded_models():
+    """Wait for the models being loaded in background and add them to the
+    model zoo."""
+    for key in list(_PRELOADING):
+        future = _PRELOADING.pop(key)
+        try:
+            MODEL_ZOO[key] = future.result()
+            _MODEL_SIZES[key] = estimate_model_size(MODEL_ZOO[key])
+        except Exception as e:
+            # leave it to be loaded by the OP
+            logger.warning(f"Failed to preload model {key[0]}: {e}")
+    set_metric("model_preload_queue_depth", 0)
+    _evict_models()
+
+
+def _free_model(key):
+    model = MODEL_ZOO.pop(key, None)
+    _MODEL_SIZES.pop(key, None)
+    try:
+        model.to("cpu")
+    except Exception:
+        pass
+    del model
+
+
+def _evict_models(keep=None):
+    """Evict the least recently used models beyond the memory budget. Models
+    not used by upcoming OPs are evicted first."""
+    if MODEL_MEM_BUDGET is None:
+        return
+    total = sum(_MODEL_SIZES.values())
+    candidates = [key for key in MODEL_ZOO if key != keep]
+    if MODEL_REFS is not None:
+        candidates.sort(key=lambda key: MODEL_REFS.get(key[:-1], 0) > 0)
+    for key in candidates:
+        if total <= MODEL_MEM_BUDGET:
+            break
+        logger.debug(f"Evict model {key[0]} beyond the memory budget.")
+        total -= _MODEL_SIZES.get(key, 0)
+        _free_model(key)
+
+
 def get_model(model_key=None, rank=None, use_cuda=False):
     if model_key is None:
         return None
 
-    global MODEL_ZOO
-    if model_key not in MODEL_ZOO:
-        logger.debug(f"{model_key} not found in MODEL_ZOO ({mp.current_process().name})")
-        if use_cuda:
-            rank = rank if rank is not None else 0
-            rank = rank % cuda_device_count()
-            device = f"cuda:{rank}"
+    if use_cuda and cuda_device_count() > 0:
+        rank = rank if rank is not None else 0
+        rank = rank % cuda_device_count()
+        device = f"cuda:{rank}"
+    else:
+        device = "cpu"
+    key = model_residency_key(model_key, device)
+    with _MODEL_ZOO_LOCK:
+        if key in _PRELOADING and _PRELOAD_PID == os.getpid():
+            wait_preloaded_models()
+        if key not in MODEL_ZOO:
+            logger.debug(f"{key[0]} not found in MODEL_ZOO ({mp.current_process().name})")
+            MODEL_ZOO[key] = _load_model(model_key, device)
+            _MODEL_SIZES[key] = estimate_model_size(MODEL_ZOO[key])
+            _evict_models(keep=key)
         else:
-            device = "cpu"
-        MODEL_ZOO[model_key] = model_key(device=device)
-    return MODEL_ZOO[model_key]
+            MODEL_ZOO.move_to_end(key)
+        return MODEL_ZOO[key]
+
+
+def is_api_model_key(model_key):
+    """Whether the model key is prepared for a model called through APIs."""
+    return isinstance(model_key, partial) and model_key.func is prepare_api_model
+
+
+def release_models(op=None):
+    """
+    Release the models used by an OP after it's done. If models are planned
+    by `plan_models`, only the models not used by upcoming OPs are freed.
+    Otherwise, all models are freed.
+
+    :param op: the OP that is done
+    """
+    if MODEL_REFS is None or op is None:
+        free_models()
+        return
+    for model_key in get_op_model_keys(op):
+        MODEL_REFS[model_residency_key(model_key)[:-1]] -= 1
+    for key in list(MODEL_ZOO):
+        if MODEL_REFS.get(key[:-1], 0) <= 0:
+            _free_model(key)
+    if "torch" in sys.modules:
+        torch.cuda.empty_cache()
 
 
 def free_models(clear_model_zoo=True):
-    global MODEL_ZOO
+    global MODEL_REFS, MODEL_MEM_BUDGET, SHARE_MODELS
     for model_key in MODEL_ZOO:
         try:
             model = MODEL_ZOO[model_key]
@@ -1006,4 +1319,8 @@ def free_models(clear_model_zoo=True):
             pass
     if clear_model_zoo:
         MODEL_ZOO.clear()
+        _MODEL_SIZES.clear()
+        MODEL_REFS = None
+        MODEL_MEM_BUDGET = None
+        SHARE_MODELS = False
     torch.cuda.empty_cache()
@@ -0,0 +1,293 @@
+import json
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from fnmatch import fnmatch
+from functools import partial
+
+import xxhash
+from loguru import logger
+
+# attributes of OPs that only affect how they run instead of their results
+RUNTIME_ATTRS = {
+    "accelerator",
+    "api_concurrency",
+    "audit_usage",
+    "batch_size",
+    "cpu_required",
+    "index_key",
+    "mem_required",
+    "num_proc",
+    "op_result_cache_dir",
+    "op_result_cache_size",
+    "skip_op_error",
+    "stats_export_path",
+    "turbo",
+    "work_dir",
+}
+
+# rows evicted in each round, relative to the number of cached rows
+EVICT_RATIO = 0.1
+
+
+# the on-disk cache of API and vLLM responses is configured by environment
+# variables, so that it's enabled in all worker processes
+API_RESPONSE_CACHE_DIR_ENV = "DATA_JUICER_API_RESPONSE_CACHE_DIR"
+API_RESPONSE_CACHE_SIZE_ENV = "DATA_JUICER_API_RESPONSE_CACHE_SIZE"
+_API_RESPONSE_CACHE = None
+
+
+def normalize_op_args(op, ignored_attrs=()):
+    """
+    Get the normalized arguments of an OP from its public attributes, which
+    are used to identify the results of the OP. Runtime attributes and the
+    attributes matching the ignored patterns are excluded. Values are
+    converted to json-serializable ones, e.g. model keys to their model
+    functions and arguments, and objects of other types to their type names.
+
+    :param op: the OP instance
+    :param ignored_attrs: name patterns of the extra attributes to exclude
+    :return: dict of the normalized arguments
+    """
+
+    def normalize(value):
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, re.Pattern):
+            return value.pattern
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        if isinstance(value, (set, frozenset)):
+            return sorted((normalize(v) for v in value), key=str)
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in value.items()}
+        if isinstance(value, partial):
+            # model keys returned by prepare_model
+            return {
+                "func": f"{value.func.__module__}.{value.func.__qualname__}",
+                "args": normalize(value.args),
+                "keywords": normalize(value.keywords),
+            }
+        return f"<{type(value).__module__}.{type(value).__qualname__}>"
+
+    return {
+        name: normalize(value)
+        for name, value in vars(op).items()
+        if not name.startswith("_")
+        and name not in RUNTIME_ATTRS
+        and not any(fnmatch(name, pattern) for pattern in ignored_attrs)
+    }
+
+
+def sample_digest(sample, keys, media_keys=()):
+    """
+    Compute the digest of the fields of a sample that an OP reads. For
+    media fields, the size and modification time of local files are
+    included as well, so that the results are recomputed if the files are
+    changed.
+
+    :param sample: the sample in dict
+    :param keys: the keys of the fields to read
+    :param media_keys: the keys of the fields storing media paths
+    :return: bytes digest
+    """
+    m = xxhash.xxh3_128()
+    for key in keys:
+        if key not in sample:
+            continue
+        value = sample[key]
+        m.update(key.encode("utf-8"))
+        m.update(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        if key in media_keys and value:
+            for path in value if isinstance(value, list) else [value]:
+                if isinstance(path, str) and os.path.isfile(path):
+                    stat = os.stat(path)
+                    m.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return m.digest()
+
+
+class OpResultCache:
+    """
+    Persistent content-addressed cache of per-sample OP results, so that
+    expensive results (e.g. stats computed by model-based Filters and
+    outputs of model-based Mappers) of unchanged samples are reused across
+    runs.
+
+    Results are keyed by the OP name, the normalized OP arguments and the
+    digest of the input fields of the sample, and stored in an embedded
+    SQLite database in WAL mode, which can be shared by multiple processes.
+    When the database exceeds the max size, the least recently used results
+    are evicted. The numbers of cache hits and misses are counted in the
+    database as well.
+
+    The same storage backs the cache of API/vLLM responses of LLM-based OPs,
+    see `get_api_response_cache`.
+    """
+
+    def __init__(self, cache_dir, max_size=10 << 30, name="op_result_cache"):
+        """
+        Initialization method.
+
+        :param cache_dir: directory to store the cache database
+        :param max_size: max size of the cache database in bytes
+        :param name: name of the cache database file
+        """
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, f"{name}.sqlite")
+        self.max_size = max_size
+        self._conn = None
+        self._pid = None
+        # the connection is shared by the threads of a process
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        # the connection can't be shared across processes
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        state["_pid"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self):
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results " "(key BLOB PRIMARY KEY, value BLOB, last_access REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def make_key(op_fingerprint, digest):
+        return xxhash.xxh3_128(op_fingerprint.encode("utf-8") + digest).digest()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def counters(self):
+        """The numbers of hits and misses of the cache, which are accumulated
+        across processes and runs."""
+        with self._lock:
+            counters = dict(self.conn.execute("SELECT name, value FROM counters").fetchall())
+            return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0)}
+
+    def get_many(self, keys):
+        """
+        Get the cached results of keys, and refresh their last access time
+        and the hit/miss counters.
+
+        :param keys: list of keys
+        :return: list of results, None for the keys not cached
+        """
+        if not keys:
+            return []
+        with self._lock:
+            found = {}
+            # query in chunks to stay below the limit of SQL variables
+            for begin in range(0, len(keys), 500):
+                chunk = keys[begin : begin + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(rows)
+            now = time.time()
+            hits = sum(key in found for key in keys)
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("UPDATE results SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+                self.conn.executemany(
+                    "INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    [("hits", hits), ("misses", len(keys) - hits)],
+                )
+            return [pickle.loads(found[key]) if key in found else None for key in keys]
+
+    def put_many(self, items):
+        """
+        Cache the results of keys, and evict the least recently used results
+        if the cache exceeds the max size.
+
+        :param items: list of (key, result) pairs
+        """
+        if not items:
+            return
+        with self._lock:
+            now = time.time()
+            rows = [(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now) for key, value in items]
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", rows)
+            self.evict()
+
+    def size(self):
+        """The size of the pages in use of the cache database in bytes."""
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - freelist_count) * page_size
+
+    def evict(self):
+        """Evict the least recently used results until the cache is within
+        the max size. Freed pages are reused by later results."""
+        if self.size() <= self.max_size:
+            # it's called after each batch is put, so the rows are only
+            # counted when they need to be evicted
+            return
+        num_rows = len(self)
+        while num_rows > 0 and self.size() > self.max_size:
+            num = max(int(num_rows * EVICT_RATIO), 1)
+            with self.conn:
+                self.conn.execute("BEGIN")
+                deleted = self.conn.execute(
+                    "DELETE FROM results WHERE key IN " "(SELECT key FROM results ORDER BY last_access LIMIT ?)",
+                    (num,),
+                ).rowcount
+            logger.debug(f"Evicted {deleted} results from the OP result cache [{self.path}].")
+            if deleted == 0:
+                break
+            num_rows -= deleted
+
+
+def enable_api_response_cache(cache_dir, max_size=10 << 30):
+    """
+    Enable the on-disk cache of the responses of API models and vLLM chats,
+    for the current process and the worker processes started later.
+
+    :param cache_dir: directory to store the cache database
+    :param max_size: max size of the cache database in bytes. The least
+        recently used responses are evicted beyond it.
+    """
+    os.environ[API_RESPONSE_CACHE_DIR_ENV] = cache_dir
+    os.environ[API_RESPONSE_CACHE_SIZE_ENV] = str(int(max_size))
+
+
+def get_api_response_cache():
+    """Get the response cache of API models and vLLM chats in the current
+    process, or None if it's not enabled."""
+    global _API_RESPONSE_CACHE
+    cache_dir = os.environ.get(API_RESPONSE_CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    if _API_RESPONSE_CACHE is None or _API_RESPONSE_CACHE.cache_dir != cache_dir:
+        max_size = int(os.environ.get(API_RESPONSE_CACHE_SIZE_ENV, 10 << 30))
+        _API_RESPONSE_CACHE = OpResultCache(cache_dir, max_size=max_size, name="api_response_cache")
+    return _API_RESPONSE_CACHE
+
+
+def api_response_key(*parts):
+    """Compute the cache key of a response from the parts of its request,
+    e.g. the model, endpoint, sampling params and rendered messages."""
+    request = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return xxhash.xxh3_128(request.encode("utf-8")).digest()
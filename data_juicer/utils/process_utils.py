@@ -1,6 +1,9 @@
 import math
 import os
 import subprocess
+import threading
+import time
+from functools import wraps
 
 import multiprocess as mp
 import psutil
@@ -8,6 +11,13 @@ from loguru import logger
 
 from data_juicer import cuda_device_count
 
+# callbacks on the Arrow writer of datasets, which writes the results of maps
+# in the worker processes. The writer is patched once for all callbacks.
+_WRITE_CALLBACKS = []
+_FINALIZE_CALLBACKS = []
+_WRITER_STATE = threading.local()
+_WRITER_HOOKS_INSTALLED = False
+
 
 def setup_mp(method=None):
     if mp.current_process().name != "MainProcess":
@@ -117,3 +127,61 @@ def calculate_np(name, mem_required, cpu_required, num_proc=None, use_cuda=False
             )
         op_proc = max(op_proc, 1)
         return op_proc
+
+
+def add_writer_hooks(on_write=None, on_finalize=None):
+    """
+    Register callbacks on the Arrow writer of datasets, which writes the
+    results of maps in the worker processes.
+
+    :param on_write: a callback called with the start and end time of each
+        write of results. Nested writes, e.g. `write_batch` calling
+        `write_table`, are reported once.
+    :param on_finalize: a callback called after a writer is finalized, i.e.
+        a shard of a map is done.
+    """
+    for callbacks, callback in [(_WRITE_CALLBACKS, on_write), (_FINALIZE_CALLBACKS, on_finalize)]:
+        if callback is not None and callback not in callbacks:
+            callbacks.append(callback)
+    _install_writer_hooks()
+
+
+def _install_writer_hooks():
+    global _WRITER_HOOKS_INSTALLED
+    if _WRITER_HOOKS_INSTALLED:
+        return
+    from datasets.arrow_writer import ArrowWriter
+
+    def timed(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            depth = getattr(_WRITER_STATE, "depth", 0)
+            if depth > 0 or not _WRITE_CALLBACKS:
+                return method(*args, **kwargs)
+            start = time.time()
+            _WRITER_STATE.depth = 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                _WRITER_STATE.depth = 0
+                end = time.time()
+                for callback in _WRITE_CALLBACKS:
+                    callback(start, end)
+
+        return wrapper
+
+    def finalized(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                for callback in _FINALIZE_CALLBACKS:
+                    callback()
+
+        return wrapper
+
+    for name in ["write", "write_batch", "write_table"]:
+        setattr(ArrowWriter, name, timed(getattr(ArrowWriter, name)))
+    ArrowWriter.finalize = finalized(ArrowWriter.finalize)
+    _WRITER_HOOKS_INSTALLED = True
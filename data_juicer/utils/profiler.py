@@ -0,0 +1,297 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from functools import partial, wraps
+
+from loguru import logger
+
+# the profiling is configured by environment variables, so that it's enabled
+# in all worker processes
+PROFILE_DIR_ENV = "DATA_JUICER_PROFILE_DIR"
+
+# phases of processing a batch in a worker
+PHASE_LOAD = "load"  # reading and deserializing the batch
+PHASE_FUNCTION = "function"  # the user function of the OP
+PHASE_WRITE = "write"  # serializing and writing the results
+PHASE_FILTER_INDEX = "filter_index"  # computing the indices of kept samples
+PHASE_MODEL_LOAD = "model_load"  # loading models, as a part of the function
+
+# events are buffered in each process, and flushed when a writer of the
+# results is finalized or the buffer is full
+MAX_BUFFERED_EVENTS = 10000
+
+_STATE = threading.local()
+_BUFFER = []
+_BUFFER_LOCK = threading.Lock()
+_HOOKS_INSTALLED = False
+# the label of the OP running in the main process
+_CURRENT_OP = None
+
+
+def enable_profiling(profile_dir):
+    """
+    Enable the profiling of OPs for the current process and the worker
+    processes started later. Events are written to `profile_dir`.
+
+    :param profile_dir: directory to store the profiling events and results
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    # clean up the events of previous runs
+    for fn in os.listdir(profile_dir):
+        if fn.startswith("events-") and fn.endswith(".jsonl"):
+            os.remove(os.path.join(profile_dir, fn))
+    os.environ[PROFILE_DIR_ENV] = profile_dir
+    _install_hooks()
+
+
+def disable_profiling():
+    """Flush the buffered events and stop profiling."""
+    flush_events()
+    os.environ.pop(PROFILE_DIR_ENV, None)
+
+
+def is_profiling():
+    """Whether the profiling is enabled in the current process."""
+    return bool(os.environ.get(PROFILE_DIR_ENV))
+
+
+def _install_hooks():
+    """Time the writing of results and flush the buffered events when a
+    writer of the results is finalized, i.e. a shard of a map is done, by
+    the shared hooks on the Arrow writer of datasets."""
+    global _HOOKS_INSTALLED
+    if _HOOKS_INSTALLED:
+        return
+    from data_juicer.utils.process_utils import add_writer_hooks
+
+    add_writer_hooks(on_write=_record_write, on_finalize=flush_events)
+    _HOOKS_INSTALLED = True
+
+
+def _record_write(start, end):
+    if getattr(_STATE, "op", None) is None:
+        return
+    _STATE.write_time = getattr(_STATE, "write_time", 0.0) + end - start
+    _record(_STATE.op, PHASE_WRITE, start, end)
+
+
+def start_op(idx, op_name):
+    """
+    Start the run of the OP at position `idx` of the recipe in the main
+    process. Its events are labeled by its index and name, so the runs of
+    the same OP in a recipe are summarized separately.
+
+    :param idx: the index of the OP in the recipe, starting from 1
+    :param op_name: name of the OP
+    :return: the label of the OP
+    """
+    global _CURRENT_OP
+    _CURRENT_OP = (op_name, f"{idx}_{op_name}")
+    return _CURRENT_OP[1]
+
+
+def get_op_label(op_name):
+    """Get the label of the running OP named `op_name`, or the name itself
+    if it's not started by `start_op`."""
+    if _CURRENT_OP is not None and _CURRENT_OP[0] == op_name:
+        return _CURRENT_OP[1]
+    return op_name
+
+
+def _record(op_name, phase, start, end, rows=None):
+    event = [op_name, phase, start, end - start, os.getpid(), threading.get_ident(), rows]
+    with _BUFFER_LOCK:
+        _BUFFER.append(event)
+        full = len(_BUFFER) >= MAX_BUFFERED_EVENTS
+    if full:
+        flush_events()
+
+
+def flush_events():
+    """Write the buffered events of the current process to its event file."""
+    profile_dir = os.environ.get(PROFILE_DIR_ENV)
+    with _BUFFER_LOCK:
+        events = _BUFFER[:]
+        _BUFFER.clear()
+    if not profile_dir or not events:
+        return
+    with open(os.path.join(profile_dir, f"events-{os.getpid()}.jsonl"), "a") as fout:
+        fout.write("".join(json.dumps(event) + "\n" for event in events))
+
+
+def get_filter_index_op(function):
+    """
+    Get the name of the OP whose profiled function is wrapped by `function`,
+    if `function` is the one used by `Dataset.filter` to compute the indices
+    of kept samples.
+
+    :param function: the function applied by a map of datasets
+    :return: name of the OP, or None if it's not a filter index function
+    """
+    while not isinstance(function, partial):
+        if not hasattr(function, "__wrapped__"):
+            return None
+        function = function.__wrapped__
+    if getattr(function.func, "__name__", None) != "get_indices_from_mask_function" or not function.args:
+        return None
+    return getattr(function.args[0], "profiled_op", None)
+
+
+def _num_rows(batch):
+    if isinstance(batch, dict):
+        first = next(iter(batch.values()), None)
+        return len(first) if isinstance(first, list) else 1
+    if hasattr(batch, "num_rows"):
+        return batch.num_rows
+    return 1
+
+
+def profile_function(function, op_name, phase=PHASE_FUNCTION):
+    """
+    Wrap a function applied by a map of datasets to record the time of its
+    calls in the worker processes. The gap between two calls, excluding the
+    time of writing results, is recorded as the time of loading the batch.
+    The time of the filter index phase includes the time of the function of
+    the Filter it wraps.
+
+    :param function: the function to wrap
+    :param op_name: name of the OP the function belongs to
+    :param phase: the phase of the function
+    :return: the wrapped function
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        _install_hooks()
+        start = time.time()
+        # only the outermost call, e.g. the filter index function wrapping
+        # the function of a Filter, accounts for the loading of batches
+        depth = getattr(_STATE, "depth", 0)
+        if depth == 0:
+            last_end = getattr(_STATE, "last_end", None)
+            if last_end is not None and getattr(_STATE, "op", None) == op_name:
+                load_start = last_end + getattr(_STATE, "write_time", 0.0)
+                if start > load_start:
+                    _record(op_name, PHASE_LOAD, load_start, start)
+            _STATE.op = op_name
+            _STATE.write_time = 0.0
+        _STATE.depth = depth + 1
+        try:
+            return function(*args, **kwargs)
+        finally:
+            end = time.time()
+            _STATE.depth = depth
+            _record(op_name, phase, start, end, _num_rows(args[0]) if args else None)
+            if depth == 0:
+                _STATE.last_end = end
+
+    wrapper.profiled_op = op_name
+    return wrapper
+
+
+def record_model_load(model_name, start, end):
+    """Record the time of loading a model, which is attributed to the OP
+    running in the current process, or to the preloading."""
+    if is_profiling():
+        _record(getattr(_STATE, "op", None) or "preload", PHASE_MODEL_LOAD, start, end, model_name)
+
+
+def record_op(op_name, start, end, dataset_in, dataset_out):
+    """
+    Record the run of an OP in the main process with its throughput.
+
+    :param op_name: label of the OP returned by `start_op`
+    :param start: start time of the run
+    :param end: end time of the run
+    :param dataset_in: the input dataset
+    :param dataset_out: the output dataset
+    """
+    if not is_profiling():
+        return
+
+    def nbytes(dataset):
+        try:
+            return dataset.data.nbytes
+        except Exception:
+            return None
+
+    record = {
+        "rows_in": len(dataset_in),
+        "rows_out": len(dataset_out),
+        "bytes_in": nbytes(dataset_in),
+        "bytes_out": nbytes(dataset_out),
+    }
+    global _CURRENT_OP
+    _record(op_name, "op", start, end, record)
+    flush_events()
+    _CURRENT_OP = None
+    _STATE.op = None
+    _STATE.last_end = None
+    _STATE.depth = 0
+
+
+def load_events(profile_dir):
+    """Load the events recorded by all processes from `profile_dir`."""
+    events = []
+    for fn in sorted(os.listdir(profile_dir)):
+        if fn.startswith("events-") and fn.endswith(".jsonl"):
+            with open(os.path.join(profile_dir, fn)) as fin:
+                events.extend(json.loads(line) for line in fin if line.strip())
+    return events
+
+
+def export_profile(profile_dir):
+    """
+    Summarize the recorded events into `profile.json`, which has the wall
+    time, throughput and time of each phase per OP and per worker, keyed by
+    the labels of OPs, i.e. their indices and names, and export
+    them as a Chrome trace `trace.json`, which can be opened with
+    chrome://tracing or Perfetto.
+
+    :param profile_dir: directory of the recorded events
+    :return: the summary of OPs
+    """
+    flush_events()
+    events = load_events(profile_dir)
+
+    summary = {}
+    phases = defaultdict(partial(defaultdict, float))
+    workers = defaultdict(partial(defaultdict, partial(defaultdict, float)))
+    trace_events = []
+    for op_name, phase, start, dur, pid, tid, extra in events:
+        trace_events.append(
+            {
+                "name": op_name if phase == "op" else phase,
+                "cat": phase,
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": dur * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": {"op": op_name, **(extra if isinstance(extra, dict) else {"detail": extra})},
+            }
+        )
+        if phase == "op":
+            summary[op_name] = {
+                "wall_time": dur,
+                **extra,
+                "rows_per_s": extra["rows_in"] / dur if dur > 0 else None,
+                "bytes_per_s": extra["bytes_in"] / dur if dur > 0 and extra["bytes_in"] is not None else None,
+            }
+        else:
+            phases[op_name][phase] += dur
+            workers[op_name][pid][phase] += dur
+
+    for op_name in list(summary) + [name for name in phases if name not in summary]:
+        item = summary.setdefault(op_name, {})
+        item["phases"] = dict(phases.get(op_name, {}))
+        item["workers"] = {str(pid): dict(times) for pid, times in workers.get(op_name, {}).items()}
+
+    with open(os.path.join(profile_dir, "profile.json"), "w") as fout:
+        json.dump(summary, fout, indent=2)
+    with open(os.path.join(profile_dir, "trace.json"), "w") as fout:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, fout)
+    logger.info(f"Profiling results are exported to [{profile_dir}].")
+    return summary
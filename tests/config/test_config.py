@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 import unittest
 from contextlib import redirect_stdout, redirect_stderr
 from io import StringIO
@@ -15,10 +17,22 @@ test_yaml_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
 test_bad_yaml_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                               'demo_4_test_bad_val.yaml')
 
-WORKDIR = os.path.join(os.getcwd(), 'outputs/demo')
 
 class ConfigTest(DataJuicerTestCaseBase):
 
+    def setUp(self):
+        # the relative export path in the test configs is resolved in a temp
+        # dir, so the logs and config backups are not left in the repo
+        self.ori_cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+        self.work_dir = os.path.join(os.getcwd(), 'outputs/demo')
+
+    def tearDown(self):
+        os.chdir(self.ori_cwd)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        super().tearDown()
+
     def test_help_info(self):
         out = StringIO()
         with redirect_stdout(out), self.assertRaises(SystemExit):
@@ -57,7 +71,7 @@ class ConfigTest(DataJuicerTestCaseBase):
                         'batch_size': 1000,
                         'index_key': None,
                         'skip_op_error': True,
-                        'work_dir': WORKDIR,
+                        'work_dir': self.work_dir,
                     }
                 }, 'nested dict load fail, for nonparametric op')
             self.assertDictEqual(
@@ -81,7 +95,7 @@ class ConfigTest(DataJuicerTestCaseBase):
                         'batch_size': 1000,
                         'index_key': None,
                         'skip_op_error': True,
-                        'work_dir': WORKDIR,
+                        'work_dir': self.work_dir,
                     }
                 }, 'nested dict load fail, un-expected internal value')
 
@@ -154,7 +168,7 @@ class ConfigTest(DataJuicerTestCaseBase):
                         'batch_size': 1000,
                         'index_key': None,
                         'skip_op_error': True,
-                        'work_dir': WORKDIR,
+                        'work_dir': self.work_dir,
                     }
                 })
             self.assertDictEqual(
@@ -178,7 +192,7 @@ class ConfigTest(DataJuicerTestCaseBase):
                         'batch_size': 1000,
                         'index_key': None,
                         'skip_op_error': True,
-                        'work_dir': WORKDIR,
+                        'work_dir': self.work_dir,
                     }
                 })
             self.assertDictEqual(
@@ -202,7 +216,7 @@ class ConfigTest(DataJuicerTestCaseBase):
                         'batch_size': 1000,
                         'index_key': None,
                         'skip_op_error': True,
-                        'work_dir': WORKDIR,
+                        'work_dir': self.work_dir,
                     }
                 })
             self.assertDictEqual(
@@ -226,7 +240,7 @@ class ConfigTest(DataJuicerTestCaseBase):
                         'batch_size': 1000,
                         'index_key': None,
                         'skip_op_error': True,
-                        'work_dir': WORKDIR,
+                        'work_dir': self.work_dir,
                     }
                 })
             self.assertDictEqual(
@@ -250,7 +264,7 @@ class ConfigTest(DataJuicerTestCaseBase):
                         'batch_size': 1000,
                         'index_key': None,
                         'skip_op_error': True,
-                        'work_dir': WORKDIR,
+                        'work_dir': self.work_dir,
                     }
                 })
 
@@ -11,6 +11,7 @@ from data_juicer.core.data.dataset_builder import (rewrite_cli_datapath,
 from data_juicer.core.data.config_validator import ConfigValidationError
 from data_juicer.utils.unittest_utils import (DataJuicerTestCaseBase, TEST_TAG)
 from data_juicer.core.data.load_strategy import RayLocalJsonDataLoadStrategy
+import shutil
 import tempfile
 
 
@@ -28,6 +29,13 @@ class DatasetBuilderTest(DataJuicerTestCaseBase):
         # Get the directory where this test file is located
         test_file_dir = os.path.dirname(os.path.abspath(__file__))
         os.chdir(test_file_dir)
+        # write the logs and config backups of init_configs to a temp dir
+        self.tmp_dir = tempfile.mkdtemp()
+        self.export_path = os.path.join(self.tmp_dir, 'outputs', 'res.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        super().tearDown()
 
 
     def test_rewrite_cli_datapath_local_single_file(self):
@@ -372,7 +380,7 @@ class DatasetBuilderTest(DataJuicerTestCaseBase):
                                         'test_data/test_config.yaml')
         out = StringIO()
         with redirect_stdout(out):
-            cfg = init_configs(args=f'--config {test_config_file}'.split())
+            cfg = init_configs(args=f'--config {test_config_file} --export_path {self.export_path}'.split())
             self.assertIsInstance(cfg, Namespace)
             self.assertEqual(cfg.project_name, 'dataset-local-json')
             self.assertEqual(cfg.dataset,
@@ -384,7 +392,7 @@ class DatasetBuilderTest(DataJuicerTestCaseBase):
                                         'test_data/test_config_list.yaml')
         out = StringIO()
         with redirect_stdout(out):
-            cfg = init_configs(args=f'--config {test_config_file}'.split())
+            cfg = init_configs(args=f'--config {test_config_file} --export_path {self.export_path}'.split())
             self.assertIsInstance(cfg, Namespace)
             self.assertEqual(cfg.project_name, 'dataset-local-list')
             self.assertEqual(cfg.dataset,
@@ -480,7 +488,7 @@ class DatasetBuilderTest(DataJuicerTestCaseBase):
         """Test loading Ray configuration from YAML"""
         test_config_file = os.path.join(WORK_DIR, 'test_data', 'test_config_ray.yaml')
 
-        cfg = init_configs(args=f'--config {test_config_file}'.split())
+        cfg = init_configs(args=f'--config {test_config_file} --export_path {self.export_path}'.split())
         
         # Verify basic config
         self.assertIsInstance(cfg, Namespace)
@@ -191,6 +191,39 @@ class TestRayDataset(unittest.TestCase):
         self.assertIsInstance(row['text'], str)
         self.assertIsInstance(row['score'], int)
 
+    @TEST_TAG('ray')
+    def test_process_fused_stages(self):
+        """Test that consecutive CPU Mappers and Filters run as one stage"""
+        import ray
+        from data_juicer.core.data.ray_dataset import RayDataset, plan_ray_stages
+        from data_juicer.ops.deduplicator import RayDocumentDeduplicator
+        from data_juicer.ops.filter import TextLengthFilter
+        from data_juicer.ops.mapper import WhitespaceNormalizationMapper
+        from data_juicer.ops.op_fusion import FusedStage
+        from data_juicer.utils.constant import Fields
+
+        ops = [
+            WhitespaceNormalizationMapper(),
+            TextLengthFilter(min_len=5),
+            RayDocumentDeduplicator(backend='ray_actor'),
+            TextLengthFilter(max_len=10),
+        ]
+        stages = plan_ray_stages(ops)
+        self.assertEqual(len(stages), 3)
+        self.assertIsInstance(stages[0], FusedStage)
+        self.assertEqual(stages[0].fused_ops, ops[:2])
+        self.assertIs(stages[2], ops[3])
+
+        dataset = RayDataset(ray.data.from_items([
+            {'text': ' hello  world '},
+            {'text': 'abc'},
+            {'text': 'hello world'},
+        ]))
+        dataset.process(ops[:2])
+        rows = dataset.data.take_all()
+        self.assertEqual([row['text'] for row in rows], ['hello  world', 'hello world'])
+        self.assertIn(Fields.stats, rows[0])
+        self.assertIn(Fields.stats, dataset._columns)
 
 if __name__ == '__main__':
     unittest.main()
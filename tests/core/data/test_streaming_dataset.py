@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from data_juicer.core.data import NestedDataset, StreamingDataset
+from data_juicer.core.exporter import Exporter
+from data_juicer.ops.load import load_ops
+from data_juicer.utils.constant import Fields
+from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
+
+
+class StreamingDatasetTest(DataJuicerTestCaseBase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = [
+            {'text': 'Today is Sunday and it is a happy day!'},
+            {'text': 'a b'},
+            {'text': 'Contact me at someone@example.com for details.'},
+            {'text': 'Today is Sunday and it is a happy day!'},
+            {'text': 'A short one.'},
+            {'text': 'This is a much longer sentence that should be kept.'},
+        ]
+        self.process_list = [
+            {'clean_email_mapper': {}},
+            {'text_length_filter': {'min_len': 10}},
+            {'document_deduplicator': {}},
+            {'words_num_filter': {'min_num': 5}},
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        super().tearDown()
+
+    def _expected(self):
+        dataset = NestedDataset.from_list(self.data)
+        return dataset.process(load_ops(self.process_list), open_monitor=False)
+
+    def _streaming(self, num_proc=1, batch_size=2):
+        dataset = NestedDataset.from_list(self.data).to_iterable_dataset()
+        return StreamingDataset(dataset, batch_size=batch_size, num_proc=num_proc,
+                                tmp_dir=os.path.join(self.tmp_dir, 'stream'))
+
+    def test_process_matches_nested_dataset(self):
+        expected = self._expected()
+        dataset = self._streaming().process(load_ops(self.process_list))
+        res = dataset.to_list()
+        self.assertEqual([s['text'] for s in res], expected['text'])
+        self.assertEqual([s[Fields.stats] for s in res], expected[Fields.stats])
+        dataset.cleanup_cache_files()
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'stream')))
+
+    def test_process_in_parallel(self):
+        expected = self._expected()
+        dataset = self._streaming(num_proc=2, batch_size=1)
+        dataset = dataset.process(load_ops(self.process_list))
+        self.assertEqual(dataset.get_column('text'), expected['text'])
+        dataset.cleanup_cache_files()
+
+    def test_lazy_local_ops(self):
+        dataset = self._streaming().process(load_ops(self.process_list[:2]))
+        # no barrier, so nothing is materialized before iteration
+        self.assertEqual(len(dataset.pending_ops), 2)
+        self.assertIsNone(dataset.materialized)
+        self.assertEqual(len(dataset.get(2)), 2)
+        self.assertIn(Fields.stats, dataset.schema().columns)
+
+    def test_export_stream(self):
+        expected = self._expected()
+        dataset = self._streaming().process(load_ops(self.process_list))
+        export_path = os.path.join(self.tmp_dir, 'res.jsonl')
+        exporter = Exporter(export_path, keep_stats_in_res_ds=False)
+        num_samples = exporter.export_stream(dataset.iter_batches())
+        dataset.cleanup_cache_files()
+        self.assertEqual(num_samples, len(expected))
+        with open(export_path) as fin:
+            res = [json.loads(line) for line in fin]
+        self.assertEqual(res, [{'text': text} for text in expected['text']])
+        stats_path = os.path.join(self.tmp_dir, 'res_stats.jsonl')
+        with open(stats_path) as fin:
+            stats = [json.loads(line) for line in fin]
+        self.assertEqual(len(stats), len(expected))
+
+    def test_export_stream_parquet_shards(self):
+        dataset = self._streaming(batch_size=1)
+        export_path = os.path.join(self.tmp_dir, 'res.parquet')
+        exporter = Exporter(export_path, export_shard_size=1)
+        num_samples = exporter.export_stream(dataset.iter_batches())
+        self.assertEqual(num_samples, len(self.data))
+        res = NestedDataset.from_parquet(os.path.join(self.tmp_dir, 'res-*.parquet'))
+        self.assertEqual(sorted(res['text']), sorted(s['text'] for s in self.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,15 @@
 import os
 import unittest
+from unittest.mock import MagicMock, patch
+
 import datasets
 from datasets import load_dataset
 from loguru import logger
 from data_juicer.core import Adapter
+from data_juicer.core.data import NestedDataset
 from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
 from data_juicer.ops.mapper import FixUnicodeMapper
-from data_juicer.ops.filter import PerplexityFilter
+from data_juicer.ops.filter import PerplexityFilter, TextLengthFilter
 from data_juicer.ops.deduplicator import DocumentDeduplicator
 
 @unittest.skip('random resource utilization fluctuation may cause failure')
@@ -196,5 +199,85 @@ class AdapterTest(DataJuicerTestCaseBase):
         datasets.enable_caching()
 
 
+class AutoTuneTest(DataJuicerTestCaseBase):
+
+    def setUp(self):
+        self.ds = NestedDataset.from_list([{'text': 'a' * (i % 10)}
+                                           for i in range(100)])
+
+    def test_measure_op_cost(self):
+        op = TextLengthFilter(min_len=5, num_proc=2, batch_size=7)
+        cost = Adapter.measure_op_cost(op, self.ds)
+        for key in ['cpu_time_per_sample', 'wall_time_per_sample', 'cpu_util',
+                    'mem', 'gpu_mem']:
+            self.assertIn(key, cost)
+        self.assertGreater(cost['wall_time_per_sample'], 0)
+        # the workloads are restored after measuring
+        self.assertEqual((op.num_proc, op.batch_size), (2, 7))
+
+    def test_tune_op(self):
+        adapter = Adapter({'batch_size': 100})
+        op = TextLengthFilter(min_len=5, num_proc=1)
+        cost = {
+            'cpu_time_per_sample': 0.01,
+            'wall_time_per_sample': 0.01,
+            'cpu_util': 1.0,
+            'mem': 1024**3,
+            'gpu_mem': 0,
+        }
+        adapter.tune_op(op, cost)
+        self.assertEqual(op.mem_required, 1)
+        self.assertEqual(op.cpu_required, 1.0)
+        self.assertEqual(op.batch_size, int(Adapter.TARGET_BATCH_TIME / 0.01))
+        self.assertEqual(op.num_proc, 1)
+
+    def test_tune_op_without_mem_growth(self):
+        adapter = Adapter({'batch_size': 100})
+        op = TextLengthFilter(min_len=5, num_proc=1, mem_required='2GB')
+        cost = {
+            'cpu_time_per_sample': 0.01,
+            'wall_time_per_sample': 0.01,
+            'cpu_util': 1.0,
+            'mem': 0,
+            'gpu_mem': 0,
+        }
+        adapter.tune_op(op, cost)
+        # the configured memory is kept
+        self.assertEqual(op.mem_required, 2)
+
+    def test_retune_op(self):
+        adapter = Adapter({'batch_size': 100})
+        op = TextLengthFilter(num_proc=4, batch_size=100)
+        # halved under memory pressure
+        sampler = MagicMock(avg_cpu_util=1.0, max_mem_util=0.95)
+        adapter.retune_op(op, sampler)
+        self.assertEqual((op.num_proc, op.batch_size), (2, 50))
+        # unchanged when resources are well utilized
+        sampler = MagicMock(avg_cpu_util=0.85, max_mem_util=0.5)
+        adapter.retune_op(op, sampler)
+        self.assertEqual((op.num_proc, op.batch_size), (2, 50))
+
+    def test_run_auto_tuned(self):
+        adapter = Adapter({'batch_size': 10})
+        op = TextLengthFilter(min_len=5, num_proc=1)
+        expected = op.run(self.ds).to_list()
+        with patch.object(Adapter, 'TARGET_BATCH_TIME', 0), \
+                patch.object(Adapter, 'retune_op') as mock_retune:
+            res = adapter.run_auto_tuned(op, self.ds)
+        self.assertEqual(op.batch_size, 1)
+        # adjusted between the rounds
+        self.assertEqual(mock_retune.call_count,
+                         Adapter.AUTO_TUNE_ROUNDS - 1)
+        self.assertEqual(res.to_list(), expected)
+
+    def test_run_auto_tuned_skips_stateful_ops(self):
+        adapter = Adapter({'batch_size': 10})
+        op = DocumentDeduplicator()
+        with patch.object(Adapter, 'measure_op_cost') as mock_measure:
+            res = adapter.run_auto_tuned(op, self.ds)
+        mock_measure.assert_not_called()
+        self.assertEqual(len(res), 10)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,130 @@
+import glob
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_juicer.core.data import NestedDataset
+from data_juicer.core.exporter import Exporter
+from data_juicer.utils.constant import Fields
+from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
+
+
+class ExporterTest(DataJuicerTestCaseBase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = [{
+            'text': f'This is sample {i}.',
+            Fields.stats: {'text_len': i},
+        } for i in range(100)]
+        self.dataset = NestedDataset.from_list(self.data)
+        self.tgt_list = [{'text': s['text']} for s in self.data]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        super().tearDown()
+
+    def test_export_shards(self):
+        export_path = os.path.join(self.tmp_dir, 'res.jsonl')
+        exporter = Exporter(export_path, export_shard_size=500, num_proc=2)
+        exporter.export(self.dataset)
+        files = sorted(glob.glob(os.path.join(self.tmp_dir, 'res-*.jsonl')))
+        self.assertGreater(len(files), 1)
+        res = []
+        for file in files:
+            with open(file) as fin:
+                res.extend(json.loads(line) for line in fin)
+        self.assertEqual(res, self.tgt_list)
+        with open(os.path.join(self.tmp_dir, 'res_stats.jsonl')) as fin:
+            self.assertEqual(len(fin.readlines()), len(self.data))
+
+    def test_export_parquet_row_groups(self):
+        export_path = os.path.join(self.tmp_dir, 'res.parquet')
+        exporter = Exporter(export_path,
+                            export_compression='zstd',
+                            export_row_group_size=30,
+                            export_stats=False)
+        exporter.export(self.dataset)
+        parquet_file = pq.ParquetFile(export_path)
+        self.assertEqual(parquet_file.metadata.num_row_groups, 4)
+        self.assertEqual(
+            parquet_file.metadata.row_group(0).column(0).compression, 'ZSTD')
+        self.assertEqual(parquet_file.read().to_pylist(), self.tgt_list)
+
+    def test_export_compression(self):
+        export_path = os.path.join(self.tmp_dir, 'res.jsonl')
+        exporter = Exporter(export_path,
+                            export_shard_size=500,
+                            num_proc=2,
+                            export_compression='gzip',
+                            export_stats=False)
+        exporter.export(self.dataset)
+        files = sorted(glob.glob(os.path.join(self.tmp_dir, 'res-*.jsonl.gz')))
+        self.assertGreater(len(files), 1)
+        res = []
+        for file in files:
+            with gzip.open(file, 'rt') as fin:
+                res.extend(json.loads(line) for line in fin)
+        self.assertEqual(res, self.tgt_list)
+
+        export_path = os.path.join(self.tmp_dir, 'single.jsonl')
+        exporter = Exporter(export_path,
+                            export_compression='zstd',
+                            export_stats=False)
+        exporter.export(self.dataset)
+        with pa.CompressedInputStream(f'{export_path}.zst', 'zstd') as fin:
+            res = [json.loads(line) for line in fin.read().splitlines()]
+        self.assertEqual(res, self.tgt_list)
+
+    def test_export_empty_shards(self):
+        export_path = os.path.join(self.tmp_dir, 'res.jsonl')
+        exporter = Exporter(export_path, export_shard_size=500, export_stats=False)
+        exporter.export(self.dataset.select([]))
+        files = glob.glob(os.path.join(self.tmp_dir, 'res-*.jsonl'))
+        self.assertEqual(len(files), 1)
+        with open(files[0]) as fin:
+            self.assertEqual(fin.read(), '')
+
+    def test_export_same_as_stream(self):
+        # the sharded, compressed and streamed files are serialized in the
+        # same way as the single uncompressed file
+        self.dataset = NestedDataset.from_list([{
+            'text': 'This is a "sample".\nIt has 2 lines.',
+            'score': 0.1 + 0.2,
+            'tags': ['a', 'b'],
+        }])
+        export_path = os.path.join(self.tmp_dir, 'res.jsonl')
+        Exporter(export_path, export_stats=False).export(self.dataset)
+        with open(export_path, 'rb') as fin:
+            expected = fin.read()
+
+        shard_path = os.path.join(self.tmp_dir, 'shard.jsonl')
+        Exporter(shard_path, export_shard_size=500, export_in_parallel=False,
+                 export_stats=False).export(self.dataset)
+        with open(glob.glob(os.path.join(self.tmp_dir, 'shard-*.jsonl'))[0], 'rb') as fin:
+            self.assertEqual(fin.read(), expected)
+
+        gzip_path = os.path.join(self.tmp_dir, 'gzip.jsonl')
+        Exporter(gzip_path, export_compression='gzip', export_stats=False).export(self.dataset)
+        with gzip.open(f'{gzip_path}.gz', 'rb') as fin:
+            self.assertEqual(fin.read(), expected)
+
+        stream_path = os.path.join(self.tmp_dir, 'stream.jsonl')
+        Exporter(stream_path, export_stats=False).export_stream(iter([self.dataset.to_dict()]))
+        with open(stream_path, 'rb') as fin:
+            self.assertEqual(fin.read(), expected)
+
+    def test_unsupported_compression(self):
+        with self.assertRaises(NotImplementedError):
+            Exporter(os.path.join(self.tmp_dir, 'res.jsonl'),
+                     export_compression='lz4')
+
+
+if __name__ == '__main__':
+    unittest.main()
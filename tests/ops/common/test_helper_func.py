@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+
+from data_juicer.ops.common.helper_func import ArrayUnionFind, UnionFind
+from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
+
+
+class ArrayUnionFindTest(DataJuicerTestCaseBase):
+
+    def test_union_by_keys(self):
+        # 0-2-4 are linked by keys of two different bands, 1-5 by one band
+        band_keys = [
+            np.array([10, 11, 10, 12, 13, 11], dtype=np.uint64),
+            np.array([20, 21, 22, 23, 22, 24], dtype=np.uint64),
+        ]
+        union_find = ArrayUnionFind(6)
+        for keys in band_keys:
+            union_find.union_by_keys(keys)
+        self.assertEqual(union_find.find(np.arange(6)).tolist(),
+                         [0, 1, 0, 3, 0, 1])
+        self.assertEqual(union_find.roots_mask().tolist(),
+                         [True, True, False, True, False, False])
+
+    def test_same_as_union_find(self):
+        rng = np.random.default_rng(42)
+        num, num_bands = 500, 4
+        band_keys = rng.integers(0, 200, size=(num_bands, num))
+
+        union_find = ArrayUnionFind(num)
+        for keys in band_keys:
+            union_find.union_by_keys(keys)
+
+        tgt = UnionFind()
+        for keys in band_keys:
+            clusters = {}
+            for idx, key in enumerate(keys):
+                clusters.setdefault(key, []).append(idx)
+            for cluster in clusters.values():
+                for x in cluster:
+                    tgt.union(x, min(cluster))
+        self.assertEqual(union_find.find(np.arange(num)).tolist(),
+                         [tgt.find(i) for i in range(num)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 from data_juicer.core.data import NestedDataset as Dataset
@@ -170,6 +173,33 @@ class DocumentDeduplicatorTest(DataJuicerTestCaseBase):
         dup_pairs = self._run_doc_dedup(dataset, tgt_list, op, show_num=1)
         self.assertEqual(len(dup_pairs), 1)
 
+    def test_dedup_index(self):
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir)
+        first = Dataset.from_list([
+            {'text': 'Today is Sunday and it\'s a happy day!'},
+            {'text': 'Do you need a cup of coffee?'},
+        ])
+        second = Dataset.from_list([
+            {'text': 'Do you need a cup of coffee?'},
+            {'text': 'This paper proposed a novel method on LLM pretraining.'},
+            {'text': 'Today is Sunday and it\'s a happy day!'},
+        ])
+        op = DocumentDeduplicator(dedup_index_dir=index_dir)
+        self._run_doc_dedup(first, first.to_list(), op)
+        # the keys are only staged until they are committed
+        self.assertEqual(len(os.listdir(index_dir)), 0)
+        op.commit_dedup_index()
+        self.assertEqual(len(os.listdir(index_dir)), 1)
+        # samples seen in the former run are removed
+        op = DocumentDeduplicator(dedup_index_dir=index_dir)
+        self._run_doc_dedup(second, [second[1]], op)
+        # a different config doesn't share the index
+        op = DocumentDeduplicator(lowercase=True, dedup_index_dir=index_dir)
+        self._run_doc_dedup(second, second.to_list(), op)
+        op.commit_dedup_index()
+        self.assertEqual(len(os.listdir(index_dir)), 2)
+
 
 if __name__ == '__main__':
     unittest.main()
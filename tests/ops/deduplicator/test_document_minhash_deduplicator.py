@@ -1,9 +1,16 @@
+import shutil
+import tempfile
 import unittest
+from unittest import mock
+
+import numpy as np
 
 from data_juicer.core.data import NestedDataset as Dataset
 
+from data_juicer.ops.deduplicator import document_minhash_deduplicator
 from data_juicer.ops.deduplicator.document_minhash_deduplicator import \
     DocumentMinhashDeduplicator
+from data_juicer.utils.constant import HashKeys
 from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
 
 
@@ -958,6 +965,79 @@ class DocumentMinhashDeduplicatorTest(DataJuicerTestCaseBase):
                                          ignore_pattern=r'\p{P}')
         self._run_minhash_dedup(dataset, tgt_list, op)
 
+    def test_compute_hash_in_batch(self):
+        ds_list = [
+            {'text': 'Today is Sunday and it\'s a happy day!'},
+            {'text': 'Do you need a cup of coffee?'},
+            {'text': 'short'},
+            {'text': 'Today is sunday and it\'s really a happy day!'},
+        ]
+        op = DocumentMinhashDeduplicator(num_permutations=16, num_bands=4,
+                                         num_rows_per_band=4)
+        # compute the minhashes of each sample in the original way
+        tgt_list = []
+        for sample in ds_list:
+            tokens = op.get_shingles(sample['text'])
+            hv = document_minhash_deduplicator.xxh32_hashes(tokens)
+            if len(hv) > 0:
+                phv = np.bitwise_and(
+                    (hv[:, None] * op.perm_a + op.perm_b) %
+                    document_minhash_deduplicator.MERSENNE_PRIME,
+                    document_minhash_deduplicator.MAX_HASH)
+                hash_values = phv.min(axis=0)
+            else:
+                hash_values = np.full(16, document_minhash_deduplicator.MAX_HASH)
+            tgt_list.append(hash_values.astype('>u4').tobytes())
+
+        # permute the shingles of only a few samples in one chunk
+        with mock.patch.object(document_minhash_deduplicator,
+                               'MAX_SHINGLES_PER_CHUNK', 4):
+            dataset = Dataset.from_list(ds_list)
+            dataset = dataset.map(op.compute_hash, batch_size=3)
+        self.assertEqual(dataset[HashKeys.minhash], tgt_list)
+
+    def test_external_sort(self):
+        ds_list = [
+            {'text': 'Today is Sunday and it\'s a happy day!'},
+            {'text': 'Do you need a cup of coffee?'},
+            {'text': 'Today is sunday and it\'s really a happy day!'},
+            {'text': 'Do you need a cup of coffee?'},
+            {'text': 'Today is Sunday and it\'s a happy day!'},
+            {'text': 'This is a test of the external sort mode.'},
+        ]
+        dataset = Dataset.from_list(ds_list)
+        tgt_op = DocumentMinhashDeduplicator(ignore_pattern=r'\p{P}')
+        tgt_list = tgt_op.run(dataset).to_list()
+        self.assertEqual(len(tgt_list), 4)
+
+        op = DocumentMinhashDeduplicator(ignore_pattern=r'\p{P}',
+                                         external_sort=True,
+                                         num_sort_partitions=3)
+        self._run_minhash_dedup(dataset, tgt_list, op)
+
+    def test_dedup_index(self):
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir)
+        first = Dataset.from_list([
+            {'text': 'Today is Sunday and it\'s a happy day!'},
+            {'text': 'Do you need a cup of coffee?'},
+        ])
+        second = Dataset.from_list([
+            {'text': 'Today is sunday and it\'s a happy day!'},
+            {'text': 'This paper proposed a novel method on LLM pretraining.'},
+            {'text': 'This paper proposed a novel method on LLM pretraining.'},
+            {'text': 'Do you need a cup of coffee?'},
+        ])
+        op = DocumentMinhashDeduplicator(ignore_pattern=r'\p{P}',
+                                         dedup_index_dir=index_dir)
+        self._run_minhash_dedup(first, first.to_list(), op)
+        op.commit_dedup_index()
+        # near duplicates of samples in the former run are removed, and the
+        # duplicates in the new run are deduplicated as usual
+        op = DocumentMinhashDeduplicator(ignore_pattern=r'\p{P}',
+                                         dedup_index_dir=index_dir)
+        self._run_minhash_dedup(second, [second[1]], op)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,17 @@
+import os
+import shutil
+import tempfile
 import unittest
 
+import numpy as np
+
 from data_juicer.core.data import NestedDataset as Dataset
 
-from data_juicer.ops.deduplicator.document_simhash_deduplicator import \
-    DocumentSimhashDeduplicator
+from data_juicer.ops.common.helper_func import UnionFind
+from data_juicer.ops.deduplicator.document_simhash_deduplicator import (
+    DocumentSimhashDeduplicator, build_table, find_clusters, query_table,
+    table_blocks)
+from data_juicer.utils.dedup_index import uint64_to_keys
 from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
 
 
@@ -1512,5 +1520,76 @@ class DocumentSimhashDeduplicatorTest(DataJuicerTestCaseBase):
         with self.assertRaises(NotImplementedError):
             self._run_simhash_dedup(dataset, tgt_list, op)
 
+    def test_find_clusters(self):
+        rng = np.random.default_rng(42)
+        base = rng.integers(0, 2**63, size=200, dtype=np.uint64)
+        # near duplicates with a few flipped bits
+        flips = np.zeros(200, dtype=np.uint64)
+        for _ in range(3):
+            flips |= np.uint64(1) << rng.integers(0, 64, size=200).astype(
+                np.uint64)
+        values = np.unique(np.concatenate([base, base ^ flips]))
+
+        # brute-force clustering over all pairs
+        tgt = UnionFind()
+        for i in range(len(values)):
+            for j in range(i + 1, len(values)):
+                if bin(int(values[i] ^ values[j])).count('1') <= 3:
+                    tgt.union(i, j)
+        tgt_roots = [tgt.find(i) for i in range(len(values))]
+
+        for num_proc in [1, 2]:
+            union_find = find_clusters(values, 6, 3, num_proc=num_proc)
+            self.assertEqual(union_find.find(np.arange(len(values))).tolist(),
+                             tgt_roots)
+
+    def test_query_table(self):
+        rng = np.random.default_rng(42)
+        old_values = rng.integers(0, 2**63, size=200, dtype=np.uint64)
+        flips = np.zeros(200, dtype=np.uint64)
+        for _ in range(3):
+            flips |= np.uint64(1) << rng.integers(0, 64, size=200).astype(
+                np.uint64)
+        values = np.concatenate(
+            [old_values[:100] ^ flips[:100],
+             rng.integers(0, 2**63, size=100, dtype=np.uint64)])
+
+        # brute-force matching over all pairs
+        tgt = [
+            any(bin(int(value ^ old)).count('1') <= 3 for old in old_values)
+            for value in values
+        ]
+        res = np.zeros(len(values), dtype=bool)
+        for blocks, prefix_bits in table_blocks(6, 3):
+            table = build_table(uint64_to_keys(old_values), blocks)
+            res |= query_table(table, values, blocks, prefix_bits, 3)
+        self.assertEqual(res.tolist(), tgt)
+
+    def test_dedup_index(self):
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir)
+        first = Dataset.from_list([
+            {'text': 'Today is Sunday and it\'s a happy day!'},
+            {'text': 'Do you need a cup of coffee?'},
+        ])
+        second = Dataset.from_list([
+            {'text': 'Today is sunday and it\'s a happy day!'},
+            {'text': 'This paper proposed a novel method on LLM pretraining.'},
+            {'text': 'Do you need a cup of coffee?'},
+        ])
+        op = DocumentSimhashDeduplicator(ignore_pattern=r'\p{P}',
+                                         dedup_index_dir=index_dir)
+        self._run_simhash_dedup(first, first.to_list(), op)
+        op.commit_dedup_index()
+        # similar samples of the former run are removed
+        op = DocumentSimhashDeduplicator(ignore_pattern=r'\p{P}',
+                                         dedup_index_dir=index_dir)
+        self._run_simhash_dedup(second, [second[1]], op)
+        # the multi-index tables are persisted next to the index
+        index_path = os.path.join(index_dir, os.listdir(index_dir)[0])
+        self.assertTrue(
+            any('.table' in name for name in os.listdir(index_path)))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -965,5 +965,84 @@ class RayBTSMinhashDeduplicatorTest(DataJuicerTestCaseBase):
         self._run_minhash_dedup(dataset, tgt_list, op)
 
 
+    @TEST_TAG("ray")
+    def test_short_texts_deduplication(self):
+        # texts without any shingles share one band key
+        ds_list = [
+            {'text': ''},
+            {'text': 'too short'},
+            {'text': 'This paper proposed a novel method on LLM pretraining.'},
+            {'text': 'Do you need a cup of coffee? It is a sunny day!'},
+        ]
+        tgt_list = [
+            {'text': ''},
+            {'text': 'This paper proposed a novel method on LLM pretraining.'},
+            {'text': 'Do you need a cup of coffee? It is a sunny day!'},
+        ]
+        dataset = self.generate_dataset(ds_list)
+        import os
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        work_dir = os.path.join(cur_dir, 'short_dedup')
+        op = RayBTSMinhashDeduplicator(work_dir=work_dir)
+        self._run_minhash_dedup(dataset, tgt_list, op)
+
+    @TEST_TAG("ray")
+    def test_reread_source(self):
+        ds_list = [
+            {'text': 'Today is Sunday and it\'s a happy day!', 'id': 0},
+            {'text': 'Do you need a cup of coffee?', 'id': 1},
+            {'text': 'Today is sunday and it\'s a happy day!', 'id': 2},
+            {'text': 'This paper proposed a novel method on LLM pretraining.', 'id': 3},
+        ]
+        tgt_list = [
+            {'text': 'Today is Sunday and it\'s a happy day!', 'id': 0},
+            {'text': 'Do you need a cup of coffee?', 'id': 1},
+            {'text': 'This paper proposed a novel method on LLM pretraining.', 'id': 3},
+        ]
+        dataset = self.generate_dataset(ds_list)
+        import os
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        work_dir = os.path.join(cur_dir, 'reread_dedup')
+        op = RayBTSMinhashDeduplicator(tokenization='character', reread_source=True, work_dir=work_dir)
+        from ray.data import DataContext
+        preserve_order = DataContext.get_current().execution_options.preserve_order
+        res = dataset.process(op)
+        # the result is kept lazy and read in order, and the global setting
+        # is not changed
+        self.assertTrue(res.data.context.execution_options.preserve_order)
+        self.assertEqual(DataContext.get_current().execution_options.preserve_order, preserve_order)
+        res_list = res.data.to_pandas()[['text', 'id']].to_dict(orient='records')
+        self.assertEqual(res_list, tgt_list)
+
+    @TEST_TAG("ray")
+    def test_reread_source_after_ray_dedup_filter(self):
+        # the dedup set of the upstream filter is filled in the first pass, so
+        # the input must be materialized instead of being read again
+        ds_list = [
+            {'text': 'Today is Sunday and it\'s a happy day!'},
+            {'text': 'Today is Sunday and it\'s a happy day!'},
+            {'text': 'Do you need a cup of coffee?'},
+            {'text': 'Today is sunday and it\'s a happy day!'},
+            {'text': 'This paper proposed a novel method on LLM pretraining.'},
+        ]
+        tgt_list = [
+            {'text': 'Today is Sunday and it\'s a happy day!'},
+            {'text': 'Do you need a cup of coffee?'},
+            {'text': 'This paper proposed a novel method on LLM pretraining.'},
+        ]
+        from data_juicer.ops.deduplicator.ray_document_deduplicator import \
+            RayDocumentDeduplicator
+        dataset = self.generate_dataset(ds_list)
+        import os
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        work_dir = os.path.join(cur_dir, 'reread_after_filter_dedup')
+        ops = [
+            RayDocumentDeduplicator(),
+            RayBTSMinhashDeduplicator(tokenization='character', reread_source=True, work_dir=work_dir),
+        ]
+        res = dataset.process(ops)
+        res_list = res.data.to_pandas()[['text']].to_dict(orient='records')
+        self.assertEqual(len(res_list), len(tgt_list))
+
 if __name__ == '__main__':
     unittest.main()
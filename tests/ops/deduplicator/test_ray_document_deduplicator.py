@@ -97,6 +97,32 @@ class RayDocumentDeduplicatorTest(DataJuicerTestCaseBase):
         op = RayDocumentDeduplicator(lowercase=False, ignore_non_character=False)
         self._run_doc_dedup(dataset, tgt_list, op)
 
+    @TEST_TAG("ray")
+    def test_deduplication_in_batches(self):
+        # duplicates are spread over and within batches, whose hash values
+        # are sent to different dedup sets
+        texts = [f'This is sample {i % 7}.' for i in range(30)]
+        dataset = self.generate_dataset([{'text': text} for text in texts])
+        op = RayDocumentDeduplicator(batch_size=4)
+        tgt_list = [{'text': text} for text in sorted(set(texts))]
+        self._run_doc_dedup(dataset, tgt_list, op)
+
+
+    @TEST_TAG("ray")
+    def test_shuffle_backend(self):
+        texts = [f'This is sample {i % 7}.' for i in range(30)]
+        dataset = self.generate_dataset([{'text': text} for text in texts])
+        op = RayDocumentDeduplicator(backend='ray_shuffle', num_shuffle_partitions=3)
+        tgt_list = [{'text': text} for text in sorted(set(texts))]
+        self._run_doc_dedup(dataset, tgt_list, op)
+
+    @TEST_TAG("ray")
+    def test_shuffle_backend_preserve_order(self):
+        texts = [f'This is sample {i % 7}.' for i in range(30)]
+        dataset = self.generate_dataset([{'text': text, 'id': i} for i, text in enumerate(texts)])
+        op = RayDocumentDeduplicator(backend='ray_shuffle', num_shuffle_partitions=3, preserve_order=True)
+        res_list = self.run_single_op(dataset, op, ['text', 'id'])
+        self.assertEqual([sample['id'] for sample in res_list], list(range(7)))
 
 if __name__ == '__main__':
     unittest.main()
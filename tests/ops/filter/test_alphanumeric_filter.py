@@ -1,6 +1,7 @@
 import unittest
 
 from data_juicer.ops.filter.alphanumeric_filter import AlphanumericFilter
+from data_juicer.utils.constant import Fields
 from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase, TEST_TAG
 
 
@@ -68,6 +69,26 @@ class AlphanumericFilterTest(DataJuicerTestCaseBase):
         result = self.run_single_op(dataset, op, ["text"])
         self.assertDatasetEqual(result, tgt_list)
 
+    def test_arrow_case(self):
+
+        ds_list = [{
+            'text': 'a=1\nb\nc=1+2+3+5\nd=6'
+        }, {
+            'text': '，。、„”“«»１」「《》´∶：？！（）；–—．～’…━〈〉【】％►'
+        }, {
+            'text': 'emoji表情测试下😊，😸31231\n'
+        }, {
+            'text': ''
+        }]
+        dataset = self.generate_dataset(ds_list)
+        op = AlphanumericFilter(min_ratio=0.2, max_ratio=0.9, batch_size=3)
+        self.assertTrue(op.is_arrow_op())
+        # the arrow-native stats are the same as the python ones
+        res = op.run(dataset, reduce=False)
+        op._arrow_op = False
+        tgt = op.run(dataset, reduce=False)
+        self.assertEqual(res[Fields.stats], tgt[Fields.stats])
+
 
 if __name__ == '__main__':
     unittest.main()
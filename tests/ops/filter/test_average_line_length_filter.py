@@ -76,6 +76,26 @@ class AverageLineLengthFilterTest(DataJuicerTestCaseBase):
 
         self.assertEqual(res_list, tgt_context_list)
 
+    def test_arrow_case(self):
+        ds_list = self.ds_list + [{
+            self.text_key: ''
+        }, {
+            self.text_key: '\n\r\n'
+        }, {
+            self.text_key: 'a\r\nb\x0bc\u2028d\n\ne'
+        }]
+        dataset = Dataset.from_list(ds_list)
+        op = AverageLineLengthFilter(min_len=10, max_len=20, batch_size=3)
+        self.assertTrue(op.is_arrow_op())
+        self.assertEqual(
+            op.run(dataset).select_columns([self.text_key]).to_list(),
+            self.tgt_list)
+        # the arrow-native stats are the same as the python ones
+        res = op.run(dataset, reduce=False)
+        op._arrow_op = False
+        tgt = op.run(dataset, reduce=False)
+        self.assertEqual(res[Fields.stats], tgt[Fields.stats])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -47,6 +47,26 @@ class TextLengthFilterTest(DataJuicerTestCaseBase):
         op = TextLengthFilter(min_len=10, max_len=50)
         self._run_text_length_filter(dataset, tgt_list, op)
 
+    def test_arrow_case(self):
+
+        ds_list = [{
+            'text': 'Today is'
+        }, {
+            'text':
+            "Today is Sund Sund Sund Sund Sund Sunda and it's a happy day!"
+        }, {
+            'text': '中文也是一个字算一个长度'
+        }]
+        tgt_list = [{
+            'text': '中文也是一个字算一个长度'
+        }]
+        dataset = Dataset.from_list(ds_list)
+        op = TextLengthFilter(min_len=10, max_len=50, batch_size=2)
+        self.assertTrue(op.is_arrow_op())
+        dataset = op.run(dataset)
+        self.assertEqual(dataset.select_columns(['text']).to_list(), tgt_list)
+        self.assertEqual(dataset[Fields.stats], [{'text_len': 12}])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -72,6 +72,31 @@ class WordsNumFilterTest(DataJuicerTestCaseBase):
                            batch_size=1)
         self._run_words_num_filter(dataset, tgt_list, op)
 
+    def test_arrow_case(self):
+
+        ds_list = [{
+            'text': 'Today is Sun'
+        }, {
+            'text':
+            "Today is Sund Sund Sund Sund Sund Sunda and it's a happy day!"
+        }, {
+            'text': 'a v s e c s f e f g a a a  '
+        }, {
+            'text': '，。、„”“«»１」「《》´∶：？！（）；–—．～’…━〈〉【】％►'
+        }, {
+            'text': 'Today\tis -- Sun !\n'
+        }]
+        dataset = Dataset.from_list(ds_list)
+        op = WordsNumFilter(min_num=5, max_num=15, batch_size=2)
+        self.assertTrue(op.is_arrow_op())
+        # the arrow-native stats are the same as the python ones
+        res = op.run(dataset, reduce=False)
+        op._arrow_op = False
+        tgt = op.run(dataset, reduce=False)
+        self.assertEqual(res[Fields.stats], tgt[Fields.stats])
+        self.assertEqual([stat['num_words'] for stat in res[Fields.stats]],
+                         [3, 13, 13, 1, 3])
+
 
 if __name__ == '__main__':
     unittest.main()
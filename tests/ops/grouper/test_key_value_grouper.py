@@ -2,7 +2,7 @@ import unittest
 
 from data_juicer.core.data import NestedDataset as Dataset
 from data_juicer.ops.grouper.key_value_grouper import KeyValueGrouper
-from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
+from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase, TEST_TAG
 
 
 class KeyValueGrouperTest(DataJuicerTestCaseBase):
@@ -50,5 +50,18 @@ class KeyValueGrouperTest(DataJuicerTestCaseBase):
         op = KeyValueGrouper(['meta.language'])
         self._run_helper(op, source, target)
 
+    @TEST_TAG('ray')
+    def test_ray_key_value_grouper(self):
+        source = [
+            {'text': 'a', 'meta': {'language': 'en'}},
+            {'text': 'b', 'meta': {'language': 'zh'}},
+            {'text': 'c', 'meta': {'language': 'en'}},
+        ]
+        dataset = self.generate_dataset(source)
+        op = KeyValueGrouper(['meta.language'])
+        res_list = self.run_single_op(dataset, op, ['text'])
+        res = sorted(sorted(sample['text']) for sample in res_list)
+        self.assertEqual(res, [['a', 'c'], ['b']])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
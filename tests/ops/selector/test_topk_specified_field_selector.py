@@ -4,7 +4,7 @@ from data_juicer.core.data import NestedDataset as Dataset
 
 from data_juicer.ops.selector.topk_specified_field_selector import \
     TopkSpecifiedFieldSelector
-from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
+from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase, TEST_TAG
 
 
 class TopkSpecifiedFieldSelectorTest(DataJuicerTestCaseBase):
@@ -678,6 +678,20 @@ class TopkSpecifiedFieldSelectorTest(DataJuicerTestCaseBase):
                                         reverse=False)
         self._run_topk_selector(dataset, tgt_list, op)
 
+    @TEST_TAG('ray')
+    def test_ray_topk_select(self):
+        ds_list = [{'text': f'text{i}', 'stats': {'score': score}}
+                   for i, score in enumerate([3, 9, 1, 7, 5, 8])]
+        dataset = self.generate_dataset(ds_list)
+        op = TopkSpecifiedFieldSelector(field_key='stats.score', topk=3, reverse=True)
+        res_list = self.run_single_op(dataset, op, ['text'])
+        self.assertEqual(res_list, [{'text': 'text1'}, {'text': 'text5'}, {'text': 'text3'}])
+
+        dataset = self.generate_dataset(ds_list)
+        op = TopkSpecifiedFieldSelector(field_key='stats.score', top_ratio=0.5, reverse=False)
+        res_list = self.run_single_op(dataset, op, ['text'])
+        self.assertEqual(res_list, [{'text': 'text2'}, {'text': 'text0'}, {'text': 'text4'}])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from data_juicer.core.data import NestedDataset as Dataset
+from data_juicer.core.exporter import Exporter
+from data_juicer.ops.base_op import TAGGING_OPS, Filter, Mapper
+from data_juicer.utils.constant import Fields
+from data_juicer.utils.model_utils import prepare_model
+from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
+
+
+class DummyLengthFilter(Filter):
+
+    _name = 'dummy_length_filter'
+
+    def compute_stats_single(self, sample, context=False):
+        sample[Fields.stats]['len'] = len(sample[self.text_key])
+        return sample
+
+    def process_single(self, sample):
+        return sample[Fields.stats]['len'] > 1
+
+
+class DummyTaggingMapper(Mapper):
+
+    _name = 'dummy_tagging_mapper'
+
+    def process_single(self, sample):
+        sample[Fields.meta]['upper'] = sample[self.text_key].isupper()
+        return sample
+
+
+class DummyAPIScoreFilter(Filter):
+
+    _name = 'dummy_api_score_filter'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.model_key = prepare_model(model_type='api', model='dummy')
+        self.barrier = threading.Barrier(3, timeout=10)
+
+    def compute_stats_single(self, sample, context=False):
+        # only passes when 3 samples are processed concurrently
+        self.barrier.wait()
+        sample[Fields.stats]['len'] = len(sample[self.text_key])
+        return sample
+
+    def process_single(self, sample):
+        return sample[Fields.stats]['len'] > 1
+
+
+class NewColumnsTest(DataJuicerTestCaseBase):
+
+    def setUp(self):
+        self.dataset = Dataset.from_list([{'text': 'a'}, {'text': 'BB'},
+                                          {'text': 'ccc'}])
+
+    def test_filter(self):
+        op = DummyLengthFilter(index_key='idx')
+        with patch.object(Dataset, 'map', autospec=True,
+                          side_effect=Dataset.map) as mock_map:
+            res = op.run(self.dataset)
+        # the stats and index columns are added in the same map that
+        # computes stats and filters samples
+        descs = [call.kwargs.get('desc') for call in mock_map.call_args_list]
+        self.assertEqual(descs,
+                         ['dummy_length_filter_compute_stats_and_process'])
+        self.assertEqual(res.to_list(), [
+            {'text': 'BB', 'idx': 1, Fields.stats: {'len': 2}},
+            {'text': 'ccc', 'idx': 2, Fields.stats: {'len': 3}},
+        ])
+
+    def test_filter_with_stats_export(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        stats_path = os.path.join(tmp_dir, 'stats.jsonl')
+        op = DummyLengthFilter(stats_export_path=stats_path, batch_size=2)
+        exporter = Exporter(os.path.join(tmp_dir, 'res.jsonl'))
+        res = op.run(self.dataset, exporter=exporter)
+        self.assertEqual(res['text'], ['BB', 'ccc'])
+        # stats of all samples are exported, including the rejected ones
+        with open(stats_path) as fin:
+            stats = [json.loads(line) for line in fin]
+        self.assertEqual(stats, [
+            {'text': 'a', Fields.stats: {'len': 1}},
+            {'text': 'BB', Fields.stats: {'len': 2}},
+            {'text': 'ccc', Fields.stats: {'len': 3}},
+        ])
+        # the side stream is cleaned up
+        self.assertEqual(os.listdir(tmp_dir), ['stats.jsonl'])
+
+    def test_filter_with_stats_export_failed(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        stats_path = os.path.join(tmp_dir, 'stats.jsonl')
+        exporter = Exporter(os.path.join(tmp_dir, 'res.jsonl'))
+        with patch.object(DummyLengthFilter, 'process_single',
+                          side_effect=RuntimeError('failed')):
+            op = DummyLengthFilter(stats_export_path=stats_path,
+                                   batch_size=2, skip_op_error=False)
+            with self.assertRaises(Exception):
+                op.run(self.dataset, exporter=exporter)
+        # the side stream is cleaned up even if the OP fails
+        self.assertEqual(os.listdir(tmp_dir), [])
+
+    def test_tagging_mapper(self):
+        op = DummyTaggingMapper()
+        with patch.dict(TAGGING_OPS.modules, {op._name: DummyTaggingMapper}):
+            res = op.run(self.dataset)
+            self.assertEqual(op.required_columns(), {Fields.meta: {}})
+        self.assertEqual(res[Fields.meta], [{'upper': False}, {'upper': True},
+                                            {'upper': False}])
+
+    def test_turbo(self):
+        op = DummyTaggingMapper(turbo=True, index_key='idx')
+        with patch.dict(TAGGING_OPS.modules, {op._name: DummyTaggingMapper}):
+            res = op.run(self.dataset)
+        self.assertEqual(res['idx'], [0, 1, 2])
+        self.assertEqual(res[Fields.meta][1], {'upper': True})
+
+
+class APIConcurrencyTest(DataJuicerTestCaseBase):
+
+    def test_api_concurrency(self):
+        dataset = Dataset.from_list([{'text': 'a'}, {'text': 'BB'},
+                                     {'text': 'ccc'}])
+        op = DummyAPIScoreFilter(api_concurrency=3)
+        self.assertTrue(op.is_batched_op())
+        res = op.run(dataset)
+        self.assertEqual(res['text'], ['BB', 'ccc'])
+
+    def test_api_concurrency_without_api_model(self):
+        # OPs without API models are not switched to the batched mode
+        op = DummyLengthFilter(api_concurrency=3)
+        self.assertFalse(op.is_batched_op())
+        dataset = Dataset.from_list([{'text': 'a'}, {'text': 'BB'}])
+        self.assertEqual(op.run(dataset)['text'], ['BB'])
+
+
+if __name__ == '__main__':
+    unittest.main()
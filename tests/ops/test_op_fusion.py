@@ -1,9 +1,12 @@
+import shutil
+import tempfile
 import unittest
 
 from data_juicer.core import NestedDataset
-from data_juicer.ops.base_op import OP
+from data_juicer.ops.base_op import OP, Filter
 from data_juicer.ops.load import load_ops
-from data_juicer.ops.op_fusion import fuse_operators, GeneralFusedOP
+from data_juicer.ops.op_fusion import fuse_operators, fuse_stages, FusedStage, GeneralFusedOP, run_ops_on_batch
+from data_juicer.utils.constant import Fields
 from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
 
 
@@ -2097,5 +2100,121 @@ class GeneralFusedOPTest(DataJuicerTestCaseBase):
             fused_op.process_batched(self.dataset.to_dict())
 
 
+class FuseStagesTest(DataJuicerTestCaseBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.dataset = NestedDataset.from_list([
+            {'text': 'This is a test.'},
+            {'text': 'Contact me at someone@example.com, this is a test.'},
+            {'text': 'This is a test. This is a test. This is a test.'},
+            {'text': 'a b'},
+            {'text': 'This is a test.'},
+            {'text': 'punc test。'},
+        ])
+        self.process_list = [{
+            'clean_email_mapper': {}
+        }, {
+            'text_length_filter': {
+                'min_len': 5
+            }
+        }, {
+            'whitespace_normalization_mapper': {}
+        }, {
+            'words_num_filter': {
+                'min_num': 2
+            }
+        }, {
+            'document_deduplicator': {}
+        }, {
+            'text_length_filter': {
+                'max_len': 40
+            }
+        }]
+
+    def test_fuse_stages(self):
+        ops = fuse_stages(load_ops(self.process_list))
+        self.assertEqual(len(ops), 3)
+        self.assertIsInstance(ops[0], FusedStage)
+        self.assertEqual([op._name for op in ops[0].fused_ops], [
+            'clean_email_mapper', 'text_length_filter',
+            'whitespace_normalization_mapper', 'words_num_filter'
+        ])
+        self.assertEqual(ops[0]._op_cfg[ops[0]._name], self.process_list[:4])
+        # single OP runs are kept as they are
+        self.assertEqual(ops[1]._name, 'document_deduplicator')
+        self.assertEqual(ops[2]._name, 'text_length_filter')
+
+    def test_non_fusible_ops(self):
+        process_list = [{
+            'clean_email_mapper': {}
+        }, {
+            'text_length_filter': {
+                'min_len': 5,
+                'stats_export_path': 'stats.jsonl'
+            }
+        }, {
+            'whitespace_normalization_mapper': {}
+        }]
+        ops = fuse_stages(load_ops(process_list))
+        self.assertEqual([op._name for op in ops],
+                         [list(op.keys())[0] for op in process_list])
+
+    def test_same_results(self):
+        fused_ops = fuse_stages(load_ops(self.process_list))
+        res1 = self.dataset.process(fused_ops, open_monitor=False)
+        res2 = self.dataset.process(load_ops(self.process_list), open_monitor=False)
+        self.assertEqual(res1.to_list(), res2.to_list())
+
+
+class DummyModelLengthFilter(Filter):
+
+    _name = 'dummy_model_length_filter'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.model_key = 'dummy_model'
+        self.num_computed = 0
+
+    def compute_stats_single(self, sample, context=False):
+        self.num_computed += 1
+        sample[Fields.stats]['len'] = len(sample[self.text_key])
+        return sample
+
+    def process_single(self, sample):
+        if sample[Fields.stats]['len'] == 0:
+            raise ValueError('empty text')
+        return sample[Fields.stats]['len'] > 1
+
+
+class RunOpsOnBatchTest(DataJuicerTestCaseBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+        super().tearDown()
+
+    def test_op_result_cache(self):
+        op = DummyModelLengthFilter(op_result_cache_dir=self.tmp_dir)
+        samples = {'text': ['a', 'BB', 'ccc']}
+        res = run_ops_on_batch([op], dict(samples))
+        self.assertEqual(res['text'], ['BB', 'ccc'])
+        self.assertEqual(op.num_computed, 3)
+        # the stats are read from the cache of the runtime wrappers
+        res = run_ops_on_batch([op], dict(samples))
+        self.assertEqual(res['text'], ['BB', 'ccc'])
+        self.assertEqual(op.num_computed, 3)
+
+    def test_skip_op_error(self):
+        samples = {'text': ['', 'BB']}
+        with self.assertRaises(ValueError):
+            run_ops_on_batch([DummyModelLengthFilter()], dict(samples))
+        res = run_ops_on_batch([DummyModelLengthFilter(skip_op_error=True)], dict(samples))
+        self.assertEqual(res['text'], [])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -3,9 +3,30 @@ import unittest
 import json
 
 from data_juicer.core.data import NestedDataset
+from data_juicer.ops.base_op import Mapper
 from data_juicer.utils.ckpt_utils import CheckpointManager
 from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
 
+
+class FailingUpperMapper(Mapper):
+    """Upper the texts, and fail on the text `fail_on` to simulate a crash."""
+
+    _name = 'failing_upper_mapper'
+    processed = []
+    fail_on = None
+
+    def __init__(self, suffix='', **kwargs):
+        super().__init__(**kwargs)
+        self.suffix = suffix
+
+    def process_single(self, sample):
+        if sample[self.text_key] == FailingUpperMapper.fail_on:
+            raise RuntimeError('failed')
+        FailingUpperMapper.processed.append(sample[self.text_key])
+        sample[self.text_key] = sample[self.text_key].upper() + self.suffix
+        return sample
+
+
 class CkptUtilsTest(DataJuicerTestCaseBase):
 
     def setUp(self) -> None:
@@ -76,6 +97,58 @@ class CkptUtilsTest(DataJuicerTestCaseBase):
         loaded_ckpt = manager.load_ckpt()
         self.assertDatasetEqual(dataset, loaded_ckpt)
 
+    def test_run_op_in_shards(self):
+        ckpt_path = os.path.join(self.temp_output_path, 'ckpt_4')
+        dataset = NestedDataset.from_dict({'text': [f'text{i}' for i in range(5)]})
+        FailingUpperMapper.processed = []
+
+        # interrupted at the third shard
+        FailingUpperMapper.fail_on = 'text4'
+        manager = CheckpointManager(ckpt_path, original_process_list=[], shard_size=2)
+        op = FailingUpperMapper(skip_op_error=False)
+        with self.assertRaises(Exception):
+            manager.run_op(op, op.run, dataset=dataset)
+        FailingUpperMapper.fail_on = None
+        self.assertEqual(FailingUpperMapper.processed, ['text0', 'text1', 'text2', 'text3'])
+
+        # resume from the committed shards
+        FailingUpperMapper.processed = []
+        manager = CheckpointManager(ckpt_path, original_process_list=[], shard_size=2)
+        op = FailingUpperMapper(skip_op_error=False)
+        res = manager.run_op(op, op.run, dataset=dataset)
+        self.assertEqual(FailingUpperMapper.processed, ['text4'])
+        self.assertEqual(res['text'], [f'TEXT{i}' for i in range(5)])
+
+        # the checkpoint references the committed shards
+        manager.record(op._op_cfg)
+        manager.save_ckpt(res)
+        self.assertTrue(os.path.exists(manager.ckpt_shards_record))
+        self.assertFalse(os.path.exists(manager.ckpt_ds_dir))
+        self.assertTrue(manager.check_ckpt())
+        self.assertDatasetEqual(res, manager.load_ckpt())
+
+    def test_run_op_changed_args(self):
+        ckpt_path = os.path.join(self.temp_output_path, 'ckpt_5')
+        dataset = NestedDataset.from_dict({'text': ['a', 'b', 'c']})
+        manager = CheckpointManager(ckpt_path, original_process_list=[], shard_size=2)
+        op = FailingUpperMapper(skip_op_error=False)
+        manager.run_op(op, op.run, dataset=dataset)
+
+        FailingUpperMapper.processed = []
+        op = FailingUpperMapper(suffix='!', skip_op_error=False)
+        res = manager.run_op(op, op.run, dataset=dataset)
+        self.assertEqual(FailingUpperMapper.processed, ['a', 'b', 'c'])
+        self.assertEqual(res['text'], ['A!', 'B!', 'C!'])
+
+    def test_run_op_with_index_key(self):
+        ckpt_path = os.path.join(self.temp_output_path, 'ckpt_6')
+        dataset = NestedDataset.from_dict({'text': [f'text{i}' for i in range(5)]})
+        manager = CheckpointManager(ckpt_path, original_process_list=[], shard_size=2)
+        op = FailingUpperMapper(index_key='idx', skip_op_error=False)
+        res = manager.run_op(op, op.run, dataset=dataset)
+        # indices are numbered in the whole dataset rather than per shard
+        self.assertEqual(res['idx'], list(range(5)))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from data_juicer.utils import dedup_index
+from data_juicer.utils.dedup_index import (DedupIndex, digest_keys,
+                                           keys_to_uint64, uint64_to_keys)
+from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
+
+
+class DedupIndexTest(DataJuicerTestCaseBase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        super().tearDown()
+
+    def test_keys(self):
+        values = np.array([3, 1, 2**63 + 5], dtype=np.uint64)
+        keys = uint64_to_keys(values)
+        self.assertEqual(keys.dtype, np.dtype('V8'))
+        self.assertEqual(keys_to_uint64(keys).tolist(), values.tolist())
+        # byte order of keys is the same as the numeric order
+        self.assertEqual(np.argsort(keys).tolist(), [1, 0, 2])
+        self.assertEqual(uint64_to_keys(np.ones((2, 3))).dtype,
+                         np.dtype('V24'))
+
+        digests = digest_keys(['a', 'b', 'a', ('a', 'b')])
+        self.assertEqual(digests.dtype, np.dtype('V16'))
+        self.assertEqual(digests[0], digests[2])
+        self.assertEqual(len(np.unique(digests)), 3)
+
+    def test_save_and_load(self):
+        index = DedupIndex(self.tmp_dir, 'test_op', {'lowercase': True})
+        self.assertEqual(len(index), 0)
+        index.add(uint64_to_keys([5, 3, 5]))
+        index.save()
+        self.assertEqual(len(index), 2)
+
+        index = DedupIndex(self.tmp_dir, 'test_op', {'lowercase': True})
+        self.assertEqual(index.contains(uint64_to_keys([1, 3, 5])).tolist(),
+                         [False, True, True])
+        index.add(uint64_to_keys([1, 3]))
+        index.save()
+        self.assertEqual(len(index), 3)
+        self.assertEqual(len(index.segments), 2)
+
+        # another config starts a new index
+        other = DedupIndex(self.tmp_dir, 'test_op', {'lowercase': False})
+        self.assertNotEqual(other.path, index.path)
+        self.assertEqual(len(other), 0)
+
+        with self.assertRaises(ValueError):
+            index.contains(digest_keys(['a']))
+
+    def test_compaction(self):
+        with patch.object(dedup_index, 'MAX_SEGMENTS', 3):
+            index = DedupIndex(self.tmp_dir, 'test_op', {})
+            for i in range(5):
+                index.add(uint64_to_keys([i, i + 10]))
+                index.save()
+            self.assertLessEqual(len(index.segments), 3)
+            self.assertEqual(
+                len([f for f in os.listdir(index.path)
+                     if f.endswith('.npy')]), len(index.segments))
+            self.assertEqual(
+                sorted(keys_to_uint64(index.all_keys()).tolist()),
+                list(range(5)) + list(range(10, 15)))
+
+    def test_views(self):
+        with patch.object(dedup_index, 'MAX_SEGMENTS', 2):
+            index = DedupIndex(self.tmp_dir, 'test_op', {})
+            index.add(uint64_to_keys([3, 1]))
+            index.save()
+            build = MagicMock(
+                side_effect=lambda seg: keys_to_uint64(seg)[::-1])
+            views = index.load_views('desc', build)
+            self.assertEqual([view.tolist() for view in views], [[3, 1]])
+            # the views are persisted and built only once
+            index.load_views('desc', build)
+            self.assertEqual(build.call_count, 1)
+
+            # the views of merged segments are removed
+            index.add(uint64_to_keys([2]))
+            index.save()
+            index.add(uint64_to_keys([4]))
+            index.save()
+            self.assertEqual(len(index.segments), 1)
+            self.assertEqual(
+                len([f for f in os.listdir(index.path) if 'desc' in f]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
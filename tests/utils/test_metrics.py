@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import urllib.request
+
+from data_juicer.core.data import NestedDataset as Dataset
+from data_juicer.ops.filter import TextLengthFilter
+from data_juicer.utils import metrics
+from data_juicer.utils.metrics import MetricsExporter
+from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
+
+
+class MetricsTest(DataJuicerTestCaseBase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        metrics._VALUES.clear()
+
+    def tearDown(self):
+        metrics._VALUES.clear()
+        shutil.rmtree(self.work_dir)
+        super().tearDown()
+
+    def test_disabled(self):
+        metrics.inc_metric('api_requests_total')
+        metrics.set_metric('ops', 3)
+        self.assertEqual(metrics._VALUES, {})
+
+    def test_render(self):
+        with MetricsExporter(self.work_dir) as exporter:
+            metrics.set_metric('ops', 3)
+            metrics.inc_metric('model_loads_total', model='a')
+            metrics.inc_metric('model_loads_total', 2, model='a')
+            text = exporter.render()
+        self.assertIn('# TYPE data_juicer_ops gauge\ndata_juicer_ops 3\n', text)
+        self.assertIn('data_juicer_model_loads_total{model="a"} 3\n', text)
+        self.assertIn('data_juicer_uptime_seconds', text)
+
+    def test_collect_workers(self):
+        with MetricsExporter(self.work_dir) as exporter:
+            metrics.inc_metric('op_samples_processed_total', 5, op='x')
+            # the report of a worker process
+            with open(os.path.join(exporter.metrics_dir, 'worker-1.json'), 'w') as fout:
+                json.dump([['op_samples_processed_total', [['op', 'x']], 7]], fout)
+            values = exporter.collect()
+        self.assertEqual(values[('op_samples_processed_total', (('op', 'x'),))], 12)
+
+    def test_collect_exited_workers(self):
+        worker = subprocess.Popen([sys.executable, '-c', 'pass'])
+        worker.wait()
+        with MetricsExporter(self.work_dir) as exporter:
+            path = os.path.join(exporter.metrics_dir, f'worker-{worker.pid}.json')
+            with open(path, 'w') as fout:
+                json.dump([['op_samples_processed_total', [['op', 'x']], 7],
+                           ['api_requests_in_flight', [], 2]], fout)
+            exporter.collect()
+            # the file is removed, and the counters are kept
+            self.assertFalse(os.path.exists(path))
+            values = exporter.collect()
+        self.assertEqual(values[('op_samples_processed_total', (('op', 'x'),))], 7)
+        self.assertNotIn(('api_requests_in_flight', ()), values)
+
+    def test_shared_writer_hooks(self):
+        from datasets.arrow_writer import ArrowWriter
+
+        from data_juicer.utils import profiler
+        profiler._install_hooks()
+        finalize = ArrowWriter.finalize
+        metrics._install_hooks()
+        # the writer is patched once for both the profiler and the metrics
+        self.assertIs(ArrowWriter.finalize, finalize)
+        self.assertFalse(hasattr(finalize.__wrapped__, '__wrapped__'))
+
+    def test_file_and_http(self):
+        metrics_path = os.path.join(self.work_dir, 'metrics.prom')
+        exporter = MetricsExporter(self.work_dir, port=0, path=metrics_path, interval=1)
+        with exporter:
+            metrics.set_metric('ops', 2)
+            port = exporter._server.server_port
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+                text = response.read().decode('utf-8')
+            self.assertIn('data_juicer_ops 2', text)
+        with open(metrics_path) as fin:
+            self.assertIn('data_juicer_ops 2', fin.read())
+
+    def test_process_metrics(self):
+        ds = Dataset.from_list([{'text': 'hello world'}, {'text': 'a'}])
+        with MetricsExporter(self.work_dir) as exporter:
+            ds.process([TextLengthFilter(min_len=5)], open_monitor=False)
+            values = exporter.collect()
+        op = (('op', 'text_length_filter'),)
+        self.assertEqual(values[('ops_done', ())], 1)
+        self.assertEqual(values[('op_samples_in', op)], 2)
+        self.assertEqual(values[('op_samples_out', op)], 1)
+        self.assertEqual(values[('op_samples_processed_total', op)], 2)
+        self.assertNotIn('current_op', [name for name, _ in values])
+
+
+if __name__ == '__main__':
+    unittest.main()
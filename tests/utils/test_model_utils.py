@@ -1,6 +1,9 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import os
+import shutil
+import tempfile
+import time
 import numpy as np
 
 from data_juicer.utils.model_utils import (
@@ -22,7 +25,17 @@ from data_juicer.utils.model_utils import (
     get_model,
     free_models,
     prepare_recognizeAnything_model,
+    plan_models,
+    preload_models,
+    release_models,
+    wait_preloaded_models,
+    TokenBucket,
 )
+from data_juicer.utils.op_result_cache import (
+    enable_api_response_cache,
+    get_api_response_cache,
+)
+from data_juicer.utils import model_utils
 from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
 
 # other funcs are called by ops already
@@ -124,6 +137,59 @@ class ModelUtilsTest(DataJuicerTestCaseBase):
             prepare_api_model('test_model', endpoint='/unsupported/endpoint')
         self.assertIn('Unsupported endpoint', str(context.exception))
         
+    @patch('data_juicer.utils.model_utils.openai')
+    def test_api_response_cache(self, mock_openai):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        mock_client = MagicMock()
+        mock_client.base_url = 'http://localhost/v1'
+        mock_openai.OpenAI.return_value = mock_client
+
+        def post(endpoint, body, **kwargs):
+            response = MagicMock()
+            if 'messages' in body:
+                content = body['messages'][0]['content'].upper()
+                response.json.return_value = {
+                    'choices': [{'message': {'content': content}}]}
+            else:
+                response.json.return_value = {'data': [
+                    {'index': i, 'embedding': [len(text)]}
+                    for i, text in enumerate(body['input'])]}
+            return response
+
+        mock_client.post.side_effect = post
+        with patch.dict(os.environ):
+            enable_api_response_cache(cache_dir)
+            model = prepare_api_model('test_model')
+            messages = [{'role': 'user', 'content': 'hi'}]
+            self.assertEqual(model(messages), 'HI')
+            self.assertEqual(model(messages), 'HI')
+            # different sampling params are different requests
+            self.assertEqual(model(messages, temperature=0.5), 'HI')
+            self.assertEqual(mock_client.post.call_count, 2)
+
+            embed_model = prepare_api_model('test_model',
+                                            endpoint='/embeddings')
+            self.assertEqual(embed_model('a'), [1])
+            # only the missed inputs are requested
+            self.assertEqual(embed_model.batch_call(['a', 'bb']), [[1], [2]])
+            self.assertEqual(mock_client.post.call_args.kwargs['body']['input'],
+                             ['bb'])
+            self.assertEqual(embed_model.batch_call(['bb', 'a']), [[2], [1]])
+            self.assertEqual(mock_client.post.call_count, 4)
+
+            self.assertEqual(get_api_response_cache().counters(),
+                             {'hits': 4, 'misses': 4})
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        # the first token is available at once, and the others are refilled
+        # at 20 per second
+        self.assertGreaterEqual(time.monotonic() - start, 0.14)
+
     @patch('data_juicer.utils.model_utils.transformers')
     def test_prepare_huggingface_model(self, mock_transformers):
         # Test model with processor
@@ -382,6 +448,58 @@ class ModelUtilsTest(DataJuicerTestCaseBase):
         free_models()
         # No assertion needed, just checking it doesn't raise an exception
 
+    @patch('data_juicer.utils.model_utils.transformers')
+    def test_model_residency(self, mock_transformers):
+        mock_transformers.AutoModel.from_pretrained.side_effect = \
+            lambda *args, **kwargs: MagicMock()
+
+        class DummyOP:
+            _name = 'dummy'
+
+            def __init__(self, model_name):
+                self.model_key = prepare_model(
+                    'huggingface', pretrained_model_name_or_path=model_name)
+
+            def run(self, dataset):
+                return dataset
+
+        op1, op2, op3 = DummyOP('a'), DummyOP('a'), DummyOP('b')
+        plan_models([op1, op2, op3])
+        # OPs preparing the same model share one instance
+        model = get_model(op1.model_key)
+        release_models(op1)
+        self.assertIs(get_model(op2.model_key), model)
+        self.assertEqual(
+            mock_transformers.AutoModel.from_pretrained.call_count, 1)
+        # models not used by upcoming OPs are freed
+        preload_models(op3, background=True)
+        wait_preloaded_models()
+        release_models(op2)
+        self.assertEqual(len(model_utils.MODEL_ZOO), 1)
+        self.assertEqual(
+            mock_transformers.AutoModel.from_pretrained.call_count, 2)
+        free_models()
+        self.assertIsNone(model_utils.MODEL_REFS)
+
+    @patch('data_juicer.utils.model_utils.estimate_model_size',
+           return_value=10)
+    @patch('data_juicer.utils.model_utils.transformers')
+    def test_model_mem_budget(self, mock_transformers, mock_size):
+        keys = [
+            prepare_model('huggingface', pretrained_model_name_or_path=name)
+            for name in ['a', 'b', 'c']
+        ]
+        plan_models([], mem_budget=25)
+        get_model(keys[0])
+        get_model(keys[1])
+        get_model(keys[0])
+        get_model(keys[2])
+        # the least recently used model is evicted
+        self.assertEqual(
+            [key[1:3] for key in model_utils.MODEL_ZOO],
+            [('()', "[('pretrained_model_name_or_path', 'a')]"),
+             ('()', "[('pretrained_model_name_or_path', 'c')]")])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,164 @@
+import shutil
+import tempfile
+import unittest
+from functools import partial
+from unittest.mock import patch
+
+from data_juicer.core.data import NestedDataset as Dataset
+from data_juicer.ops.base_op import (Filter, Mapper, _apply_result_changes,
+                                     _result_changes)
+from data_juicer.utils import op_result_cache
+from data_juicer.utils.constant import Fields
+from data_juicer.utils.op_result_cache import OpResultCache, normalize_op_args
+from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
+
+
+class DummyScoreFilter(Filter):
+    """A model-based Filter that records the texts it scores."""
+
+    _name = 'dummy_score_filter'
+    scored = []
+
+    def __init__(self, model='dummy', min_score=0, max_score=100, **kwargs):
+        super().__init__(**kwargs)
+        self.min_score = min_score
+        self.max_score = max_score
+        self.model_key = partial(str, model)
+
+    def compute_stats_single(self, sample, context=False):
+        DummyScoreFilter.scored.append(sample[self.text_key])
+        sample[Fields.stats]['score'] = len(sample[self.text_key])
+        return sample
+
+    def process_single(self, sample):
+        return self.min_score <= sample[Fields.stats]['score'] <= self.max_score
+
+
+class DummyCaptionMapper(Mapper):
+    """A batched model-based Mapper that records the texts it captions."""
+
+    _name = 'dummy_caption_mapper'
+    _batched_op = True
+    captioned = []
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.model_key = partial(str, 'dummy')
+
+    def process_batched(self, samples):
+        DummyCaptionMapper.captioned.extend(samples[self.text_key])
+        samples['caption'] = [text.upper() for text in samples[self.text_key]]
+        return samples
+
+
+class OpResultCacheTest(DataJuicerTestCaseBase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        DummyScoreFilter.scored = []
+        DummyCaptionMapper.captioned = []
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        super().tearDown()
+
+    def test_get_and_put(self):
+        cache = OpResultCache(self.cache_dir)
+        self.assertEqual(cache.get_many([b'a', b'b']), [None, None])
+        cache.put_many([(b'a', {'score': 1}), (b'b', {'score': 2})])
+        self.assertEqual(cache.get_many([b'b', b'c', b'a']),
+                         [{'score': 2}, None, {'score': 1}])
+        self.assertEqual(cache.counters(), {'hits': 2, 'misses': 3})
+        # the cache is persistent
+        self.assertEqual(len(OpResultCache(self.cache_dir)), 2)
+
+    def test_evict(self):
+        cache = OpResultCache(self.cache_dir, max_size=64 << 10)
+        with patch.object(op_result_cache, 'EVICT_RATIO', 0.5):
+            for i in range(20):
+                cache.put_many([(f'{i}-{j}'.encode(), 'x' * 1000)
+                                for j in range(10)])
+                cache.get_many([b'0-0'])
+        self.assertLessEqual(cache.size(), 64 << 10)
+        self.assertLess(len(cache), 200)
+        # the recently used results are kept
+        self.assertIsNotNone(cache.get_many([b'0-0'])[0])
+        self.assertIsNotNone(cache.get_many([b'19-9'])[0])
+        self.assertIsNone(cache.get_many([b'1-0'])[0])
+
+    def test_normalize_op_args(self):
+        op = DummyScoreFilter(min_score=3, batch_size=10)
+        args = normalize_op_args(op, op._result_cache_ignored_attrs)
+        self.assertNotIn('min_score', args)
+        self.assertNotIn('batch_size', args)
+        self.assertEqual(args['model_key']['keywords'], {})
+        self.assertEqual(args['model_key']['args'], ['dummy'])
+        self.assertNotEqual(
+            args,
+            normalize_op_args(DummyScoreFilter(model='other'),
+                              op._result_cache_ignored_attrs))
+
+    def test_filter_stats_cache(self):
+        ds_list = [{'text': 'a'}, {'text': 'bbb'}, {'text': 'cc'}]
+        op = DummyScoreFilter(min_score=2, op_result_cache_dir=self.cache_dir)
+        res = op.run(Dataset.from_list(ds_list))
+        self.assertEqual(res['text'], ['bbb', 'cc'])
+        self.assertEqual(DummyScoreFilter.scored, ['a', 'bbb', 'cc'])
+
+        # tweaking the threshold and adding new data only scores new samples
+        DummyScoreFilter.scored = []
+        op = DummyScoreFilter(min_score=3, op_result_cache_dir=self.cache_dir)
+        res = op.run(Dataset.from_list(ds_list + [{'text': 'dddd'}]))
+        self.assertEqual(res['text'], ['bbb', 'dddd'])
+        self.assertEqual(res[Fields.stats], [{'score': 3}, {'score': 4}])
+        self.assertEqual(DummyScoreFilter.scored, ['dddd'])
+
+        # a different model recomputes all
+        DummyScoreFilter.scored = []
+        op = DummyScoreFilter(model='other',
+                              op_result_cache_dir=self.cache_dir)
+        op.run(Dataset.from_list(ds_list))
+        self.assertEqual(DummyScoreFilter.scored, ['a', 'bbb', 'cc'])
+
+    def test_mapper_output_cache(self):
+        ds_list = [{'text': 'a'}, {'text': 'b'}]
+        op = DummyCaptionMapper(op_result_cache_dir=self.cache_dir)
+        res = op.run(Dataset.from_list(ds_list))
+        self.assertEqual(res['caption'], ['A', 'B'])
+
+        DummyCaptionMapper.captioned = []
+        op = DummyCaptionMapper(op_result_cache_dir=self.cache_dir)
+        res = op.run(Dataset.from_list([{'text': 'c'}] + ds_list))
+        self.assertEqual(res.to_list(), [
+            {'text': 'c', 'caption': 'C'},
+            {'text': 'a', 'caption': 'A'},
+            {'text': 'b', 'caption': 'B'},
+        ])
+        self.assertEqual(DummyCaptionMapper.captioned, ['c'])
+
+    def test_cache_key_reads_all_fields(self):
+        ds_list = [{'text': 'a', Fields.meta: {'lang': 'en'}}]
+        op = DummyScoreFilter(op_result_cache_dir=self.cache_dir)
+        op.run(Dataset.from_list(ds_list))
+        # the results are recomputed if the meta is changed
+        op = DummyScoreFilter(op_result_cache_dir=self.cache_dir)
+        op.run(Dataset.from_list([{'text': 'a', Fields.meta: {'lang': 'zh'}}]))
+        self.assertEqual(DummyScoreFilter.scored, ['a', 'a'])
+
+    def test_deleted_fields(self):
+        old = {'text': ' a ', 'raw': ' a '}
+        new = {'text': 'a'}
+        changes = _result_changes(old, new)
+        # the fields deleted by the OP are removed when the changes are
+        # applied to the inputs
+        self.assertEqual(_apply_result_changes(dict(old), changes), new)
+        changes = _result_changes({Fields.stats: {'a': 1, 'b': 2}},
+                                  {Fields.stats: {'b': 3}}, Fields.stats)
+        self.assertEqual(
+            _apply_result_changes({Fields.stats: {'a': 1, 'b': 2}}, changes,
+                                  Fields.stats),
+            {Fields.stats: {'b': 3}})
+
+
+if __name__ == '__main__':
+    unittest.main()
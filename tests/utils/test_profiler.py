@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from functools import partial
+
+from data_juicer.core.data import NestedDataset as Dataset
+from data_juicer.ops.filter import TextLengthFilter
+from data_juicer.ops.mapper import WhitespaceNormalizationMapper
+from data_juicer.utils import profiler
+from data_juicer.utils.unittest_utils import DataJuicerTestCaseBase
+
+
+class ProfilerTest(DataJuicerTestCaseBase):
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        profiler.enable_profiling(self.profile_dir)
+
+    def tearDown(self):
+        profiler.disable_profiling()
+        shutil.rmtree(self.profile_dir)
+        super().tearDown()
+
+    def test_profile_function(self):
+        function = profiler.profile_function(lambda batch: batch, 'dummy_op')
+        self.assertEqual(function.profiled_op, 'dummy_op')
+        function({'text': ['a', 'b', 'c']})
+        function({'text': ['d']})
+        profiler.flush_events()
+        events = profiler.load_events(self.profile_dir)
+        phases = [event[1] for event in events]
+        self.assertEqual(phases.count(profiler.PHASE_FUNCTION), 2)
+        self.assertLessEqual(phases.count(profiler.PHASE_LOAD), 1)
+        rows = [event[6] for event in events if event[1] == profiler.PHASE_FUNCTION]
+        self.assertEqual(rows, [3, 1])
+
+    def test_get_filter_index_op(self):
+        function = profiler.profile_function(lambda batch: [True], 'dummy_filter')
+
+        def get_indices_from_mask_function(function, *args):
+            return function(*args)
+
+        mask_function = partial(get_indices_from_mask_function, function)
+        self.assertEqual(profiler.get_filter_index_op(mask_function), 'dummy_filter')
+        self.assertIsNone(profiler.get_filter_index_op(function))
+        self.assertIsNone(profiler.get_filter_index_op(partial(get_indices_from_mask_function, len)))
+
+    def test_record_model_load(self):
+        profiler.record_model_load('dummy_model', 0.0, 1.5)
+        profiler.flush_events()
+        events = profiler.load_events(self.profile_dir)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0][1], profiler.PHASE_MODEL_LOAD)
+        self.assertEqual(events[0][3], 1.5)
+        self.assertEqual(events[0][6], 'dummy_model')
+
+    def test_process_and_export(self):
+        ds = Dataset.from_list([{'text': 'a  b'}, {'text': 'hello world'}, {'text': 'c'}])
+        ops = [WhitespaceNormalizationMapper(), TextLengthFilter(min_len=5)]
+        ds = ds.process(ops, open_monitor=False)
+        self.assertEqual(len(ds), 1)
+
+        summary = profiler.export_profile(self.profile_dir)
+        self.assertTrue(os.path.exists(os.path.join(self.profile_dir, 'profile.json')))
+        with open(os.path.join(self.profile_dir, 'trace.json')) as fin:
+            trace = json.load(fin)
+        self.assertGreater(len(trace['traceEvents']), 0)
+
+        mapper = summary['1_whitespace_normalization_mapper']
+        self.assertEqual(mapper['rows_in'], 3)
+        self.assertEqual(mapper['rows_out'], 3)
+        self.assertIn(profiler.PHASE_FUNCTION, mapper['phases'])
+        self.assertIsNotNone(mapper['rows_per_s'])
+        text_filter = summary['2_text_length_filter']
+        self.assertEqual(text_filter['rows_out'], 1)
+        self.assertIn(profiler.PHASE_FUNCTION, text_filter['phases'])
+        self.assertGreater(len(text_filter['workers']), 0)
+
+    def test_same_op_twice(self):
+        ds = Dataset.from_list([{'text': 'a'}, {'text': 'hello world'}, {'text': 'ccc'}])
+        ops = [TextLengthFilter(min_len=2), TextLengthFilter(max_len=5)]
+        ds = ds.process(ops, open_monitor=False)
+        self.assertEqual(ds['text'], ['ccc'])
+
+        summary = profiler.export_profile(self.profile_dir)
+        self.assertEqual(summary['1_text_length_filter']['rows_out'], 2)
+        self.assertEqual(summary['2_text_length_filter']['rows_in'], 2)
+        self.assertEqual(summary['2_text_length_filter']['rows_out'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()